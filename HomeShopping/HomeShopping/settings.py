@@ -52,6 +52,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
 
@@ -144,16 +145,38 @@ REST_FRAMEWORK = {
 MY_BASKET_COOKIE_LIFETIME = 7 * 24 * 60 * 60
 MY_BASKET_COOKIE_SECURE = False
 MY_BASKET_COOKIE_OPEN = 'open_basket'
+# Number of verified basket cookies remembered per process
+MY_BASKET_COOKIE_CACHE_SIZE = 4096
+# How long stock stays reserved for a basket that is not touched anymore
+MY_BASKET_RESERVATION_LIFETIME = 30 * 60
+# 'database' or 'cache': keep a copy of the open baskets in the cache, see basket/storage.py
+MY_BASKET_STORAGE = 'database'
+MY_BASKET_STORAGE_TIMEOUT = 15 * 60
+# How long a changed basket is read from the database before it is stored again
+MY_BASKET_STORAGE_EVICTED_TIMEOUT = 30
+
+# Catalog payloads are evicted by signals on every write, see api/signals.py
+MY_CATALOG_CACHE_TIMEOUT = 24 * 60 * 60
+# Host used by the celery task that pre-renders the catalog pages.
+MY_CATALOG_CACHE_WARM_HOST = 'localhost:8000'
+
+# Per-request metrics, see api/instrumentation.py
+MY_INSTRUMENTATION_SERVER_TIMING = True
+# Share of the requests whose metrics are logged
+MY_INSTRUMENTATION_LOG_SAMPLE_RATE = 0.01
+# Queries slower than this, in seconds, are logged with their view
+MY_INSTRUMENTATION_SLOW_QUERY = 0.1
 
 LOGGING = {
     'version': 1,
+    'disable_existing_loggers': False,
     'handlers': {
         'console': {'class': 'logging.StreamHandler'},
     },
     'loggers': {
-        'django.db.backends': {
+        'api.instrumentation': {
             'handlers': ['console'],
-            'level': 'DEBUG',
+            'level': 'INFO',
         },
     },
 }
@@ -175,3 +198,10 @@ CACHES = {
 CELERY_CACHE_BACKEND = 'default'
 
 CELERY_BEAT_SCHEDULER = "django_celery_beat.schedulers:DatabaseScheduler"
+
+CELERY_BEAT_SCHEDULE = {
+    'release-expired-stock-reservations': {
+        'task': 'api.tasks.release_expired_stock_reservations',
+        'schedule': 60,
+    },
+}
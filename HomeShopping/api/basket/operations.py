@@ -64,9 +64,10 @@ def editable_baskets():
 def request_allows_access_to_basket(request, basket):
     if basket.can_be_edited:
         if request.user.is_authenticated:
-            return request.user == basket.owner
+            return request.user.pk == basket.owner_id
 
-        return request.basket.id == basket.pk
+        # only the id of the request basket is needed, not the basket itself
+        return basket.owner_id is None and request.basket_id == basket.pk
 
     return False
 
@@ -75,11 +76,8 @@ def request_allows_access_to(request, obj):
     if isinstance(obj, Basket):
         return request_allows_access_to_basket(request, obj)
 
-    basket = request.basket
-
     if isinstance(obj, BasketLine):
-        if obj.basket.id == basket.id:
-            return request_allows_access_to_basket(request, basket)
+        return request_allows_access_to_basket(request, obj.basket)
 
     return False
 
@@ -0,0 +1,111 @@
+import hashlib
+import time
+
+from django.core.cache import cache
+from django.utils.http import urlencode
+
+from api.instrumentation import record_cache
+from HomeShopping import settings
+from product.models import Product
+
+
+PRODUCT_LIST = 'product-list'
+PRODUCT_DETAIL = 'product'
+PRODUCT_FACETS = 'product-facets'
+PRODUCT_SEARCH = 'product-search'
+
+
+def _version_key(namespace):
+    return 'catalog:%s:version' % namespace
+
+
+def get_namespace_version(namespace):
+    """
+    Return the current version of a cache namespace.
+    The version is seeded with the current time so a namespace that was
+    evicted from the cache never reuses the keys of an older generation.
+    """
+    key = _version_key(namespace)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, int(time.time()), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_namespace_version(namespace):
+    """
+    Invalidate every key of the namespace at once by moving it to a new version.
+    """
+    key = _version_key(namespace)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.add(key, int(time.time()), None)
+        return cache.get(key)
+
+
+def request_fingerprint(request):
+    """
+    Hash everything that changes the rendered payload: the absolute hyperlinks
+    depend on scheme and host, pages and filters on the query string.
+    """
+    query = urlencode(sorted(request.query_params.lists()), doseq=True)
+    raw = '%s://%s%s?%s' % (request.scheme, request.get_host(), request.path, query)
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def catalog_cache_key(namespace, request):
+    version = get_namespace_version(namespace)
+    return 'catalog:%s:v%s:%s' % (namespace, version, request_fingerprint(request))
+
+
+def product_list_namespace(structure=None):
+    return '%s:%s' % (PRODUCT_LIST, structure or 'all')
+
+
+def product_detail_namespace(pk):
+    return '%s:%s' % (PRODUCT_DETAIL, pk)
+
+
+def invalidate_products(products):
+    """
+    Evict the cached payloads a change of these products shows up in:
+    their own detail pages, the detail page of a parent (it embeds its
+    children) and the list pages of the affected structures.
+    `products` is an iterable of (pk, structure, parent_id) tuples.
+    """
+    namespaces = set()
+    for pk, structure, parent_id in products:
+        namespaces.add(product_detail_namespace(pk))
+        namespaces.add(product_list_namespace(structure))
+        if parent_id is not None:
+            namespaces.add(product_detail_namespace(parent_id))
+            namespaces.add(product_list_namespace('parent'))
+    if namespaces:
+        namespaces.add(product_list_namespace())
+        namespaces.add(PRODUCT_FACETS)
+        namespaces.add(PRODUCT_SEARCH)
+    for namespace in namespaces:
+        bump_namespace_version(namespace)
+
+
+def invalidate_product_lists():
+    """
+    Evict every list, facet and search payload, eg. after products were
+    created with bulk queries. Their own detail pages can't be cached yet.
+    """
+    for structure in [None] + [structure for structure, __ in Product.STRUCTURE_CHOICES]:
+        bump_namespace_version(product_list_namespace(structure))
+    bump_namespace_version(PRODUCT_FACETS)
+    bump_namespace_version(PRODUCT_SEARCH)
+
+
+def get_payload(key):
+    payload = cache.get(key)
+    record_cache(payload is not None)
+    return payload
+
+
+def set_payload(key, payload):
+    cache.set(key, payload, settings.MY_CATALOG_CACHE_TIMEOUT)
@@ -0,0 +1,109 @@
+"""
+Streaming catalog export, in the formats api/importer.py reads back.
+
+Products are read through a server-side cursor a chunk at a time, each
+chunk prefetching its own stockrecords, so memory stays flat whatever the
+size of the catalog. Parents are exported before their children.
+"""
+import csv
+import json
+from itertools import chain
+
+from django.core.exceptions import ObjectDoesNotExist
+from django.db.models import Prefetch
+
+from api.importer import ATTRIBUTE_PREFIX, PRODUCT_FIELDS, STOCKRECORD_FIELDS
+from product.models import Product, ProductAttribute, StockRecord
+
+
+CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+CSV_PRODUCT_COLUMNS = ('article',) + PRODUCT_FIELDS + ('parent', 'product_class', 'category')
+CSV_STOCKRECORD_COLUMNS = ('partner_sku',) + STOCKRECORD_FIELDS
+
+
+def iter_products(chunk_size=500):
+    products = Product.objects.select_related(
+        'product_class', 'category', 'parent', 'attribute_document',
+    ).prefetch_related(
+        Prefetch('stockrecords', queryset=StockRecord.objects.order_by('pk')),
+    ).order_by('pk')
+    return chain(
+        products.exclude(structure=Product.CHILD).iterator(chunk_size=chunk_size),
+        products.filter(structure=Product.CHILD).iterator(chunk_size=chunk_size),
+    )
+
+
+def product_record(product):
+    record = {'article': product.article}
+    for name in PRODUCT_FIELDS:
+        record[name] = getattr(product, name)
+    if product.parent_id:
+        record['parent'] = product.parent.article
+    if product.product_class_id:
+        record['product_class'] = product.product_class.slug
+    if product.category_id:
+        record['category'] = product.category.slug
+    try:
+        attributes = product.attribute_document.attributes
+    except ObjectDoesNotExist:
+        attributes = []
+    record['attributes'] = {attribute['code']: attribute['value'] for attribute in attributes}
+    record['stockrecords'] = [
+        {name: getattr(stockrecord, name) for name in CSV_STOCKRECORD_COLUMNS}
+        for stockrecord in product.stockrecords.all()
+    ]
+    return record
+
+
+def export_ndjson(chunk_size=500):
+    for product in iter_products(chunk_size):
+        yield json.dumps(product_record(product), ensure_ascii=False) + '\n'
+
+
+class Echo:
+    """
+    A file-like object for csv.writer that hands the row back instead of keeping it.
+    """
+
+    def write(self, value):
+        return value
+
+
+def export_csv(chunk_size=500):
+    """
+    A row per stockrecord, the rows after the first one of a product only
+    repeat its article.
+    """
+    codes = ProductAttribute.objects.order_by('code').values_list('code', flat=True).distinct()
+    columns = CSV_PRODUCT_COLUMNS + tuple(ATTRIBUTE_PREFIX + code for code in codes) + CSV_STOCKRECORD_COLUMNS
+    writer = csv.DictWriter(Echo(), fieldnames=columns, restval='', extrasaction='ignore')
+    yield writer.writeheader()
+    for product in iter_products(chunk_size):
+        record = product_record(product)
+        row = {name: record[name] for name in CSV_PRODUCT_COLUMNS if name in record}
+        for code, value in record['attributes'].items():
+            row[ATTRIBUTE_PREFIX + code] = value
+        stockrecords = record['stockrecords'] or [{}]
+        yield writer.writerow(dict(row, **stockrecords[0]))
+        for stockrecord in stockrecords[1:]:
+            yield writer.writerow(dict(stockrecord, article=product.article))
+
+
+EXPORTERS = {
+    'ndjson': export_ndjson,
+    'csv': export_csv,
+}
+
+
+def export_catalog(feed_format, chunk_size=500):
+    """
+    Generate the lines of the whole catalog in the given format.
+    """
+    try:
+        exporter = EXPORTERS[feed_format]
+    except KeyError:
+        raise ValueError("Unsupported format %s, use one of %s" % (feed_format, ", ".join(EXPORTERS)))
+    return exporter(chunk_size)
@@ -0,0 +1,62 @@
+from django.db.models import Count
+
+from product.models import ProductAttributeValue
+
+
+def category_facet(products):
+    counts = products.filter(category__isnull=False).values(
+        'category_id', 'category__title',
+    ).annotate(count=Count('pk')).order_by('category__title')
+    return [
+        {'id': row['category_id'], 'title': row['category__title'], 'count': row['count']}
+        for row in counts
+    ]
+
+
+def product_class_facet(products):
+    counts = products.filter(product_class__isnull=False).values(
+        'product_class__slug', 'product_class__name',
+    ).annotate(count=Count('pk')).order_by('product_class__name')
+    return [
+        {'slug': row['product_class__slug'], 'name': row['product_class__name'], 'count': row['count']}
+        for row in counts
+    ]
+
+
+def attribute_facet(products):
+    """
+    Count the products per value of every attribute, in one grouped query
+    over the values of all attributes.
+    """
+    counts = ProductAttributeValue.objects.filter(
+        product__in=products.values('pk'),
+    ).values(
+        'attribute__code', 'attribute__type', 'value_text', 'value_integer',
+    ).annotate(count=Count('product_id', distinct=True)).order_by()
+
+    facet = {}
+    for row in counts:
+        value = row['value_%s' % row['attribute__type']]
+        values = facet.setdefault(row['attribute__code'], {})
+        # the same code can be an attribute of several product classes
+        values[value] = values.get(value, 0) + row['count']
+    return {
+        code: [
+            {'value': value, 'count': count}
+            for value, count in sorted(values.items(), key=lambda item: (-item[1], str(item[0])))
+        ]
+        for code, values in sorted(facet.items())
+    }
+
+
+def product_facets(products):
+    """
+    The number of products per category, product class and attribute value.
+    `products` is the filtered product list the counts are based on.
+    """
+    products = products.order_by()
+    return {
+        'category': category_facet(products),
+        'product_class': product_class_facet(products),
+        'attributes': attribute_facet(products),
+    }
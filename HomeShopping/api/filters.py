@@ -0,0 +1,118 @@
+from django.db.models import Q
+from rest_framework.exceptions import ParseError
+
+from product.models import Product, ProductAttribute, ProductAttributeValue
+
+
+ATTRIBUTE_PREFIX = 'attr.'
+LOOKUPS = ('exact', 'gt', 'gte', 'lt', 'lte', 'in')
+# comparing text lexically wouldn't mean anything to a client
+TEXT_LOOKUPS = ('exact', 'in')
+# counting the matches of a predicate stops here, it only has to rank them
+SELECTIVITY_LIMIT = 1000
+
+
+def parse_attribute_filters(query_params):
+    """
+    Read the attribute predicates of a request, eg::
+
+        /api/products/?attr.color=red&attr.size__gte=42&attr.size__in=42,43
+
+    Returns a list of (code, lookup, value) tuples.
+    """
+    predicates = []
+    for key, values in query_params.lists():
+        if not key.startswith(ATTRIBUTE_PREFIX):
+            continue
+        code, __, lookup = key[len(ATTRIBUTE_PREFIX):].partition('__')
+        lookup = lookup or 'exact'
+        if not code or lookup not in LOOKUPS:
+            raise ParseError("Unsupported attribute filter %s" % key)
+        for value in values:
+            predicates.append((code, lookup, value))
+    return predicates
+
+
+def _to_python(attribute_type, lookup, value):
+    if attribute_type == ProductAttribute.TEXT and lookup not in TEXT_LOOKUPS:
+        raise ValueError(lookup)
+    if lookup != 'in':
+        return int(value) if attribute_type == ProductAttribute.INTEGER else value
+    values = value.split(',')
+    if attribute_type == ProductAttribute.INTEGER:
+        values = [int(value) for value in values if value.strip().lstrip('-').isdigit()]
+    if not values:
+        raise ValueError(value)
+    return values
+
+
+def predicate_product_ids(attributes, lookup, value):
+    """
+    Ids of the products with a value matching the predicate. Every attribute
+    type compares its own column, over the (attribute, value) indexes.
+    """
+    condition = Q(pk__in=[])
+    for attribute_type in {attribute.type for attribute in attributes}:
+        try:
+            typed_value = _to_python(attribute_type, lookup, value)
+        except ValueError:
+            # eg. size=XL can't match the integer sizes, nor size__gte=42 the text ones
+            continue
+        condition |= Q(
+            attribute__in=[attribute for attribute in attributes if attribute.type == attribute_type],
+            **{'value_%s__%s' % (attribute_type, lookup): typed_value},
+        )
+    return ProductAttributeValue.objects.filter(condition).values('product_id')
+
+
+def plan(predicates):
+    """
+    Order the predicates by the number of values they match, most selective
+    first. Returns None when one of them can't match anything.
+    """
+    codes = {code for code, __, __ in predicates}
+    attributes = {}
+    for attribute in ProductAttribute.objects.filter(code__in=codes).only('pk', 'code', 'type'):
+        attributes.setdefault(attribute.code, []).append(attribute)
+
+    planned = []
+    for code, lookup, value in predicates:
+        if code not in attributes:
+            return None
+        product_ids = predicate_product_ids(attributes[code], lookup, value)
+        matches = product_ids[:SELECTIVITY_LIMIT].count()
+        if not matches:
+            return None
+        planned.append((matches, product_ids))
+    planned.sort(key=lambda item: item[0])
+    return [product_ids for __, product_ids in planned]
+
+
+def filter_products(queryset, query_params):
+    """
+    The filters shared by the product list and its facets.
+    """
+    structure = query_params.get("structure")
+    if structure is not None:
+        queryset = queryset.filter(structure=structure)
+    return filter_by_attributes(queryset, query_params)
+
+
+def filter_by_attributes(queryset, query_params):
+    """
+    Narrow the product queryset down to the products matching all attribute
+    predicates. Each predicate only looks at the products the more selective
+    ones left over, a parent matches when one of its children does.
+    """
+    predicates = parse_attribute_filters(query_params)
+    if not predicates:
+        return queryset
+    planned = plan(predicates)
+    if planned is None:
+        return queryset.none()
+
+    candidates = planned[0]
+    for product_ids in planned[1:]:
+        candidates = product_ids.filter(product_id__in=candidates)
+    parents = Product.objects.filter(pk__in=candidates, parent__isnull=False).values('parent_id')
+    return queryset.filter(Q(pk__in=candidates) | Q(pk__in=parents))
@@ -0,0 +1,285 @@
+"""
+Synthetic catalog and traffic data for benchmarks and load tests.
+
+Everything is drawn from one random.Random(seed), so a seed always yields
+the same rows, and written with bulk_create a batch at a time, so millions of
+rows take bounded memory. The names of the rows carry the seed, the same seed
+can't be generated twice into one database.
+
+Open baskets get lines but no stock reservations, the stock is large enough
+for that not to matter.
+"""
+from array import array
+from datetime import timedelta
+from decimal import Decimal
+import random
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils.timezone import now
+
+from api.cache import invalidate_product_lists
+from basket.models import Basket, BasketLine
+from order.models import Order, OrderLine, ShippingAddress
+from product.models import Product, ProductAttribute, ProductAttributeDocument, ProductAttributeValue, \
+    ProductCategory, ProductClass, StockRecord
+from product.search import index_products
+
+
+WORDS = (
+    'red', 'blue', 'green', 'black', 'white', 'cotton', 'linen', 'wool', 'slim', 'loose', 'classic', 'sport',
+    'summer', 'winter', 'light', 'warm', 'striped', 'plain', 'soft', 'organic',
+)
+# every generated user can log in with it
+PASSWORD = 'generated'
+HISTORY_DAYS = 2 * 365
+
+
+def parse_range(value):
+    """
+    Read a distribution given as "N" or "MIN-MAX", every count in between
+    being equally likely.
+    """
+    low, __, high = value.partition('-')
+    low, high = int(low), int(high or low)
+    if low < 0 or high < low:
+        raise ValueError("%s is not a valid range" % value)
+    return low, high
+
+
+class DataGenerator:
+
+    def __init__(self, seed, batch_size=1000, index=True, log=None):
+        self.random = random.Random(seed)
+        self.prefix = 'gen%s' % seed
+        self.batch_size = batch_size
+        self.index = index
+        self.log = log or (lambda message: None)
+        # what the baskets and orders are made of, kept compact for large catalogs
+        self.stockrecord_ids = array('q')
+        self.stockrecord_products = array('q')
+        self.stockrecord_prices = array('d')
+        self.user_ids = array('q')
+        self.partner_ids = []
+
+    def exists(self):
+        return Product.objects.filter(article__startswith='%s-' % self.prefix).exists()
+
+    def pick(self, distribution):
+        return self.random.randint(*distribution)
+
+    def batches(self, count):
+        for start in range(0, count, self.batch_size):
+            yield range(start, min(start + self.batch_size, count))
+
+    def generate_catalog(self, categories, product_classes, attributes_per_class, products, parent_ratio,
+                         children_per_parent, stockrecords_per_product):
+        categories = ProductCategory.objects.bulk_create([
+            ProductCategory(title='%s category %s' % (self.prefix, i), slug='%s-category-%s' % (self.prefix, i))
+            for i in range(categories)
+        ])
+        product_classes = ProductClass.objects.bulk_create([
+            ProductClass(name='%s class %s' % (self.prefix, i), slug='%s-class-%s' % (self.prefix, i))
+            for i in range(product_classes)
+        ])
+        attributes = {}
+        for product_class in product_classes:
+            attributes[product_class.pk] = ProductAttribute.objects.bulk_create([
+                ProductAttribute(
+                    name='Attribute %s' % i,
+                    code='attribute_%s' % i,
+                    type=self.random.choice((ProductAttribute.TEXT, ProductAttribute.INTEGER)),
+                    product_class=product_class,
+                )
+                for i in range(self.pick(attributes_per_class))
+            ])
+        password = make_password(PASSWORD, salt=self.prefix)
+        self.partner_ids = [user.pk for user in User.objects.bulk_create([
+            User(username='%s_partner_%s' % (self.prefix, i), password=password)
+            for i in range(max(stockrecords_per_product[1], 1))
+        ])]
+        self.log("Created %s categories and %s product classes with %s attributes" % (
+            len(categories), len(product_classes), sum(len(values) for values in attributes.values()),
+        ))
+
+        created = 0
+        for batch in self.batches(products):
+            with transaction.atomic():
+                created += self.generate_products(
+                    batch, categories, product_classes, attributes, parent_ratio, children_per_parent,
+                    stockrecords_per_product,
+                )
+        # the bulk queries send no signals
+        invalidate_product_lists()
+        self.log("Created %s products with %s stockrecords" % (created, len(self.stockrecord_ids)))
+
+    def generate_products(self, numbers, categories, product_classes, attributes, parent_ratio,
+                          children_per_parent, stockrecords_per_product):
+        products = []
+        for i in numbers:
+            structure = Product.PARENT if self.random.random() < parent_ratio else Product.STANDALONE
+            products.append(Product(
+                structure=structure,
+                article='%s-%s' % (self.prefix, i),
+                title=' '.join(self.random.sample(WORDS, 3)).capitalize(),
+                description=' '.join(self.random.choices(WORDS, k=20)),
+                category=self.random.choice(categories) if categories else None,
+                product_class=self.random.choice(product_classes),
+            ))
+        Product.objects.bulk_create(products)
+
+        children = []
+        for parent in products:
+            if parent.structure == Product.PARENT:
+                children.extend(
+                    Product(structure=Product.CHILD, article='%s-%s' % (parent.article, j), parent=parent)
+                    for j in range(self.pick(children_per_parent))
+                )
+        Product.objects.bulk_create(children)
+
+        sellable = [product for product in products + children if product.structure != Product.PARENT]
+        values, stockrecords = [], []
+        for product in sellable:
+            product_class_id = product.parent.product_class_id if product.parent_id else product.product_class_id
+            for attribute in attributes[product_class_id]:
+                value = ProductAttributeValue(product=product, attribute=attribute)
+                if attribute.type == ProductAttribute.INTEGER:
+                    value.value = self.random.randint(1, 100)
+                else:
+                    value.value = self.random.choice(WORDS)
+                values.append(value)
+            stockrecords.extend(
+                StockRecord(
+                    product=product,
+                    owner_id=self.partner_ids[j],
+                    partner_sku='%s-%s' % (product.article, j),
+                    price=round(self.random.uniform(1, 200), 2),
+                    num_in_stock=self.random.randint(10 ** 3, 10 ** 5),
+                )
+                for j in range(self.pick(stockrecords_per_product))
+            )
+        ProductAttributeValue.objects.bulk_create(values, batch_size=self.batch_size)
+        StockRecord.objects.bulk_create(stockrecords, batch_size=self.batch_size)
+        for stockrecord in stockrecords:
+            self.stockrecord_ids.append(stockrecord.pk)
+            self.stockrecord_products.append(stockrecord.product_id)
+            self.stockrecord_prices.append(stockrecord.price)
+
+        product_ids = [product.pk for product in products + children]
+        ProductAttributeDocument.objects.refresh(product_ids)
+        if self.index:
+            index_products(product_ids)
+        return len(product_ids)
+
+    def generate_users(self, count):
+        password = make_password(PASSWORD, salt=self.prefix)
+        for batch in self.batches(count):
+            users = User.objects.bulk_create([
+                User(username='%s_user_%s' % (self.prefix, i), email='%s_user_%s@example.com' % (self.prefix, i),
+                     password=password)
+                for i in batch
+            ])
+            self.user_ids.extend(user.pk for user in users)
+        self.log("Created %s users" % count)
+
+    def random_lines(self, distribution):
+        """
+        (stockrecord index, quantity) pairs, each stockrecord once.
+        """
+        count = min(self.pick(distribution), len(self.stockrecord_ids))
+        return [
+            (index, self.random.randint(1, 3))
+            for index in self.random.sample(range(len(self.stockrecord_ids)), count)
+        ]
+
+    def generate_orders(self, count, lines_per_order, guest_ratio):
+        if not self.stockrecord_ids:
+            return
+        created_lines = 0
+        for batch in self.batches(count):
+            with transaction.atomic():
+                created_lines += self.generate_order_batch(batch, lines_per_order, guest_ratio)
+        self.log("Created %s orders with %s lines" % (count, created_lines))
+
+    def generate_order_batch(self, numbers, lines_per_order, guest_ratio):
+        placed = [now() - timedelta(seconds=self.random.randint(0, HISTORY_DAYS * 24 * 60 * 60)) for __ in numbers]
+        users = [
+            None if not self.user_ids or self.random.random() < guest_ratio else self.random.choice(self.user_ids)
+            for __ in numbers
+        ]
+        lines = [self.random_lines(lines_per_order) for __ in numbers]
+        baskets = Basket.objects.bulk_create([
+            Basket(
+                owner_id=user_id,
+                status=Basket.SUBMITTED,
+                date_submitted=date_placed,
+                num_items=sum(quantity for __, quantity in order_lines),
+                total=self.lines_total(order_lines),
+            )
+            for user_id, date_placed, order_lines in zip(users, placed, lines)
+        ])
+        addresses = ShippingAddress.objects.bulk_create([
+            ShippingAddress(first_name='Generated', last_name=str(i), line1='%s street %s' % (self.prefix, i))
+            for i in numbers
+        ])
+        orders = Order.objects.bulk_create([
+            Order(
+                number=100000 + basket.pk,
+                total=basket.total,
+                guest_email='' if user_id else '%s_guest_%s@example.com' % (self.prefix, i),
+                basket=basket,
+                user_id=user_id,
+                shipping_address=address,
+            )
+            for i, basket, address, user_id in zip(numbers, baskets, addresses, users)
+        ])
+        # date_placed is auto_now_add, the orders are spread over the past afterwards
+        for order, date_placed in zip(orders, placed):
+            order.date_placed = date_placed
+        Order.objects.bulk_update(orders, ('date_placed',), batch_size=self.batch_size)
+        order_lines = [
+            OrderLine(
+                order=order,
+                stockrecord_id=self.stockrecord_ids[index],
+                product_id=self.stockrecord_products[index],
+                quantity=quantity,
+            )
+            for order, basket_lines in zip(orders, lines)
+            for index, quantity in basket_lines
+        ]
+        OrderLine.objects.bulk_create(order_lines, batch_size=self.batch_size)
+        return len(order_lines)
+
+    def lines_total(self, lines):
+        return sum(
+            (Decimal(str(self.stockrecord_prices[index])) * quantity for index, quantity in lines),
+            Decimal('0.00'),
+        )
+
+    def generate_baskets(self, count, lines_per_basket):
+        """
+        Open baskets, of distinct users while there are enough of them.
+        """
+        if not self.stockrecord_ids:
+            return
+        owners = self.random.sample(list(self.user_ids), min(count, len(self.user_ids)))
+        owners += [None] * (count - len(owners))
+        created_lines = 0
+        for batch in self.batches(count):
+            with transaction.atomic():
+                baskets = Basket.objects.bulk_create([Basket(owner_id=owners[i]) for i in batch])
+                lines = [
+                    BasketLine(
+                        basket=basket,
+                        stockrecord_id=self.stockrecord_ids[index],
+                        product_id=self.stockrecord_products[index],
+                        quantity=quantity,
+                    )
+                    for basket in baskets
+                    for index, quantity in self.random_lines(lines_per_basket)
+                ]
+                BasketLine.objects.bulk_create(lines, batch_size=self.batch_size)
+                Basket.objects.filter(pk__in=[basket.pk for basket in baskets]).recalculate_totals()
+                created_lines += len(lines)
+        self.log("Created %s open baskets with %s lines" % (count, created_lines))
@@ -0,0 +1,375 @@
+"""
+Bulk catalog import from NDJSON or CSV feeds.
+
+Every record describes one product, keyed on its article, eg. in NDJSON::
+
+    {"article": "shirt", "structure": "parent", "title": "Shirt", "product_class": "t-shirts"}
+    {"article": "shirt-xl", "structure": "child", "parent": "shirt", "attributes": {"size": "XL"},
+     "stockrecords": [{"partner_sku": "shirt-xl", "price": "10.00", "num_in_stock": 5}]}
+
+and in CSV, with a column per attribute and a row per stockrecord::
+
+    article,structure,parent,title,attr.size,partner_sku,price,num_in_stock
+
+Existing products, attribute values and stockrecords (keyed on partner_sku)
+are updated with the fields the record has, a null attribute value deletes it.
+Parents have to come before their children.
+
+The feed is read and written a chunk of records at a time, each chunk in its
+own transaction, so memory stays bounded whatever the size of the feed.
+Records that fail validation are skipped and reported with their line.
+"""
+import csv
+import json
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils.timezone import now
+
+from api.signals import invalidate_on_commit
+from basket.models import Basket
+from product.models import Product, ProductAttribute, ProductAttributeDocument, ProductAttributeValue, \
+    ProductCategory, ProductClass, StockRecord
+from product.search import index_products
+
+
+PRODUCT_FIELDS = ('structure', 'title', 'description')
+STOCKRECORD_FIELDS = ('price', 'num_in_stock', 'low_stock_threshold')
+ATTRIBUTE_PREFIX = 'attr.'
+
+
+class RowError(Exception):
+    pass
+
+
+def read_ndjson(lines):
+    """
+    Yield (line number, record) for every non-empty line, or a RowError
+    instead of the record when the line isn't valid JSON.
+    """
+    for number, line in enumerate(lines, 1):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield number, json.loads(line)
+        except ValueError as e:
+            yield number, RowError("Invalid JSON: %s" % e)
+
+
+def read_csv(lines):
+    """
+    Yield (line number, record) for every product. Empty cells are left out,
+    the rows right after a product with the same article add stockrecords to it.
+    """
+    lines = (line.decode('utf-8') if isinstance(line, bytes) else line for line in lines)
+    reader = csv.DictReader(lines)
+    current = None
+    for row in reader:
+        record = {'attributes': {}}
+        stockrecord = {}
+        for key, value in row.items():
+            if key is None or value is None or value == '':
+                continue
+            if key.startswith(ATTRIBUTE_PREFIX):
+                record['attributes'][key[len(ATTRIBUTE_PREFIX):]] = value
+            elif key == 'partner_sku' or key in STOCKRECORD_FIELDS:
+                stockrecord[key] = value
+            else:
+                record[key] = value
+        if current is not None and record.get('article') and record['article'] == current[1].get('article'):
+            if stockrecord:
+                current[1].setdefault('stockrecords', []).append(stockrecord)
+            continue
+        if stockrecord:
+            record['stockrecords'] = [stockrecord]
+        if current is not None:
+            yield current
+        current = reader.line_num, record
+    if current is not None:
+        yield current
+
+
+READERS = {
+    'ndjson': read_ndjson,
+    'csv': read_csv,
+}
+
+
+class ImportResult:
+    # the number of errors reported in detail, the others are only counted
+    max_errors = 1000
+
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.failed = 0
+        self.errors = []
+
+    def add_error(self, line, message):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'line': line, 'message': message})
+
+    def as_dict(self):
+        return {
+            'created': self.created,
+            'updated': self.updated,
+            'failed': self.failed,
+            'errors': self.errors,
+        }
+
+
+class CatalogImporter:
+
+    def __init__(self, owner, chunk_size=500):
+        self.owner = owner
+        self.chunk_size = chunk_size
+        self.result = ImportResult()
+        # small tables, looked up for every record
+        self.product_classes = {product_class.slug: product_class for product_class in ProductClass.objects.all()}
+        self.categories = {category.slug: category for category in ProductCategory.objects.all()}
+        self.attributes = {}
+        for attribute in ProductAttribute.objects.all():
+            self.attributes.setdefault(attribute.product_class_id, {})[attribute.code] = attribute
+
+    def run(self, records):
+        chunk = []
+        for number, record in records:
+            chunk.append((number, record))
+            if len(chunk) >= self.chunk_size:
+                self.import_chunk(chunk)
+                chunk = []
+        if chunk:
+            self.import_chunk(chunk)
+        # children are validated after the other records of their chunk
+        self.result.errors.sort(key=lambda error: error['line'])
+        return self.result
+
+    def import_chunk(self, chunk):
+        records = []
+        seen = set()
+        for number, record in chunk:
+            if isinstance(record, Exception):
+                self.result.add_error(number, str(record))
+            elif not isinstance(record, dict) or not record.get('article'):
+                self.result.add_error(number, "An article is required")
+            elif record['article'] in seen:
+                self.result.add_error(number, "Article %s is already in this chunk" % record['article'])
+            else:
+                seen.add(record['article'])
+                records.append((number, record))
+
+        # children are validated once their parents are written
+        parents = [item for item in records if item[1].get('structure') != Product.CHILD]
+        children = [item for item in records if item[1].get('structure') == Product.CHILD]
+        rejected = set()
+        try:
+            with transaction.atomic():
+                written = self.import_records(parents, rejected) + self.import_records(children, rejected)
+                self.after_chunk(written)
+        except Exception as e:  # pylint: disable=broad-except
+            # the whole chunk is rolled back, nothing of it was written
+            for number, __ in records:
+                if number not in rejected:
+                    self.result.add_error(number, "The chunk could not be written: %s" % e)
+            return
+        for __, created in written:
+            if created:
+                self.result.created += 1
+            else:
+                self.result.updated += 1
+
+    def import_records(self, records, rejected):
+        """
+        Write the valid records, the line numbers of the others are added to `rejected`.
+        """
+        articles = {record['article'] for __, record in records}
+        articles |= {record['parent'] for __, record in records if record.get('parent')}
+        products = {
+            product.article: product
+            for product in Product.objects.filter(article__in=articles).select_related('parent')
+        }
+        skus = {
+            stockrecord.get('partner_sku')
+            for __, record in records
+            for stockrecord in record.get('stockrecords') or ()
+            if isinstance(stockrecord, dict)
+        }
+        stockrecords = {stockrecord.partner_sku: stockrecord for stockrecord in StockRecord.objects.filter(
+            partner_sku__in=skus,
+        )}
+
+        rows = []
+        for number, record in records:
+            try:
+                product, created = self.build_product(record, products)
+                attribute_values = self.build_attribute_values(product, record)
+                product_stockrecords = self.build_stockrecords(product, record, stockrecords)
+            except RowError as e:
+                rejected.add(number)
+                self.result.add_error(number, str(e))
+            except ValidationError as e:
+                rejected.add(number)
+                self.result.add_error(number, ", ".join(e.messages))
+            else:
+                rows.append((product, created, attribute_values, product_stockrecords))
+
+        Product.objects.bulk_create([product for product, created, __, __ in rows if created])
+        Product.objects.bulk_update(
+            [product for product, created, __, __ in rows if not created],
+            PRODUCT_FIELDS + ('category', 'product_class', 'parent'),
+        )
+        self.write_attribute_values(rows)
+        self.write_stockrecords(rows)
+        return [(product, created) for product, created, __, __ in rows]
+
+    def build_product(self, record, products):
+        product = products.get(record['article'])
+        created = product is None
+        if created:
+            product = Product(article=record['article'])
+        for name in PRODUCT_FIELDS:
+            if name in record:
+                setattr(product, name, record[name] or '')
+        if 'product_class' in record:
+            product.product_class = self.lookup(self.product_classes, record['product_class'], "product class")
+        if 'category' in record:
+            product.category = self.lookup(self.categories, record['category'], "category")
+        if record.get('parent'):
+            product.parent = self.lookup(products, record['parent'], "parent")
+        if product.structure not in dict(Product.STRUCTURE_CHOICES):
+            raise RowError("Unknown structure %s" % product.structure)
+        product.clean()
+        return product, created
+
+    def lookup(self, objects, key, name):
+        if key is None or key == '':
+            return None
+        try:
+            return objects[key]
+        except KeyError:
+            raise RowError("Unknown %s %s" % (name, key))
+
+    def build_attribute_values(self, product, record):
+        values = record.get('attributes') or {}
+        if not isinstance(values, dict):
+            raise RowError("attributes must be an object")
+        product_class = product.get_product_class()
+        attributes = self.attributes.get(product_class.pk if product_class else None, {})
+        attribute_values = []
+        for code, value in values.items():
+            try:
+                attribute = attributes[code]
+            except KeyError:
+                raise RowError("No attribute exist with code=%s in the product class" % code)
+            if value is not None and value != '':
+                if attribute.type == ProductAttribute.INTEGER and isinstance(value, str):
+                    try:
+                        value = int(value)
+                    except ValueError:
+                        raise RowError("%s: Must be integer" % code)
+                try:
+                    attribute.validate_value(value)
+                except ValidationError as e:
+                    raise RowError("%s: %s" % (code, ", ".join(e.messages)))
+            elif attribute.required:
+                raise RowError("Attribute %s is required." % code)
+            attribute_values.append((attribute, value))
+        return attribute_values
+
+    def build_stockrecords(self, product, record, stockrecords):
+        rows = record.get('stockrecords') or []
+        if rows and product.is_parent:
+            raise RowError("Stockrecords is forbidden for parent product")
+        built = []
+        for row in rows:
+            if not isinstance(row, dict) or not row.get('partner_sku'):
+                raise RowError("A partner sku field is required")
+            stockrecord = stockrecords.get(row['partner_sku'])
+            if stockrecord is None:
+                if 'price' not in row:
+                    raise RowError("A price is required for the new stockrecord %s" % row['partner_sku'])
+                stockrecord = StockRecord(partner_sku=row['partner_sku'], owner=self.owner)
+            elif stockrecord.product_id != product.pk:
+                raise RowError("Stockrecord %s belongs to another product" % row['partner_sku'])
+            try:
+                if 'price' in row:
+                    stockrecord.price = float(row['price'])
+                    if stockrecord.price < 0.01:
+                        raise RowError("The price must be at least 0.01")
+                for name in ('num_in_stock', 'low_stock_threshold'):
+                    if name in row:
+                        setattr(stockrecord, name, None if row[name] is None else int(row[name]))
+            except (TypeError, ValueError) as e:
+                raise RowError("Stockrecord %s: %s" % (row['partner_sku'], e))
+            built.append(stockrecord)
+        return built
+
+    def write_attribute_values(self, rows):
+        rows = [(product, attribute_values) for product, __, attribute_values, __ in rows if attribute_values]
+        if not rows:
+            return
+        existing = {
+            (value.product_id, value.attribute_id): value
+            for value in ProductAttributeValue.objects.filter(product__in=[product for product, __ in rows])
+        }
+        created, updated, deleted = [], [], []
+        for product, attribute_values in rows:
+            for attribute, value in attribute_values:
+                attribute_value = existing.get((product.pk, attribute.pk))
+                if value is None or value == '':
+                    if attribute_value is not None:
+                        deleted.append(attribute_value.pk)
+                    continue
+                if attribute_value is None:
+                    attribute_value = ProductAttributeValue(product=product, attribute=attribute)
+                    created.append(attribute_value)
+                else:
+                    attribute_value.attribute = attribute
+                    updated.append(attribute_value)
+                attribute_value.value = value
+        if deleted:
+            ProductAttributeValue.objects.filter(pk__in=deleted).delete()
+        ProductAttributeValue.objects.bulk_create(created)
+        ProductAttributeValue.objects.bulk_update(updated, ('value_text', 'value_integer'))
+
+    def write_stockrecords(self, rows):
+        created, updated = [], []
+        for product, __, __, stockrecords in rows:
+            for stockrecord in stockrecords:
+                stockrecord.product = product
+                if stockrecord.pk is None:
+                    created.append(stockrecord)
+                else:
+                    stockrecord.date_updated = now()
+                    updated.append(stockrecord)
+        StockRecord.objects.bulk_create(created)
+        StockRecord.objects.bulk_update(updated, STOCKRECORD_FIELDS + ('date_updated',))
+        if updated:
+            # the stored basket totals are priced, see basket/signals.py
+            Basket.objects.holding_stockrecords([item.pk for item in updated]).recalculate_totals()
+
+    def after_chunk(self, written):
+        """
+        The bulk queries send no signals, so do what the signals would.
+        """
+        product_ids = [product.pk for product, __ in written]
+        if not product_ids:
+            return
+        ProductAttributeDocument.objects.refresh(product_ids)
+        index_products(product_ids + list(Product.objects.filter(parent__in=product_ids).values_list('pk', flat=True)))
+        invalidate_on_commit((product.pk, product.structure, product.parent_id) for product, __ in written)
+
+
+def import_catalog(lines, feed_format, owner, chunk_size=500):
+    """
+    Import the lines of a feed in the given format, see the module docstring.
+    """
+    try:
+        reader = READERS[feed_format]
+    except KeyError:
+        raise ValueError("Unsupported format %s, use one of %s" % (feed_format, ", ".join(READERS)))
+    return CatalogImporter(owner, chunk_size=chunk_size).run(reader(lines))
@@ -0,0 +1,172 @@
+"""
+Per-request metrics: the number and time of the SQL queries, the hits and
+misses of the payload caches and the time spent in the serializers.
+
+InstrumentationMiddleware collects them for every request without DEBUG,
+wrapping the query execution of each database connection. They are sent
+back in a Server-Timing header, logged as one JSON line for a sample of the
+requests, and every query slower than MY_INSTRUMENTATION_SLOW_QUERY is
+logged with the view it ran for.
+
+The serializer time includes the queries of relations loaded while
+serializing, it overlaps the database time.
+
+The queries of a streaming response keep being counted while it streams,
+and its log line is written once the stream ends. Its Server-Timing header
+is sent before that, so it only covers the view.
+"""
+import json
+import logging
+import random
+import time
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.db import connections
+from django.dispatch import receiver
+
+from basket import storage
+from HomeShopping import settings
+
+
+logger = logging.getLogger('api.instrumentation')
+slow_query_logger = logging.getLogger('api.instrumentation.slow_queries')
+
+_current = ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.serializer_time = 0.0
+        self.serializing = False
+        # (duration, alias, sql) of the queries over the slow query threshold
+        self.slow_queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        """
+        The execute wrapper of the database connections.
+        """
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            self.queries += 1
+            self.db_time += duration
+            if duration >= settings.MY_INSTRUMENTATION_SLOW_QUERY:
+                self.slow_queries.append((duration, context['connection'].alias, sql))
+
+    def server_timing(self, total):
+        return ', '.join((
+            'total;dur=%.1f' % (total * 1000),
+            'db;dur=%.1f;desc="%s queries"' % (self.db_time * 1000, self.queries),
+            'serialize;dur=%.1f' % (self.serializer_time * 1000),
+            'cache;desc="hits=%s misses=%s"' % (self.cache_hits, self.cache_misses),
+        ))
+
+
+def record_cache(hit):
+    metrics = _current.get()
+    if metrics is not None:
+        if hit:
+            metrics.cache_hits += 1
+        else:
+            metrics.cache_misses += 1
+
+
+@receiver(storage.looked_up)
+def basket_looked_up(sender, hit, **kwargs):
+    record_cache(hit)
+
+
+@contextmanager
+def serializer_timer():
+    """
+    Add the time of the block to the serializer time. Only the outermost
+    block counts, nested serializers are part of their parent's time.
+    """
+    metrics = _current.get()
+    if metrics is None or metrics.serializing:
+        yield
+        return
+    metrics.serializing = True
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.serializer_time += time.perf_counter() - start
+        metrics.serializing = False
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return None
+    return match.view_name
+
+
+class InstrumentationMiddleware:
+    """
+    Goes first in MIDDLEWARE, so the queries of the other middlewares count too.
+    """
+
+    def __init__(self, get_response):
+        self._get_response = get_response
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        start = time.perf_counter()
+        try:
+            with self.wrap_queries(metrics):
+                response = self._get_response(request)
+        finally:
+            _current.reset(token)
+
+        if settings.MY_INSTRUMENTATION_SERVER_TIMING:
+            response['Server-Timing'] = metrics.server_timing(time.perf_counter() - start)
+        if response.streaming:
+            response.streaming_content = self.stream(request, response, response.streaming_content, metrics, start)
+        else:
+            self.report(request, response, metrics, time.perf_counter() - start)
+        return response
+
+    @contextmanager
+    def wrap_queries(self, metrics):
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(metrics))
+            yield
+
+    def stream(self, request, response, content, metrics, start):
+        try:
+            with self.wrap_queries(metrics):
+                yield from content
+        finally:
+            self.report(request, response, metrics, time.perf_counter() - start)
+
+    def report(self, request, response, metrics, total):
+        name = view_name(request)
+        for duration, alias, sql in metrics.slow_queries:
+            slow_query_logger.warning(
+                "Slow query of %.1f ms on %s in %s: %s", duration * 1000, alias, name, sql,
+            )
+        if random.random() < settings.MY_INSTRUMENTATION_LOG_SAMPLE_RATE:
+            logger.info(json.dumps({
+                'method': request.method,
+                'path': request.path,
+                'view': name,
+                'status': response.status_code,
+                'duration_ms': round(total * 1000, 1),
+                'queries': metrics.queries,
+                'db_ms': round(metrics.db_time * 1000, 1),
+                'cache_hits': metrics.cache_hits,
+                'cache_misses': metrics.cache_misses,
+                'serializer_ms': round(metrics.serializer_time * 1000, 1),
+                'slow_queries': len(metrics.slow_queries),
+            }))
@@ -0,0 +1,24 @@
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Cursor pagination seeks on an indexed, unique ordering, so every page
+    costs the same no matter how deep into the table it is, no OFFSET scans.
+    """
+    ordering = 'id'
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+
+class OrderKeysetPagination(KeysetPagination):
+    # newest orders first; id breaks the tie between orders placed at the same time
+    ordering = ('-date_placed', '-id')
+
+
+class SearchPagination(PageNumberPagination):
+    # results are ranked by relevance, which isn't unique, so no cursor here
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
@@ -3,6 +3,8 @@ from rest_framework import serializers
 
 from api.serializers.product import ProductAttributeSerializer, BaseProductSerializer
 from api.serializers.utils import UpdateListSerializer, UpdateRelationMixin
+from api.signals import invalidate_on_commit
+from basket.models import Basket
 from product.models import ProductClass, StockRecord, Product, ProductCategory
 
 
@@ -38,6 +40,18 @@ class AdminProductClassSerializer(serializers.ModelSerializer, UpdateRelationMix
 
 
 class AdminStockRecordListSerializer(UpdateListSerializer):
+    natural_key = ('partner_sku',)
+
+    def build_item(self, item, datum):
+        item = super().build_item(item, datum)
+        item.clean()
+        return item
+
+    def after_bulk_write(self, rel_instance, items, deleted):
+        invalidate_on_commit([(rel_instance.pk, rel_instance.structure, rel_instance.parent_id)])
+        # the stored basket totals are priced, see basket/signals.py
+        Basket.objects.holding_stockrecords([item.pk for item in items]).recalculate_totals()
+
     def select_existing_item(self, manager, datum):
         try:
             return manager.get(product=datum['product'], partner_sku=datum['partner_sku'])
@@ -58,6 +72,8 @@ class AdminStockRecordsSerializer(serializers.ModelSerializer):
         list_serializer_class = AdminStockRecordListSerializer
         model = StockRecord
         fields = '__all__'
+        # only changed by the stock reservations, see basket/managers.py
+        read_only_fields = ('num_allocated',)
 
     def validate(self, attrs):
         if not attrs.get('partner_sku', None):
@@ -2,12 +2,14 @@ from django.contrib.auth.models import User
 
 from rest_framework import serializers
 
-from api.serializers.fields import DrillDownHyperlinkedIdentityField
+from api.serializers.fields import DrillDownHyperlinkedIdentityField, HyperlinkedIdentityField, \
+    HyperlinkedRelatedField
+from api.serializers.utils import HyperlinkedModelSerializer
 from basket.models import Basket, BasketLine
 
 
-class BasketSerializer(serializers.HyperlinkedModelSerializer):
-    lines = serializers.HyperlinkedIdentityField(
+class BasketSerializer(HyperlinkedModelSerializer):
+    lines = HyperlinkedIdentityField(
         view_name='basket-lines-list',
         many=False,
         read_only=True,
@@ -18,7 +20,7 @@ class BasketSerializer(serializers.HyperlinkedModelSerializer):
         required=False,
         read_only=True,
     )
-    owner = serializers.HyperlinkedRelatedField(
+    owner = HyperlinkedRelatedField(
         view_name='user-detail',
         required=False,
         allow_null=True,
@@ -36,7 +38,7 @@ class BasketSerializer(serializers.HyperlinkedModelSerializer):
         )
 
 
-class BasketLineSerializer(serializers.HyperlinkedModelSerializer):
+class BasketLineSerializer(HyperlinkedModelSerializer):
     url = DrillDownHyperlinkedIdentityField(
         view_name='basket-line-detail',
         extra_url_kwargs={'basket_pk': 'basket.id'},
@@ -0,0 +1,120 @@
+"""
+The read path of the product catalog. It renders exactly what
+ProductSerializer renders, from .values() rows instead of model instances
+going through DRF fields. ProductSerializer stays for the writes.
+
+The key order of every dict below is the field order of the serializer it
+mirrors, and api/tests/unit/testproduct.py compares the rendered bytes of
+both, so a field added to one has to be added to the other.
+"""
+from rest_framework.fields import DateTimeField
+
+from api.instrumentation import serializer_timer
+from api.reverse import absolute_url_template
+from product.models import Product, StockRecord
+
+
+PRODUCT_COLUMNS = (
+    'id', 'structure', 'title', 'article', 'description', 'category_id', 'parent_id',
+    'product_class__slug', 'attribute_document__attributes',
+)
+STOCKRECORD_COLUMNS = (
+    'id', 'partner_sku', 'price', 'num_in_stock', 'low_stock_threshold',
+    'date_created', 'date_updated', 'product_id', 'owner_id',
+)
+
+
+def product_rows(queryset):
+    """
+    The rows of a product queryset the catalog views paginate and render.
+    """
+    return queryset.prefetch_related(None).values(*PRODUCT_COLUMNS)
+
+
+def group_by(rows, key):
+    groups = {}
+    for row in rows:
+        groups.setdefault(row[key], []).append(row)
+    return groups
+
+
+class ProductRowSerializer:
+    """
+    Render product rows with their children and stockrecords, fetching
+    those with one query each for the whole page.
+    """
+
+    def __init__(self, request):
+        self.request = request
+        self.datetime = DateTimeField().to_representation
+        self.product_url = absolute_url_template(request, 'product-detail', ('pk',))
+        self.stockrecord_url = absolute_url_template(request, 'product-stockrecord-detail', ('pk', 'product_pk'))
+
+    def attributes(self, row):
+        return [dict(attribute, product=row['id']) for attribute in row['attribute_document__attributes'] or ()]
+
+    def stockrecord(self, row):
+        return {
+            'id': row['id'],
+            'url': self.stockrecord_url % {'pk': row['id'], 'product_pk': row['product_id']},
+            'partner_sku': row['partner_sku'],
+            'price': row['price'],
+            'num_in_stock': row['num_in_stock'],
+            'low_stock_threshold': row['low_stock_threshold'],
+            'date_created': self.datetime(row['date_created']),
+            'date_updated': self.datetime(row['date_updated']),
+            'product': row['product_id'],
+            'owner': row['owner_id'],
+        }
+
+    def child(self, row):
+        return {
+            'id': row['id'],
+            'attributes': self.attributes(row),
+            'product_class': row['product_class__slug'],
+            'url': self.product_url % {'pk': row['id']},
+            'parent': self.product_url % {'pk': row['parent_id']} if row['parent_id'] is not None else None,
+            'structure': row['structure'],
+            'title': row['title'],
+            'article': row['article'],
+            'description': row['description'],
+            'category': row['category_id'],
+        }
+
+    def product(self, row, children, stockrecords):
+        return {
+            'id': row['id'],
+            'attributes': self.attributes(row),
+            'product_class': row['product_class__slug'],
+            'url': self.product_url % {'pk': row['id']},
+            'children': [self.child(child) for child in children],
+            'stockrecords': [self.stockrecord(stockrecord) for stockrecord in stockrecords],
+            'structure': row['structure'],
+            'title': row['title'],
+            'article': row['article'],
+            'description': row['description'],
+            'category': row['category_id'],
+            'parent': row['parent_id'],
+        }
+
+    def to_representation(self, rows):
+        with serializer_timer():
+            return self.render(rows)
+
+    def render(self, rows):
+        rows = list(rows)
+        parent_ids = [row['id'] for row in rows if row['structure'] == Product.PARENT]
+        children = group_by(
+            Product.objects.filter(parent_id__in=parent_ids).order_by('pk').values(*PRODUCT_COLUMNS),
+            'parent_id',
+        ) if parent_ids else {}
+        stockrecords = group_by(
+            StockRecord.objects.filter(product_id__in=[row['id'] for row in rows]).order_by('pk').values(
+                *STOCKRECORD_COLUMNS,
+            ),
+            'product_id',
+        ) if rows else {}
+        return [
+            self.product(row, children.get(row['id'], ()), stockrecords.get(row['id'], ()))
+            for row in rows
+        ]
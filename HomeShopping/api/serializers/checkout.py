@@ -1,14 +1,16 @@
 from rest_framework import serializers, exceptions
 
-from api.serializers.fields import DrillDownHyperlinkedRelatedField
+from api.serializers.fields import DrillDownHyperlinkedRelatedField, HyperlinkedIdentityField, \
+    HyperlinkedRelatedField
 from api.serializers.mixins import OrderPlacementMixin
 from api.serializers.product import ProductSerializer
+from api.serializers.utils import HyperlinkedModelSerializer
 from basket.models import Basket
 from order.models import ShippingAddress, OrderLineAttribute, OrderLine, Order
 from product.models import StockRecord
 
 
-class ShippingAddressSerializer(serializers.HyperlinkedModelSerializer):
+class ShippingAddressSerializer(HyperlinkedModelSerializer):
     class Meta:
         model = ShippingAddress
         fields = '__all__'
@@ -20,14 +22,16 @@ class InlineShippingAddressSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
-class OrderLineAttributeSerializer(serializers.HyperlinkedModelSerializer):
+class OrderLineAttributeSerializer(HyperlinkedModelSerializer):
+    url = HyperlinkedIdentityField(view_name='order-lineattributes-detail')
+
     class Meta:
         model = OrderLineAttribute
         fields = ('url', 'value')
 
 
-class OrderLineSerializer(serializers.HyperlinkedModelSerializer):
-    url = serializers.HyperlinkedIdentityField(view_name='orderline-detail')
+class OrderLineSerializer(HyperlinkedModelSerializer):
+    url = HyperlinkedIdentityField(view_name='orderline-detail')
     stockrecord = DrillDownHyperlinkedRelatedField(
         view_name='product-stockrecord-detail',
         extra_url_kwargs={'product_pk': 'product_id'},
@@ -44,8 +48,8 @@ class OrderLineSerializer(serializers.HyperlinkedModelSerializer):
         fields = '__all__'
 
 
-class OrderSerializer(serializers.HyperlinkedModelSerializer):
-    owner = serializers.HyperlinkedRelatedField(
+class OrderSerializer(HyperlinkedModelSerializer):
+    owner = HyperlinkedRelatedField(
         view_name='user-detail',
         read_only=True,
         source='user',
@@ -60,7 +64,7 @@ class OrderSerializer(serializers.HyperlinkedModelSerializer):
 
 
 class CheckoutSerializer(serializers.Serializer, OrderPlacementMixin):
-    basket = serializers.HyperlinkedRelatedField(
+    basket = HyperlinkedRelatedField(
         view_name='basket-detail',
         queryset=Basket.objects,
     )
@@ -81,7 +85,7 @@ class CheckoutSerializer(serializers.Serializer, OrderPlacementMixin):
                 raise serializers.ValidationError(message)
 
         basket = attrs.get('basket')
-        if basket.num_items() <= 0:
+        if basket.num_items <= 0:
             message = "Cannot checkout with empty basket"
             raise serializers.ValidationError(message)
         total = basket.total_price
@@ -1,9 +1,10 @@
 import operator
 
-from django.core.exceptions import ValidationError
+from django.core.exceptions import ObjectDoesNotExist, ValidationError
 
 from rest_framework import relations, serializers
 
+from api.reverse import template_reverse
 from api.serializers.exceptions import FieldError
 from product.models import ProductAttribute
 
@@ -11,21 +12,36 @@ from product.models import ProductAttribute
 attribute_details = operator.itemgetter('code', 'value')
 
 
-class DrillDownHyperlinkedMixin:
+class TemplateReverseMixin:
+    """
+    Build the links from the URL templates of api/reverse.py.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.reverse = template_reverse
+
+
+class HyperlinkedIdentityField(TemplateReverseMixin, relations.HyperlinkedIdentityField):
+    pass
+
+
+class HyperlinkedRelatedField(TemplateReverseMixin, relations.HyperlinkedRelatedField):
+    pass
+
+
+class DrillDownHyperlinkedMixin(TemplateReverseMixin):
     def __init__(self, *args, **kwargs):
         try:
             self.extra_url_kwargs = kwargs.pop('extra_url_kwargs')
         except KeyError:
             msg = "DrillDownHyperlink Fields require an 'extra_url_kwargs' argument"
             raise ValueError(msg)
+        self.extra_url_getters = [(key, operator.attrgetter(path)) for key, path in self.extra_url_kwargs.items()]
 
         super().__init__(*args, **kwargs)
 
     def get_extra_url_kwargs(self, obj):
-        return {
-            key: operator.attrgetter(path)(obj)
-            for key, path in self.extra_url_kwargs.items()
-        }
+        return {key: getter(obj) for key, getter in self.extra_url_getters}
 
     def get_url(self, obj, view_name, request, format):  # pylint: disable=redefined-builtin
         """
@@ -86,6 +102,41 @@ class AttributeValueField(serializers.Field):
             return updated_dictionary
         return dictionary
 
+    def get_attribute_map(self, key, queryset):
+        """
+        The attributes of one product class by code. They are loaded once for
+        the root serializer, so validating many values (or products) costs a
+        single query per product class.
+        """
+        attribute_maps = self.root.__dict__.setdefault('_attribute_maps', {})
+        if key not in attribute_maps:
+            attribute_maps[key] = {attribute.code: attribute for attribute in queryset}
+        return attribute_maps[key]
+
+    def find_attribute(self, code, data):
+        if 'product_class' in data and data['product_class'] is not None and data['product_class'] != '':
+            slug = data.get('product_class')
+            attributes = self.get_attribute_map(
+                ('product_class', slug),
+                ProductAttribute.objects.filter(product_class__slug=slug),
+            )
+        elif 'parent' in data and data['parent'] is not None:
+            parent = getattr(data['parent'], 'pk', data['parent'])
+            attributes = self.get_attribute_map(
+                ('parent', parent),
+                ProductAttribute.objects.filter(product_class__product__id=parent),
+            )
+        elif 'product' in data:
+            product_class = data.get('product').get_product_class()
+            attributes = self.get_attribute_map(
+                ('product_class_id', getattr(product_class, 'pk', None)),
+                ProductAttribute.objects.filter(product_class=product_class),
+            )
+        try:
+            return attributes[code]
+        except KeyError:
+            raise ProductAttribute.DoesNotExist
+
     def to_internal_value(self, data):
         assert 'product' in data or 'product_class' in data or 'parent' in data
 
@@ -93,15 +144,7 @@ class AttributeValueField(serializers.Field):
             code, value = attribute_details(data)
             internal_value = value
 
-            if 'product_class' in data and data['product_class'] is not None and data['product_class'] != '':
-                attribute = ProductAttribute.objects.get(code=code, product_class__slug=data.get('product_class'))
-            elif 'parent' in data and data['parent'] is not None:
-                attribute = ProductAttribute.objects.get(code=code, product_class__product__id=data.get('parent'))
-            elif 'product' in data:
-                attribute = ProductAttribute.objects.get(
-                    code=code,
-                    product_class=data.get('product').get_product_class(),
-                )
+            attribute = self.find_attribute(code, data)
 
             if attribute.required and value is None:
                 self.fail('attribute_required', code=code)
@@ -133,3 +176,21 @@ class AttributeValueField(serializers.Field):
 
     def to_representation(self, value):
         return value.value
+
+
+class AttributeDocumentField(serializers.Field):
+    """
+    Render the attributes of a product from its attribute document, in the
+    same shape as ProductAttributeValueSerializer.
+    """
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        try:
+            attributes = value.attribute_document.attributes
+        except ObjectDoesNotExist:
+            attributes = []
+        return [dict(attribute, product=value.pk) for attribute in attributes]
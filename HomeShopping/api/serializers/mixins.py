@@ -1,6 +1,13 @@
+from collections import defaultdict
+
 from django.db import transaction
+from django.db.models import Case, F, PositiveIntegerField, Q, Value, When
+from django.utils.timezone import now
 
+from api.signals import invalidate_on_commit
+from basket.models import StockReservation
 from order.models import Order, OrderLine, OrderLineAttribute
+from product.models import ProductAttributeValue, StockRecord
 
 
 class OrderPlacementMixin:
@@ -11,7 +18,7 @@ class OrderPlacementMixin:
     def place_order(self, basket, order_number, order_total,
                     user=None, shipping_address=None, **kwargs):
 
-        if basket.num_items() <= 0:
+        if basket.num_items <= 0:
             raise ValueError("Empty baskets cannot be submitted")
 
         if not order_number:
@@ -22,13 +29,13 @@ class OrderPlacementMixin:
                              % order_number)
 
         with transaction.atomic():
+            basket_lines = list(basket.lines.select_related('product'))
+            self.update_stock_records(basket, basket_lines)
+
             shipping_address = self.create_shipping_address(shipping_address)
             order = self.create_order_model(basket, order_total, order_number,
                                             user, shipping_address, **kwargs)
-
-            for basket_line in basket.lines.all():
-                self.create_line_models(order, basket_line)
-                self.update_stock_records(basket_line)
+            self.create_line_models(order, basket_lines)
 
         return order
 
@@ -57,23 +64,89 @@ class OrderPlacementMixin:
         order.save()
         return order
 
-    def create_line_models(self, order, basket_line):
-        line_data = {
-            'order': order,
-            'product': basket_line.product,
-            'quantity': basket_line.quantity,
-            'stockrecord': basket_line.stockrecord,
-        }
-        order_line = OrderLine(**line_data)
-        order_line.save()
-        self.create_line_attrs(order_line, basket_line)
-
-    def create_line_attrs(self, order_line, basket_line):
-        for attr in basket_line.product.attributes.all():
-            OrderLineAttribute.objects.create(line=order_line, type=attr.name,
-                                              value=attr.productattributevalue_set.get(id=attr.id))
-
-    def update_stock_records(self, basket_line):
-        stockrecord = basket_line.stockrecord
-        stockrecord.num_in_stock -= basket_line.quantity
-        stockrecord.save()
+    def create_line_models(self, order, basket_lines):
+        order_lines = OrderLine.objects.bulk_create([
+            OrderLine(
+                order=order,
+                product_id=basket_line.product_id,
+                quantity=basket_line.quantity,
+                stockrecord_id=basket_line.stockrecord_id,
+            )
+            for basket_line in basket_lines
+        ])
+        attribute_values = self.get_attribute_values(basket_lines)
+        line_attrs = []
+        for order_line, basket_line in zip(order_lines, basket_lines):
+            line_attrs.extend(self.create_line_attrs(order_line, attribute_values[basket_line.product_id]))
+        OrderLineAttribute.objects.bulk_create(line_attrs)
+        return order_lines
+
+    def get_attribute_values(self, basket_lines):
+        """
+        Snapshot the attribute values of every product in the basket with one query.
+        """
+        attribute_values = defaultdict(list)
+        queryset = ProductAttributeValue.objects.filter(
+            product_id__in={basket_line.product_id for basket_line in basket_lines},
+        ).select_related('attribute').order_by('id')
+        for attribute_value in queryset:
+            attribute_values[attribute_value.product_id].append(attribute_value)
+        return attribute_values
+
+    def create_line_attrs(self, order_line, attribute_values):
+        max_length = OrderLineAttribute._meta.get_field('value').max_length
+        return [
+            OrderLineAttribute(
+                line=order_line,
+                type=attribute_value.attribute.name,
+                value=str(attribute_value.value_as_text)[:max_length],
+            )
+            for attribute_value in attribute_values
+        ]
+
+    def update_stock_records(self, basket, basket_lines):
+        """
+        Take the whole basket out of stock with a single UPDATE and turn its
+        reservations into sold items. A stockrecord is only decremented when
+        the stock that isn't reserved by other baskets still covers the line,
+        so if fewer rows are updated than the basket needs, something has sold
+        out meanwhile.
+        """
+        if not basket_lines:
+            # the stored num_items can be out of date, and without any
+            # stockrecord the conditions below would match the whole table
+            raise ValueError("Empty baskets cannot be submitted")
+        reservations = StockReservation.objects.filter(basket=basket)
+        reserved = dict(reservations.values_list('stockrecord_id', 'quantity'))
+        quantities = defaultdict(int)
+        for basket_line in basket_lines:
+            quantities[basket_line.stockrecord_id] += basket_line.quantity
+        stockrecord_ids = set(quantities) | set(reserved)
+
+        enough_in_stock = Q()
+        for stockrecord_id in stockrecord_ids:
+            enough_in_stock |= Q(
+                pk=stockrecord_id,
+                num_in_stock__gte=F('num_allocated') - reserved.get(stockrecord_id, 0) + quantities[stockrecord_id],
+                num_allocated__gte=reserved.get(stockrecord_id, 0),
+            )
+
+        def per_stockrecord(values):
+            return Case(
+                *[When(pk=pk, then=Value(values.get(pk, 0))) for pk in stockrecord_ids],
+                output_field=PositiveIntegerField(),
+            )
+
+        updated = StockRecord.objects.filter(enough_in_stock).update(
+            num_in_stock=F('num_in_stock') - per_stockrecord(quantities),
+            num_allocated=F('num_allocated') - per_stockrecord(reserved),
+            date_updated=now(),
+        )
+        if updated != len(stockrecord_ids):
+            raise ValueError("Some products are not available in the requested quantity anymore")
+        reservations.delete()
+
+        # a queryset update sends no signals, so evict the catalog caches here
+        invalidate_on_commit(
+            (line.product_id, line.product.structure, line.product.parent_id) for line in basket_lines
+        )
@@ -4,13 +4,17 @@ from rest_framework import serializers
 from rest_framework.fields import empty
 
 from api.serializers.exceptions import FieldError
-from api.serializers.fields import AttributeValueField, DrillDownHyperlinkedIdentityField
-from api.serializers.utils import UpdateListSerializer
-from product.models import ProductClass, ProductAttribute, ProductAttributeValue, Product, ProductCategory, StockRecord
+from api.serializers.fields import AttributeDocumentField, AttributeValueField, DrillDownHyperlinkedIdentityField, \
+    HyperlinkedIdentityField, HyperlinkedRelatedField
+from api.serializers.utils import HyperlinkedModelSerializer, TimedSerializerMixin, UpdateListSerializer
+from api.signals import invalidate_on_commit, product_keys
+from product.models import ProductClass, ProductAttribute, ProductAttributeValue, Product, ProductCategory, \
+    StockRecord
+from product.signals import refresh_on_commit
 
 
 class CategorySerializer(serializers.ModelSerializer):
-    url = serializers.HyperlinkedIdentityField(view_name='category-detail')
+    url = HyperlinkedIdentityField(view_name='category-detail')
 
     class Meta:
         model = ProductCategory
@@ -18,6 +22,16 @@ class CategorySerializer(serializers.ModelSerializer):
 
 
 class ProductAttributeListSerializer(UpdateListSerializer):
+    natural_key = ('code',)
+
+    def after_bulk_write(self, rel_instance, items, deleted):
+        # the attribute documents embed the names and codes
+        product_ids = set(ProductAttributeValue.objects.filter(
+            attribute__in=[item.pk for item in items],
+        ).values_list('product_id', flat=True))
+        refresh_on_commit(documents=product_ids)
+        invalidate_on_commit(product_keys(Product.objects.filter(pk__in=product_ids)))
+
     def select_existing_item(self, manager, datum):
         try:
             return manager.get(product_class=datum['product_class'], code=datum['code'])
@@ -28,8 +42,8 @@ class ProductAttributeListSerializer(UpdateListSerializer):
         return None
 
 
-class ProductAttributeSerializer(serializers.HyperlinkedModelSerializer):
-    url = serializers.HyperlinkedIdentityField(view_name='admin-productattr-detail')
+class ProductAttributeSerializer(HyperlinkedModelSerializer):
+    url = HyperlinkedIdentityField(view_name='admin-productattr-detail')
     product_class = serializers.SlugRelatedField(
         slug_field='slug',
         queryset=ProductClass.objects.get_queryset(),
@@ -52,6 +66,24 @@ class ProductAttributeSerializer(serializers.HyperlinkedModelSerializer):
 
 
 class ProductAttributeValueListSerializer(UpdateListSerializer):
+    natural_key = ('attribute',)
+
+    def build_item(self, item, datum):
+        item = super().build_item(item, datum)
+        item.value = datum['value']
+        return item
+
+    def get_update_fields(self, data):
+        return super().get_update_fields(data) + ['value_integer', 'value_text']
+
+    def should_delete(self, datum):
+        # like ProductAttribute.save_value
+        return datum['value'] is None or datum['value'] == ''
+
+    def after_bulk_write(self, rel_instance, items, deleted):
+        refresh_on_commit(documents=[rel_instance.pk])
+        invalidate_on_commit([(rel_instance.pk, rel_instance.structure, rel_instance.parent_id)])
+
     def get_value(self, dictionary):
         values = super().get_value(dictionary)
         if values is empty:
@@ -129,10 +161,11 @@ class ProductStockRecordSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = StockRecord
-        fields = '__all__'
+        # the reservation counter changes with every basket, it would go stale in the catalog cache
+        exclude = ('num_allocated',)
 
 
-class BaseProductSerializer(serializers.ModelSerializer):
+class BaseProductSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     attributes = ProductAttributeValueSerializer(
         many=True,
         source='attribute_values',
@@ -150,8 +183,9 @@ class BaseProductSerializer(serializers.ModelSerializer):
 
 class ChildProductSerializer(BaseProductSerializer):
     "Serializer for child products"
-    url = serializers.HyperlinkedIdentityField(view_name='product-detail')
-    parent = serializers.HyperlinkedRelatedField(
+    url = HyperlinkedIdentityField(view_name='product-detail')
+    attributes = AttributeDocumentField()
+    parent = HyperlinkedRelatedField(
         view_name='product-detail',
         queryset=Product.objects.filter(structure=Product.PARENT),
     )
@@ -162,7 +196,8 @@ class ChildProductSerializer(BaseProductSerializer):
 
 
 class ProductSerializer(BaseProductSerializer):
-    url = serializers.HyperlinkedIdentityField(view_name='product-detail')
+    url = HyperlinkedIdentityField(view_name='product-detail')
+    attributes = AttributeDocumentField()
     children = ChildProductSerializer(many=True, required=False)
     stockrecords = ProductStockRecordSerializer(many=True, required=False)
 
@@ -172,12 +207,12 @@ class ProductSerializer(BaseProductSerializer):
 
 class AddProductSerializer(serializers.Serializer):
     quantity = serializers.IntegerField(required=True)
-    product = serializers.HyperlinkedRelatedField(
+    product = HyperlinkedRelatedField(
         view_name='product-detail',
         queryset=Product.objects,
         required=True,
     )
-    stockrecord = serializers.HyperlinkedRelatedField(
+    stockrecord = HyperlinkedRelatedField(
         view_name='product-stockrecord-detail',
         queryset=StockRecord.objects,
     )
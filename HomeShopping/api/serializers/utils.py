@@ -1,8 +1,30 @@
-from django.db.models import Manager
+from django.db import transaction
+from django.db.models import Manager, Q
 from rest_framework import serializers
 
+from api.instrumentation import serializer_timer
+from api.serializers.fields import HyperlinkedIdentityField, HyperlinkedRelatedField
+
+
+class TimedSerializerMixin:
+    # counts the rendering in the serializer time of the request, see api/instrumentation.py
+    def to_representation(self, instance):
+        with serializer_timer():
+            return super().to_representation(instance)
+
+
+class HyperlinkedModelSerializer(TimedSerializerMixin, serializers.HyperlinkedModelSerializer):
+    # the generated url and relation fields link through the URL templates too
+    serializer_url_field = HyperlinkedIdentityField
+    serializer_related_field = HyperlinkedRelatedField
+
 
 class UpdateListSerializer(serializers.ListSerializer):
+    # The fields identifying an item of the relation. Setting them enables the
+    # bulk mode of update: the existing items are fetched with one query and
+    # written with bulk_create/bulk_update, without calling the child serializer
+    # or model save, see after_bulk_write for the side effects.
+    natural_key = None
 
     def select_existing_item(self, manager, datum):
         pass
@@ -13,6 +35,9 @@ class UpdateListSerializer(serializers.ListSerializer):
     def update(self, instance, validated_data):
         assert isinstance(instance, Manager)
 
+        if self.natural_key is not None:
+            return self.bulk_update(instance, validated_data)
+
         items = []
         field_name, rel_instance = self.get_field_name_and_rel_instance(instance)
         for validated_datum in validated_data:
@@ -28,6 +53,94 @@ class UpdateListSerializer(serializers.ListSerializer):
 
         return items
 
+    def get_natural_key(self, item):
+        """
+        The natural key of a validated datum or of a model instance.
+        """
+        opts = self.child.Meta.model._meta
+        key = []
+        for name in self.natural_key:
+            field = opts.get_field(name)
+            if isinstance(item, dict):
+                value = item[name]
+                if field.is_relation:
+                    value = getattr(value, 'pk', value)
+            else:
+                value = getattr(item, field.attname)
+            key.append(value)
+        return tuple(key)
+
+    def select_existing_items(self, manager, data):
+        keys = {self.get_natural_key(datum) for datum in data}
+        condition = Q(pk__in=[])
+        for key in keys:
+            condition |= Q(**dict(zip(self.natural_key, key)))
+        return {self.get_natural_key(item): item for item in manager.filter(condition)}
+
+    def build_item(self, item, datum):
+        """
+        Assign the validated values to the (new or existing) model instance.
+        """
+        for field in item._meta.concrete_fields:
+            if field.name in datum and not field.primary_key:
+                setattr(item, field.name, datum[field.name])
+        return item
+
+    def get_update_fields(self, data):
+        fields = set()
+        for field in self.child.Meta.model._meta.concrete_fields:
+            if field.primary_key:
+                continue
+            if any(field.name in datum for datum in data) or getattr(field, 'auto_now', False):
+                fields.add(field.name)
+        return sorted(fields)
+
+    def should_delete(self, datum):
+        """
+        Return True when the datum removes the existing item instead.
+        """
+        return False
+
+    def after_bulk_write(self, rel_instance, items, deleted):
+        """
+        Called with the written items, as the signals of model save aren't sent.
+        """
+
+    def bulk_update(self, manager, validated_data):
+        field_name, rel_instance = self.get_field_name_and_rel_instance(manager)
+        data = [dict(validated_datum, **{field_name: rel_instance}) for validated_datum in validated_data]
+        existing = self.select_existing_items(manager, data)
+
+        items, created, deleted = {}, {}, []
+        for datum in data:
+            key = self.get_natural_key(datum)
+            item = existing.get(key)
+            if self.should_delete(datum):
+                existing.pop(key, None)
+                items.pop(key, None)
+                created.pop(key, None)
+                if item is not None and not item._state.adding:
+                    deleted.append(item.pk)
+                continue
+            if item is None:
+                item = existing[key] = created[key] = manager.model()
+            items[key] = self.build_item(item, datum)
+
+        updated = [item for key, item in items.items() if key not in created]
+        for item in updated:
+            for field in item._meta.concrete_fields:
+                if getattr(field, 'auto_now', False):
+                    field.pre_save(item, add=False)
+        with transaction.atomic():
+            if deleted:
+                manager.model.objects.filter(pk__in=deleted).delete()
+            manager.model.objects.bulk_create(created.values())
+            if updated:
+                manager.model.objects.bulk_update(updated, self.get_update_fields(data))
+            items = list(items.values())
+            self.after_bulk_write(rel_instance, items, deleted)
+        return items
+
 
 class UpdateRelationMixin:
     def update_relation(self, name, manager, values):
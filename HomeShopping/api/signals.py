@@ -0,0 +1,70 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from api.cache import PRODUCT_FACETS, PRODUCT_SEARCH, bump_namespace_version, invalidate_products
+from product.models import Product, ProductAttribute, ProductAttributeValue, ProductCategory, ProductClass, \
+    StockRecord
+
+
+def product_keys(queryset):
+    return list(queryset.values_list('id', 'structure', 'parent_id'))
+
+
+def invalidate_on_commit(products):
+    """
+    Evict only once the write is visible to other connections, otherwise a
+    concurrent reader could re-cache the old rows under the new version.
+    """
+    products = list(products)
+    if products:
+        transaction.on_commit(lambda: invalidate_products(products))
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def product_changed(sender, instance, **kwargs):
+    invalidate_on_commit({
+        (instance.pk, instance.structure, instance.parent_id),
+        (
+            instance.pk,
+            getattr(instance, '_loaded_structure', None) or instance.structure,
+            getattr(instance, '_loaded_parent_id', instance.parent_id),
+        ),
+    })
+
+
+@receiver(post_save, sender=StockRecord)
+@receiver(post_delete, sender=StockRecord)
+@receiver(post_save, sender=ProductAttributeValue)
+@receiver(post_delete, sender=ProductAttributeValue)
+def product_relation_changed(sender, instance, **kwargs):
+    invalidate_on_commit(product_keys(Product.objects.filter(pk=instance.product_id)))
+
+
+@receiver(post_save, sender=ProductAttribute)
+@receiver(pre_delete, sender=ProductAttribute)
+def attribute_changed(sender, instance, **kwargs):
+    invalidate_on_commit(product_keys(Product.objects.filter(attribute_values__attribute=instance)))
+
+
+@receiver(post_save, sender=ProductClass)
+@receiver(pre_delete, sender=ProductClass)
+def product_class_changed(sender, instance, **kwargs):
+    invalidate_on_commit(product_keys(Product.objects.filter(product_class=instance)))
+
+
+@receiver(post_save, sender=ProductCategory)
+def category_saved(sender, instance, **kwargs):
+    # the facets show the category titles and products are found by them
+    def invalidate():
+        bump_namespace_version(PRODUCT_FACETS)
+        bump_namespace_version(PRODUCT_SEARCH)
+    transaction.on_commit(invalidate)
+
+
+@receiver(pre_delete, sender=ProductCategory)
+def category_deleted(sender, instance, **kwargs):
+    # Products only render the category id, so only a delete (which nulls
+    # it through SET_NULL without sending Product signals) changes them.
+    invalidate_on_commit(product_keys(Product.objects.filter(category=instance)))
@@ -1,19 +1,40 @@
 from celery import shared_task
 
-from django.core.cache import cache
-from django.db.models import Prefetch
+from django.urls import reverse
+from rest_framework.test import APIRequestFactory
 
-from product.models import Product, ProductAttributeValue
+from api.views.product import ProductList
+from basket.models import StockReservation
+from HomeShopping import settings
+from product.models import Product
+from product.search import rebuild_index
 
 
 @shared_task
 def bar():
-    qs = Product.objects.all().select_related('product_class').prefetch_related(
-        'stockrecords',
-        Prefetch('attribute_values', queryset=ProductAttributeValue.objects.select_related('attribute')),
-        Prefetch('children', queryset=Product.objects.all().prefetch_related(
-            Prefetch('attribute_values', queryset=ProductAttributeValue.objects.all().select_related('attribute')),
-        )),
-    )
-    product_list_cache_name = 'p_list_cache'
-    cache.set(product_list_cache_name, qs, 130)
+    """
+    Pre-render the first page of the product list, unfiltered and for every
+    structure, so the catalog cache is warm before the first visitor arrives.
+    """
+    factory = APIRequestFactory()
+    view = ProductList.as_view()
+    structures = [None] + [structure for structure, __ in Product.STRUCTURE_CHOICES]
+    for structure in structures:
+        params = {'structure': structure} if structure else {}
+        view(factory.get(reverse('product-list'), params, HTTP_HOST=settings.MY_CATALOG_CACHE_WARM_HOST))
+
+
+@shared_task
+def release_expired_stock_reservations():
+    """
+    Give the stock of abandoned baskets back to the shop.
+    """
+    return StockReservation.objects.release_expired()
+
+
+@shared_task
+def rebuild_search_index():
+    """
+    Index the whole catalog again, eg. after products were imported with bulk queries.
+    """
+    return rebuild_index()
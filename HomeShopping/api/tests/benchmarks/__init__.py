@@ -0,0 +1,17 @@
+"""
+Benchmarks of the hot API paths, run offline against SQLite and the
+local-memory cache::
+
+    python manage.py test api.tests.benchmarks.bench_catalog api.tests.benchmarks.bench_basket
+
+The modules aren't named test*.py, so the unit test runs leave them out.
+
+Every benchmark records its wall time, query count and peak memory into
+$BENCHMARK_OUTPUT, by default homeshopping-benchmarks.json in the temporary
+directory. The committed baseline.json is updated by pointing
+$BENCHMARK_OUTPUT at it, and two of those files are compared with::
+
+    python -m api.tests.benchmarks.compare api/tests/benchmarks/baseline.json new.json
+
+$BENCHMARK_REPEAT sets how many timed runs each benchmark makes.
+"""
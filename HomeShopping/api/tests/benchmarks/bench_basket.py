@@ -0,0 +1,89 @@
+from itertools import cycle
+
+from django.contrib.auth.models import User
+from django.urls import reverse
+
+from api.tests.benchmarks.utils import BenchmarkTest
+from basket.models import Basket
+from product.models import StockRecord
+
+
+LINE_COUNTS = (1, 10, 100)
+MERGED_LINES = 10
+
+
+class BasketBenchmark(BenchmarkTest):
+
+    def setUp(self):
+        super().setUp()
+        self.grow_catalog(100)
+        self.stockrecords = list(
+            StockRecord.objects.filter(partner_sku__startswith='bench-').select_related('product').order_by('pk'),
+        )
+
+    def add_product(self, stockrecord, quantity=1):
+        response = self.post(
+            'add-product',
+            product='http://testserver%s' % reverse('product-detail', args=(stockrecord.product_id,)),
+            stockrecord='http://testserver%s' % reverse(
+                'product-stockrecord-detail', kwargs={'product_pk': stockrecord.product_id, 'pk': stockrecord.pk},
+            ),
+            quantity=quantity,
+        )
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_add_to_basket(self):
+        self.login('nobody', 'nobody')
+        stockrecords = cycle(self.stockrecords)
+        self.measure('add_to_basket', self.add_product, setup=lambda: next(stockrecords))
+
+    def test_merge_basket_on_login(self):
+        def setup():
+            self.client.logout()
+            for stockrecord in self.stockrecords[:MERGED_LINES]:
+                self.add_product(stockrecord)
+            self.login('nobody', 'nobody')
+
+        def run(state):
+            response = self.get('api-basket')
+            self.assertEqual(response.status_code, 200)
+
+        self.measure('merge_basket_on_login', run, setup=setup, lines=MERGED_LINES)
+
+    def test_line_update(self):
+        self.login('nobody', 'nobody')
+        self.add_product(self.stockrecords[0])
+        line_url = self.get(self.get('api-basket').data['lines']).data[0]['url']
+        quantities = cycle((2, 1))
+
+        def run(quantity):
+            response = self.patch(line_url, quantity=quantity)
+            self.assertEqual(response.status_code, 200)
+
+        self.measure('line_update', run, setup=lambda: next(quantities))
+
+    def test_checkout(self):
+        user = User.objects.get(username='nobody')
+        self.login('nobody', 'nobody')
+        for lines in LINE_COUNTS:
+            def setup():
+                basket = Basket.objects.create(owner=user)
+                for stockrecord in self.stockrecords[:lines]:
+                    basket.add_product(stockrecord.product, stockrecord, 1)
+                return basket
+
+            def run(basket):
+                response = self.post(
+                    'api-checkout',
+                    basket='http://testserver%s' % reverse('basket-detail', args=(basket.pk,)),
+                    shipping_address={
+                        'first_name': 'Bench',
+                        'last_name': 'Mark',
+                        'line1': 'Benchstreet 1',
+                        'phone_number': '+31 26 370 4887',
+                    },
+                )
+                self.assertEqual(response.status_code, 200, response.content)
+
+            self.measure('checkout', run, setup=setup, lines=lines)
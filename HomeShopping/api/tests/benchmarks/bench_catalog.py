@@ -0,0 +1,35 @@
+from django.core.cache import cache
+from django.urls import reverse
+
+from api.tests.benchmarks.utils import BenchmarkTest
+from product.models import Product
+
+
+CATALOG_SIZES = (10, 100, 1000)
+
+
+class CatalogBenchmark(BenchmarkTest):
+
+    def get_ok(self, url):
+        response = self.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_product_list(self):
+        url = '%s?page_size=50' % reverse('product-list')
+        for size in CATALOG_SIZES:
+            self.grow_catalog(size)
+            self.measure('product_list', lambda state: self.get_ok(url), setup=cache.clear, products=size)
+            self.measure(
+                'product_list_cached',
+                lambda state: self.get_ok(url),
+                setup=lambda: self.get_ok(url),
+                products=size,
+            )
+
+    def test_product_detail(self):
+        for size in CATALOG_SIZES:
+            self.grow_catalog(size)
+            # a parent, it embeds its children
+            url = reverse('product-detail', args=(Product.objects.get(article='bench-0').pk,))
+            self.measure('product_detail', lambda state: self.get_ok(url), setup=cache.clear, products=size)
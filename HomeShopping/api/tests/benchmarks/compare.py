@@ -0,0 +1,64 @@
+"""
+Compare two benchmark result files, eg. of the base and the head of a branch::
+
+    python -m api.tests.benchmarks.compare old.json new.json [--threshold 0.2]
+
+Exits with 1 when a benchmark runs more queries, or its median wall time or
+peak memory grew by more than the threshold.
+"""
+import argparse
+import json
+import sys
+
+
+def load(path):
+    with open(path) as results:
+        return json.load(results)['benchmarks']
+
+
+def compare(old, new, threshold):
+    regressions = []
+    rows = []
+    for name in sorted(set(old) | set(new)):
+        if name not in old or name not in new:
+            rows.append((name, 'only in %s' % ('new' if name in new else 'old'), '', ''))
+            continue
+        before, after = old[name], new[name]
+        time_ratio = after['wall_time']['median'] / before['wall_time']['median']
+        memory_ratio = after['peak_memory'] / max(before['peak_memory'], 1)
+        if (
+            after['queries'] > before['queries']
+            or time_ratio > 1 + threshold
+            or memory_ratio > 1 + threshold
+        ):
+            regressions.append(name)
+        rows.append((
+            name,
+            '%s -> %s' % (before['queries'], after['queries']),
+            '%+.0f%%' % ((time_ratio - 1) * 100),
+            '%+.0f%%' % ((memory_ratio - 1) * 100),
+        ))
+    return rows, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('old')
+    parser.add_argument('new')
+    parser.add_argument('--threshold', type=float, default=0.2, help="Allowed relative growth of time and memory")
+    args = parser.parse_args(argv)
+
+    rows, regressions = compare(load(args.old), load(args.new), args.threshold)
+    header = ('benchmark', 'queries', 'median time', 'peak memory')
+    widths = [max(len(row[i]) for row in rows + [header]) for i in range(len(header))]
+    for row in [header] + rows:
+        flag = ' !' if row[0] in regressions else ''
+        print('  '.join(cell.ljust(width) for cell, width in zip(row, widths)).rstrip() + flag)
+    if regressions:
+        print("\n%s regressions" % len(regressions))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,147 @@
+import json
+import os
+import platform
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+import django
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+
+from api.importer import CatalogImporter
+from api.tests.utils import APITest
+
+
+# the committed baseline.json is only rewritten when asked for with $BENCHMARK_OUTPUT
+OUTPUT = os.environ.get('BENCHMARK_OUTPUT', os.path.join(tempfile.gettempdir(), 'homeshopping-benchmarks.json'))
+REPEAT = int(os.environ.get('BENCHMARK_REPEAT', 5))
+
+
+def write_results(results):
+    """
+    Merge the results into the output file, so the benchmark classes can
+    be run separately.
+    """
+    try:
+        with open(OUTPUT) as output:
+            data = json.load(output)
+    except (OSError, ValueError):
+        data = {}
+    data['environment'] = {
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': connection.vendor,
+        'repeat': REPEAT,
+    }
+    data.setdefault('benchmarks', {}).update(results)
+    data['benchmarks'] = dict(sorted(data['benchmarks'].items()))
+    with open(OUTPUT, 'w') as output:
+        json.dump(data, output, indent=2)
+        output.write('\n')
+
+
+def catalog_records(start, stop, children=2):
+    """
+    Feed records for products start..stop: every fourth one a parent with
+    `children` children, the others standalone products with two stockrecords.
+    """
+    for i in range(start, stop):
+        if i % 4 == 0:
+            yield {
+                'article': 'bench-%s' % i,
+                'structure': 'parent',
+                'title': 'Bench parent %s' % i,
+                'product_class': 't-shirts',
+                'category': 'male',
+            }
+            for j in range(children):
+                yield {
+                    'article': 'bench-%s-%s' % (i, j),
+                    'structure': 'child',
+                    'parent': 'bench-%s' % i,
+                    'attributes': {'size': 'S%s' % j, 'color': 'red'},
+                    'stockrecords': [{'partner_sku': 'bench-%s-%s' % (i, j), 'price': 10, 'num_in_stock': 10 ** 6}],
+                }
+        else:
+            yield {
+                'article': 'bench-%s' % i,
+                'title': 'Bench product %s' % i,
+                'description': 'A product to benchmark the catalog with',
+                'product_class': 't-shirts',
+                'category': 'male',
+                'attributes': {'size': 'M', 'color': 'blue'},
+                'stockrecords': [
+                    {'partner_sku': 'bench-%s-%s' % (i, j), 'price': 10 + j, 'num_in_stock': 10 ** 6}
+                    for j in range(2)
+                ],
+            }
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class BenchmarkTest(APITest):
+    results = None
+    catalog_size = 0
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.results = {}
+
+    @classmethod
+    def tearDownClass(cls):
+        if cls.results:
+            write_results(cls.results)
+        super().tearDownClass()
+
+    def grow_catalog(self, size):
+        """
+        Import bench products until the catalog holds about `size` top-level products.
+        """
+        if size > self.catalog_size:
+            importer = CatalogImporter(User.objects.get(username='admin'))
+            result = importer.run(enumerate(catalog_records(self.catalog_size, size), 1))
+            self.assertEqual(result.failed, 0, result.errors)
+            self.catalog_size = size
+
+    def measure(self, name, run, setup=None, **params):
+        """
+        Time `run` REPEAT times, then run it once more to count its queries
+        and peak memory. `setup` runs untimed before every run and its
+        return value is passed to `run`.
+        """
+        def prepare():
+            return setup() if setup is not None else None
+
+        timings = []
+        for __ in range(REPEAT):
+            state = prepare()
+            start = time.perf_counter()
+            run(state)
+            timings.append(time.perf_counter() - start)
+
+        state = prepare()
+        tracemalloc.start()
+        try:
+            with CaptureQueriesContext(connection) as queries:
+                run(state)
+            __, peak_memory = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        key = name
+        if params:
+            key += '[%s]' % ','.join('%s=%s' % item for item in sorted(params.items()))
+        self.results[key] = {
+            'wall_time': {
+                'min': min(timings),
+                'median': statistics.median(timings),
+                'max': max(timings),
+            },
+            'queries': len(queries),
+            'peak_memory': peak_memory,
+        }
+        return self.results[key]
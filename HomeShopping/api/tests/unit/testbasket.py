@@ -1,8 +1,23 @@
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+
+from django.core.exceptions import PermissionDenied
+from django.core.management import call_command
+from django.core.signing import BadSignature
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils.timezone import now
 
 from api.tests.utils import APITest
+from HomeShopping import settings
 
-from basket.models import Basket
+from basket import storage
+from basket.middleware import sign_basket_id, unsign_basket_hash
+from basket.models import Basket, BasketLine, StockReservation
+from product.models import Product, StockRecord
 
 
 class TestBasket(APITest):
@@ -144,6 +159,34 @@ class TestBasket(APITest):
         self.response = self.get(line0url)
         self.response.assertStatusEqual(403)
 
+    def test_anonymous_line_permissions_only_need_the_basket_id(self):
+        self.response = self.post(
+            'add-product',
+            product='http://testserver/api/products/1/',
+            quantity=4,
+            stockrecord='http://testserver/api/products/1/stockrecords/1/',
+        )
+        self.response = self.get(self.response['lines'])
+        line0url = self.response.body[0]['url']
+
+        # basket, line and its stockrecord, the request basket isn't loaded
+        with self.assertNumQueries(3):
+            self.response = self.get(line0url)
+        self.response.assertStatusEqual(200)
+
+        self.client.cookies[settings.MY_BASKET_COOKIE_OPEN] = '1:forged'
+        self.response = self.get(line0url)
+        self.response.assertStatusEqual(403)
+
+    def test_basket_cookie_is_verified_once(self):
+        basket_hash = sign_basket_id(1)
+        unsign_basket_hash.cache_clear()
+        self.assertEqual(unsign_basket_hash(basket_hash), 1)
+        self.assertEqual(unsign_basket_hash(basket_hash), 1)
+        self.assertEqual(unsign_basket_hash.cache_info().hits, 1)
+        with self.assertRaises(BadSignature):
+            unsign_basket_hash('1:forged')
+
     def test_total_price(self):
         self.response = self.post(
             'add-product',
@@ -275,6 +318,110 @@ class TestBasket(APITest):
         self.response.assertStatusEqual(200)
         self.response.assertValueEqual('total_price', '0.00')
 
+    def merge_queries(self, conflicting, add_quantities):
+        """
+        Merge a basket into one holding `conflicting` of its reserved lines,
+        and return the number of queries the merge took.
+        """
+        product = Product.objects.get(pk=1)
+        target = Basket.objects.create()
+        source = Basket.objects.create()
+        stockrecords = [
+            StockRecord.objects.create(
+                partner_sku='merge-%s-%s' % (target.pk, i), product=product, num_in_stock=10, price=1, owner_id=4,
+            )
+            for i in range(conflicting)
+        ]
+        for basket, quantity in ((target, 3), (source, 2)):
+            for stockrecord in stockrecords:
+                basket.add_product(product, stockrecord, quantity)
+                StockReservation.objects.reserve(basket, stockrecord, quantity)
+        # a line only the merged basket has is moved with its reservation
+        only_in_source = StockRecord.objects.get(pk=1)
+        source.add_product(product, only_in_source, 2)
+        StockReservation.objects.reserve(source, only_in_source, 2)
+
+        with CaptureQueriesContext(connection) as queries:
+            target.merge(source, add_quantities=add_quantities)
+
+        quantity = 5 if add_quantities else 3
+        self.assertEqual(target.lines.count(), conflicting + 1)
+        self.assertEqual(target.num_items, quantity * conflicting + 2)
+        self.assertEqual(source.lines.count(), 0)
+        self.assertEqual(source.num_items, 0)
+        self.assertEqual(Basket.objects.get(pk=source.pk).status, Basket.MERGED)
+        self.assertFalse(StockReservation.objects.filter(basket=source).exists())
+        for stockrecord in stockrecords + [only_in_source]:
+            line_quantity = target.lines.get(stockrecord=stockrecord).quantity
+            self.assertEqual(StockReservation.objects.reserved_quantity(target, stockrecord), line_quantity)
+            stockrecord.refresh_from_db()
+            self.assertEqual(stockrecord.num_allocated, line_quantity)
+        StockReservation.objects.filter(basket=target).delete()
+        StockRecord.objects.filter(pk=1).update(num_allocated=0)
+        return len(queries)
+
+    def test_merge_moves_lines_in_a_fixed_number_of_queries(self):
+        for add_quantities in (False, True):
+            with self.subTest(add_quantities=add_quantities):
+                self.assertEqual(
+                    self.merge_queries(2, add_quantities),
+                    self.merge_queries(10, add_quantities),
+                )
+
+    def test_basket_storage_serves_anonymous_basket(self):
+        with mock.patch.object(settings, 'MY_BASKET_STORAGE', 'cache'):
+            self.response = self.post(
+                'add-product',
+                product='http://testserver/api/products/1/',
+                quantity=2,
+                stockrecord='http://testserver/api/products/1/stockrecords/1/',
+            )
+            self.response.assertStatusEqual(200)
+            self.response = self.get('api-basket')
+            self.response.assertValueEqual('total_price', '20.00')
+
+            with self.assertNumQueries(0):
+                self.response = self.get('api-basket')
+            self.response.assertValueEqual('id', 1)
+            self.response.assertValueEqual('total_price', '20.00')
+
+            # a change evicts the stored copy
+            with self.captureOnCommitCallbacks(execute=True):
+                self.response = self.post(
+                    'add-product',
+                    product='http://testserver/api/products/1/',
+                    quantity=1,
+                    stockrecord='http://testserver/api/products/1/stockrecords/1/',
+                )
+            # reloaded from the database, with its lines
+            with self.assertNumQueries(2):
+                self.response = self.get('api-basket')
+            self.response.assertValueEqual('total_price', '30.00')
+
+    def test_stale_basket_copies_are_not_stored(self):
+        with mock.patch.object(settings, 'MY_BASKET_STORAGE', 'cache'):
+            basket = Basket.objects.create()
+            stale = Basket.objects.get(pk=basket.pk)
+            # a checkout freezes the basket while a request still holds the open copy
+            with self.captureOnCommitCallbacks(execute=True):
+                basket.freeze()
+            storage.store(stale)
+            self.assertIsNone(storage.load(basket.pk))
+
+    def test_add_product_to_a_basket_frozen_meanwhile(self):
+        product = Product.objects.get(pk=1)
+        stockrecord = StockRecord.objects.get(pk=1)
+        for supports_upsert in (True, False):
+            with self.subTest(supports_upsert=supports_upsert):
+                basket = Basket.objects.create()
+                stale = Basket.objects.get(pk=basket.pk)
+                basket.freeze()
+                with mock.patch.object(BasketLine.objects, 'supports_upsert', return_value=supports_upsert):
+                    with self.assertRaises(PermissionDenied):
+                        stale.add_product(product, stockrecord, 1)
+                self.assertFalse(basket.lines.exists())
+                self.assertEqual(Basket.objects.get(pk=basket.pk).num_items, 0)
+
     def test_add_a_product_with_different_stockrecords(self):
         self.login('nobody', 'nobody')
         self.response = self.post(
@@ -304,3 +451,218 @@ class TestBasket(APITest):
         self.assertEqual(first_line['price'], '20.00')
         self.assertEqual(second_line['quantity'], 2)
         self.assertEqual(second_line['price'], '10.00')
+
+    def test_add_product_reserves_stock(self):
+        self.response = self.post(
+            'add-product',
+            product='http://testserver/api/products/1/',
+            quantity=8,
+            stockrecord='http://testserver/api/products/1/stockrecords/1/',
+        )
+        self.response.assertStatusEqual(200)
+        self.assertEqual(StockRecord.objects.get(pk=1).num_allocated, 8)
+
+        # only 2 items are left for everybody else
+        self.login('nobody', 'nobody')
+        self.response = self.post(
+            'add-product',
+            product='http://testserver/api/products/1/',
+            quantity=3,
+            stockrecord='http://testserver/api/products/1/stockrecords/1/',
+        )
+        self.response.assertStatusEqual(406)
+        self.response.assertValueEqual('reason', 'This quantity is not allowed.')
+
+        self.response = self.post(
+            'add-product',
+            product='http://testserver/api/products/1/',
+            quantity=2,
+            stockrecord='http://testserver/api/products/1/stockrecords/1/',
+        )
+        self.response.assertStatusEqual(200)
+        self.assertEqual(StockRecord.objects.get(pk=1).num_allocated, 10)
+
+        self.response = self.post(
+            'add-product',
+            product='http://testserver/api/products/1/',
+            quantity=1,
+            stockrecord='http://testserver/api/products/1/stockrecords/1/',
+        )
+        self.response.assertStatusEqual(406)
+        self.response.assertValueEqual('reason', 'This product is not available to buy now')
+
+    def test_basket_line_changes_update_reservation(self):
+        self.login('nobody', 'nobody')
+        self.response = self.post(
+            'add-product',
+            product='http://testserver/api/products/1/',
+            quantity=5,
+            stockrecord='http://testserver/api/products/1/stockrecords/1/',
+        )
+        self.response = self.get('api-basket')
+        self.response = self.get(self.response['lines'])
+        line_url = self.response[0]['url']
+
+        self.response = self.patch(line_url, quantity=2)
+        self.response.assertStatusEqual(200)
+        self.assertEqual(StockRecord.objects.get(pk=1).num_allocated, 2)
+
+        self.response = self.delete(line_url)
+        self.response.assertStatusEqual(204)
+        self.assertEqual(StockRecord.objects.get(pk=1).num_allocated, 0)
+        self.assertEqual(StockReservation.objects.count(), 0)
+
+    def test_expired_reservations_are_released(self):
+        self.response = self.post(
+            'add-product',
+            product='http://testserver/api/products/1/',
+            quantity=4,
+            stockrecord='http://testserver/api/products/1/stockrecords/1/',
+        )
+        self.response.assertStatusEqual(200)
+        self.assertEqual(StockReservation.objects.release_expired(), 0)
+
+        StockReservation.objects.update(date_expires=now() - timedelta(seconds=1))
+        self.assertEqual(StockReservation.objects.release_expired(), 1)
+        self.assertEqual(StockRecord.objects.get(pk=1).num_allocated, 0)
+        self.assertEqual(StockReservation.objects.count(), 0)
+
+    def test_deleted_baskets_release_their_reservations(self):
+        self.login('nobody', 'nobody')
+        for stockrecord, quantity in ((1, 4), (2, 3)):
+            self.response = self.post(
+                'add-product',
+                product='http://testserver/api/products/1/',
+                quantity=quantity,
+                stockrecord='http://testserver/api/products/1/stockrecords/%s/' % stockrecord,
+            )
+            self.response.assertStatusEqual(200)
+        self.login('admin', 'admin')
+        self.response = self.post(
+            'add-product',
+            product='http://testserver/api/products/1/',
+            quantity=1,
+            stockrecord='http://testserver/api/products/1/stockrecords/1/',
+        )
+        self.response.assertStatusEqual(200)
+        self.assertEqual(StockRecord.objects.get(pk=1).num_allocated, 5)
+
+        Basket.objects.get(owner_id=2).delete()
+        self.assertEqual(StockRecord.objects.get(pk=1).num_allocated, 1)
+        self.assertEqual(StockRecord.objects.get(pk=2).num_allocated, 0)
+        self.assertEqual(StockReservation.objects.count(), 1)
+
+    def test_deleted_stockrecords_update_the_basket_totals(self):
+        self.login('nobody', 'nobody')
+        for stockrecord, quantity in ((1, 3), (2, 2)):
+            self.post(
+                'add-product',
+                product='http://testserver/api/products/1/',
+                quantity=quantity,
+                stockrecord='http://testserver/api/products/1/stockrecords/%s/' % stockrecord,
+            )
+        self.assertEqual(Basket.objects.get(owner_id=2).num_items, 5)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            StockRecord.objects.get(pk=2).delete()
+        basket = Basket.objects.get(owner_id=2)
+        self.assertEqual(basket.num_items, 3)
+        self.assertEqual(basket.total, Decimal('30.00'))
+        self.response = self.get('api-basket')
+        self.response.assertValueEqual('total_price', '30.00')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.get(pk=1).delete()
+        basket = Basket.objects.get(owner_id=2)
+        self.assertEqual(basket.num_items, 0)
+        self.assertEqual(basket.total, Decimal('0.00'))
+
+    def test_basket_totals_are_maintained(self):
+        self.login('nobody', 'nobody')
+        self.post(
+            'add-product',
+            product='http://testserver/api/products/1/',
+            quantity=3,
+            stockrecord='http://testserver/api/products/1/stockrecords/1/',
+        )
+        self.post(
+            'add-product',
+            product='http://testserver/api/products/1/',
+            quantity=2,
+            stockrecord='http://testserver/api/products/1/stockrecords/2/',
+        )
+        basket = Basket.objects.get(owner_id=2)
+        self.assertEqual(basket.num_items, 5)
+        self.assertEqual(basket.total, Decimal('40.00'))
+
+        self.response = self.get(reverse('basket-lines-list', args=(basket.pk,)))
+        line_url = self.response[0]['url']
+        self.patch(line_url, quantity=1)
+        basket.refresh_from_db()
+        self.assertEqual((basket.num_items, basket.total), (3, Decimal('20.00')))
+
+        self.delete(line_url)
+        basket.refresh_from_db()
+        self.assertEqual((basket.num_items, basket.total), (2, Decimal('10.00')))
+
+        # a new price is reflected in open baskets
+        stockrecord = StockRecord.objects.get(pk=2)
+        stockrecord.price = 7
+        stockrecord.save()
+        basket.refresh_from_db()
+        self.assertEqual(basket.total, Decimal('14.00'))
+
+    def test_check_basket_totals_command(self):
+        self.post(
+            'add-product',
+            product='http://testserver/api/products/1/',
+            quantity=3,
+            stockrecord='http://testserver/api/products/1/stockrecords/1/',
+        )
+        Basket.objects.update(num_items=1, total=0)
+
+        out = StringIO()
+        call_command('check_basket_totals', stdout=out)
+        self.assertIn('1 inconsistent baskets', out.getvalue())
+        self.assertEqual(Basket.objects.get().num_items, 1)
+
+        call_command('check_basket_totals', '--fix', stdout=StringIO())
+        basket = Basket.objects.get()
+        self.assertEqual((basket.num_items, basket.total), (3, Decimal('30.00')))
+
+        out = StringIO()
+        call_command('check_basket_totals', stdout=out)
+        self.assertIn('consistent', out.getvalue())
+
+    def test_add_product_upserts_a_single_line(self):
+        basket = Basket.objects.create()
+        product = Product.objects.get(pk=1)
+        stockrecord = StockRecord.objects.get(pk=1)
+
+        line, created = basket.add_product(product, stockrecord, 2)
+        self.assertTrue(created)
+        # the upsert and the totals update
+        with self.assertNumQueries(2):
+            line, created = basket.add_product(product, stockrecord, 3)
+        self.assertFalse(created)
+
+        self.assertEqual(line.quantity, 5)
+        self.assertEqual(BasketLine.objects.filter(basket=basket).count(), 1)
+        basket.refresh_from_db()
+        self.assertEqual((basket.num_items, basket.total), (5, Decimal('50.00')))
+
+    def test_add_product_without_upsert_support(self):
+        basket = Basket.objects.create()
+        product = Product.objects.get(pk=1)
+        stockrecord = StockRecord.objects.get(pk=1)
+
+        with mock.patch.object(connection.features, 'supports_update_conflicts_with_target', False), \
+                CaptureQueriesContext(connection) as queries:
+            basket.add_product(product, stockrecord, 2)
+            line, created = basket.add_product(product, stockrecord, 3)
+        self.assertFalse(any('ON CONFLICT' in query['sql'] for query in queries))
+        self.assertFalse(created)
+        self.assertEqual(line.quantity, 5)
+        self.assertEqual(BasketLine.objects.filter(basket=basket).count(), 1)
+        basket.refresh_from_db()
+        self.assertEqual((basket.num_items, basket.total), (5, Decimal('50.00')))
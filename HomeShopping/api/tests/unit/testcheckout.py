@@ -1,11 +1,14 @@
 from decimal import Decimal
 
 from django.contrib.auth.models import User
+from django.db import connection
 from django.test.client import RequestFactory
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from basket.models import Basket
-from order.models import Order, ShippingAddress
+from order.models import Order, OrderLineAttribute, ShippingAddress
+from product.models import Product, ProductAttribute, StockRecord
 from api.serializers.checkout import CheckoutSerializer
 from api.tests.utils import APITest
 
@@ -141,8 +144,8 @@ class CheckoutTest(APITest):
         self.test_checkout()
         self.response = self.get('order-list')
         self.response.assertStatusEqual(200)
-        self.assertEqual(len(self.response), 1, "An order should have been created.")
-        order_line = self.response[0]['lines']
+        self.assertEqual(len(self.response['results']), 1, "An order should have been created.")
+        order_line = self.response['results'][0]['lines']
         self.assertEqual(len(order_line), 1)
 
         order_line_url = order_line[0]['url']
@@ -235,3 +238,83 @@ class CheckoutTest(APITest):
 
         self.response = self.get('http://testserver/api/products/1/stockrecords/2/')
         self.response.assertValueEqual('num_in_stock', 3)
+        self.assertNotIn('num_allocated', self.response.body)
+        # the reservations of the basket are consumed by the order
+        self.assertEqual(StockRecord.objects.get(pk=2).num_allocated, 0)
+
+    def test_checkout_rejects_sold_out_stockrecords(self):
+        self.login('nobody', 'nobody')
+        self.response = self.post(
+            'add-product',
+            product='http://testserver/api/products/1/',
+            quantity=4,
+            stockrecord='http://testserver/api/products/1/stockrecords/1/',
+        )
+        self.response.assertStatusEqual(200)
+        self.response = self.get('api-basket')
+        payload = self._get_common_payload(self.response['url'])
+
+        # somebody else bought most of the stock in the meantime
+        StockRecord.objects.filter(pk=1).update(num_in_stock=3)
+
+        self.response = self.post('api-checkout', **payload)
+        self.response.assertStatusEqual(406)
+        self.assertEqual(Order.objects.count(), 0)
+        self.assertEqual(StockRecord.objects.get(pk=1).num_in_stock, 3)
+
+    def test_checkout_copies_product_attributes(self):
+        product = Product.objects.get(pk=1)
+        ProductAttribute.objects.get(code='size', product_class=product.product_class).save_value(product, 'XL')
+        ProductAttribute.objects.get(code='color', product_class=product.product_class).save_value(product, 'red')
+
+        self.login('nobody', 'nobody')
+        self.response = self.post(
+            'add-product',
+            product='http://testserver/api/products/1/',
+            quantity=1,
+            stockrecord='http://testserver/api/products/1/stockrecords/1/',
+        )
+        self.response = self.get('api-basket')
+        payload = self._get_common_payload(self.response['url'])
+        self.response = self.post('api-checkout', **payload)
+        self.response.assertStatusEqual(200)
+
+        attributes = OrderLineAttribute.objects.filter(line__order__number=self.response['number'])
+        self.assertEqual(
+            sorted(attributes.values_list('type', 'value')),
+            [('color', 'red'), ('size', 'XL')],
+        )
+
+    def checkout_queries(self, username, stockrecords):
+        self.login(username, username)
+        for stockrecord in stockrecords:
+            self.response = self.post(
+                'add-product',
+                product='http://testserver/api/products/1/',
+                quantity=1,
+                stockrecord='http://testserver/api/products/1/stockrecords/%s/' % stockrecord,
+            )
+            self.response.assertStatusEqual(200)
+        self.response = self.get('api-basket')
+        payload = self._get_common_payload(self.response['url'])
+        with CaptureQueriesContext(connection) as queries:
+            self.response = self.post('api-checkout', **payload)
+        self.response.assertStatusEqual(200)
+        self.assertEqual(len(self.response['lines']), len(stockrecords))
+        self.client.logout()
+        return len(queries)
+
+    def test_checkout_queries_do_not_grow_with_the_lines(self):
+        self.assertEqual(self.checkout_queries('nobody', [1]), self.checkout_queries('somebody', [1, 2]))
+
+    def test_checkout_rejects_a_basket_without_lines(self):
+        self.login('nobody', 'nobody')
+        # totals left over from lines that are gone
+        Basket.objects.create(owner=User.objects.get(username='nobody'), num_items=2, total=20)
+        self.response = self.get('api-basket')
+        payload = self._get_common_payload(self.response['url'])
+
+        self.response = self.post('api-checkout', **payload)
+        self.response.assertStatusEqual(406)
+        self.assertEqual(Order.objects.count(), 0)
+        self.assertEqual(StockRecord.objects.get(pk=1).num_in_stock, 10)
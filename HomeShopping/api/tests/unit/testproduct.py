@@ -1,10 +1,35 @@
+import csv
 import decimal
-
-from django.urls import reverse
-
+import json
+import os
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.db.models import Prefetch
+from django.test.utils import CaptureQueriesContext
+from django.urls import NoReverseMatch, reverse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.reverse import reverse as drf_reverse
+
+from api.exporter import export_catalog
+from api.importer import CatalogImporter
+from api.reverse import template_reverse
+from api.serializers.catalog import ProductRowSerializer, product_rows
 from api.serializers.admin.product import AdminStockRecordsSerializer, AdminProductSerializer
+from api.serializers.product import ProductAttributeValueSerializer, ProductSerializer
 from api.tests.utils import APITest
-from product.models import Product, ProductClass
+from basket.models import Basket
+from order.models import Order
+from product.models import Product, ProductAttribute, ProductCategory, ProductClass, ProductSearchTerm, \
+    StockRecord
+from product.signals import flush_pending_refresh
+from HomeShopping import settings
 
 
 class ProductTest(APITest):
@@ -13,8 +38,8 @@ class ProductTest(APITest):
         url = reverse('product-list')
         self.response = self.get(url)
         self.response.assertStatusEqual(200)
-        self.assertEqual(len(self.response.data), 3)
-        product = self.response.body[0]
+        self.assertEqual(len(self.response['results']), 3)
+        product = self.response['results'][0]
         default_fields = ['id', 'url']
         for field in default_fields:
             self.assertIn(field, product)
@@ -23,22 +48,99 @@ class ProductTest(APITest):
         standalone_products_url = '%s?structure=standalone' % reverse('product-list')
         self.response = self.get(standalone_products_url)
         self.response.assertStatusEqual(200)
-        self.assertEqual(len(self.response.body), 1)
+        self.assertEqual(len(self.response['results']), 1)
 
         parent_products_url = '%s?structure=parent' % reverse('product-list')
         self.response = self.get(parent_products_url)
         self.response.assertStatusEqual(200)
-        self.assertEqual(len(self.response.body), 1)
+        self.assertEqual(len(self.response['results']), 1)
 
         child_products_url = '%s?structure=child' % reverse('product-list')
         self.response = self.get(child_products_url)
         self.response.assertStatusEqual(200)
-        self.assertEqual(len(self.response.body), 1)
+        self.assertEqual(len(self.response['results']), 1)
 
         koe_products_url = '%s?structure=koe' % reverse("product-list")
         self.response = self.get(koe_products_url)
         self.response.assertStatusEqual(200)
-        self.assertEqual(len(self.response.body), 0)
+        self.assertEqual(len(self.response['results']), 0)
+
+    def test_product_list_cursor_pagination(self):
+        url = '%s?page_size=2' % reverse('product-list')
+        self.response = self.get(url)
+        self.response.assertStatusEqual(200)
+        self.assertEqual([p['id'] for p in self.response['results']], [1, 2])
+        self.assertIsNone(self.response['previous'])
+
+        self.response = self.get(self.response['next'])
+        self.response.assertStatusEqual(200)
+        self.assertEqual([p['id'] for p in self.response['results']], [3])
+        self.assertIsNone(self.response['next'])
+
+    def test_product_list_is_served_from_cache(self):
+        url = reverse('product-list')
+        self.response = self.get(url)
+        self.response.assertStatusEqual(200)
+        rendered = self.response.content
+
+        with self.assertNumQueries(0):
+            response = self.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(response.content, rendered)
+
+    def test_product_list_cache_is_keyed_on_structure(self):
+        self.response = self.get(reverse('product-list'))
+        self.assertEqual(len(self.response['results']), 3)
+
+        self.response = self.get('%s?structure=parent' % reverse('product-list'))
+        self.response.assertStatusEqual(200)
+        self.assertEqual(len(self.response['results']), 1)
+
+    def test_product_cache_is_invalidated_on_write(self):
+        list_url = reverse('product-list')
+        detail_url = reverse('product-detail', args=(1,))
+        self.get(list_url)
+        self.get(detail_url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            stockrecord = Product.objects.get(pk=1).stockrecords.get(partner_sku='partner1')
+            stockrecord.num_in_stock = 7
+            stockrecord.save()
+
+        self.response = self.get(detail_url)
+        self.response.assertStatusEqual(200)
+        self.assertEqual(self.response['stockrecords'][0]['num_in_stock'], 7)
+
+        self.response = self.get(list_url)
+        self.assertEqual(self.response['results'][0]['stockrecords'][0]['num_in_stock'], 7)
+
+    def test_child_change_invalidates_parent(self):
+        parent_url = reverse('product-detail', args=(2,))
+        self.get(parent_url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            child = Product.objects.get(pk=3)
+            child.title = 'renamed child'
+            child.save()
+
+        self.response = self.get(parent_url)
+        self.assertEqual(self.response['children'][0]['title'], 'renamed child')
+
+    def test_structure_change_invalidates_the_old_structure(self):
+        # parents can't have stockrecords
+        StockRecord.objects.filter(product=1).delete()
+        standalone_url = '%s?structure=standalone' % reverse('product-list')
+        self.response = self.get(standalone_url)
+        self.assertEqual([product['id'] for product in self.response['results']], [1])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            product = Product.objects.get(pk=1)
+            product.structure = Product.PARENT
+            product.save()
+
+        # a cached page comes back as the rendered JSON
+        self.assertEqual(json.loads(self.get(standalone_url).content)['results'], [])
 
     def test_product_detail(self):
         "Check product details"
@@ -60,6 +162,182 @@ class ProductTest(APITest):
 
         self.response.assertValueEqual('title', 'standalone_product')
 
+    def test_product_list_renders_like_the_product_serializer(self):
+        ProductAttribute.objects.get(code='color').save_value(Product.objects.get(pk=1), 'Red')
+        child = Product.objects.create(structure='child', title='second child', article='child2', parent_id=2)
+        ProductAttribute.objects.get(code='size', product_class__slug='t-shirts').save_value(child, 'XL')
+
+        self.response = self.get(reverse('product-list'))
+        self.response.assertStatusEqual(200)
+        request = self.response.renderer_context['request']
+        products = Product.objects.order_by('pk')
+        with self.assertNumQueries(3):
+            fast = JSONRenderer().render(ProductRowSerializer(request).to_representation(product_rows(products)))
+        slow = JSONRenderer().render(ProductSerializer(
+            products.select_related('product_class', 'attribute_document').prefetch_related(
+                Prefetch('stockrecords', queryset=StockRecord.objects.order_by('pk')),
+                Prefetch('children', queryset=Product.objects.select_related('attribute_document').order_by('pk')),
+            ),
+            many=True,
+            context={'request': request},
+        ).data)
+        self.assertEqual(fast, slow)
+        self.assertEqual(json.loads(self.response.content)['results'], json.loads(fast))
+
+    def test_url_templates_match_reverse(self):
+        self.response = self.get(reverse('product-list'))
+        request = self.response.renderer_context['request']
+        for view_name, kwargs in (
+            ('product-detail', {'pk': 12}),
+            ('product-stockrecord-detail', {'product_pk': 3, 'pk': 41}),
+            ('basket-line-detail', {'basket_pk': 7, 'pk': 0}),
+            ('product-list', {}),
+        ):
+            self.assertEqual(
+                template_reverse(view_name, kwargs=kwargs, request=request),
+                drf_reverse(view_name, kwargs=kwargs, request=request),
+            )
+            self.assertEqual(template_reverse(view_name, kwargs=kwargs), drf_reverse(view_name, kwargs=kwargs))
+        # anything but ids is reversed as usual
+        with self.assertRaises(NoReverseMatch):
+            template_reverse('product-detail', kwargs={'pk': 'x'})
+
+    def test_product_attributes_are_rendered_from_the_document(self):
+        product = Product.objects.get(pk=1)
+        size = ProductAttribute.objects.get(code='size', product_class=product.product_class)
+        color = ProductAttribute.objects.get(code='color', product_class=product.product_class)
+        size.save_value(product, 'XL')
+        color.save_value(product, 'red')
+        color.save_value(product, None)
+        size.name = 'Size'
+        size.save()
+
+        self.response = self.get(reverse('product-detail', args=(1,)))
+        self.response.assertStatusEqual(200)
+        self.assertEqual(
+            self.response['attributes'],
+            ProductAttributeValueSerializer(product.attribute_values.all(), many=True).data,
+        )
+        self.assertEqual(self.response['attributes'], [{'name': 'Size', 'code': 'size', 'value': 'XL', 'product': 1}])
+
+    def test_product_list_attribute_filters(self):
+        sneaker = Product.objects.create(
+            title='sneaker', article='sneaker', product_class=ProductClass.objects.get(slug='sneaker'),
+        )
+        ProductAttribute.objects.get(code='size', product_class__slug='sneaker').save_value(sneaker, 43)
+        t_shirt_size = ProductAttribute.objects.get(code='size', product_class__slug='t-shirts')
+        color = ProductAttribute.objects.get(code='color')
+        t_shirt_size.save_value(Product.objects.get(pk=1), 'XL')
+        color.save_value(Product.objects.get(pk=1), 'red')
+        color.save_value(Product.objects.get(pk=3), 'red')
+
+        def product_ids(query):
+            self.response = self.get(reverse('product-list') + query)
+            self.response.assertStatusEqual(200)
+            return [product['id'] for product in self.response['results']]
+
+        # the parent matches through its child
+        self.assertEqual(product_ids('?attr.color=red'), [1, 2, 3])
+        self.assertEqual(product_ids('?attr.color=red&attr.size=XL'), [1])
+        self.assertEqual(product_ids('?attr.color=red&structure=parent'), [2])
+        self.assertEqual(product_ids('?attr.size__gte=42'), [sneaker.pk])
+        self.assertEqual(product_ids('?attr.size__in=XL,43'), [1, sneaker.pk])
+        self.assertEqual(product_ids('?attr.size=S'), [])
+        self.assertEqual(product_ids('?attr.weight=1'), [])
+
+        self.response = self.get(reverse('product-list') + '?attr.size__like=4')
+        self.response.assertStatusEqual(400)
+
+    def test_product_facets(self):
+        color = ProductAttribute.objects.get(code='color')
+        color.save_value(Product.objects.get(pk=1), 'red')
+        color.save_value(Product.objects.get(pk=3), 'blue')
+
+        self.response = self.get(reverse('product-facets'))
+        self.response.assertStatusEqual(200)
+        self.response.assertValueEqual('category', [{'id': 1, 'title': 'Male', 'count': 2}])
+        self.response.assertValueEqual('product_class', [{'slug': 't-shirts', 'name': 't-shirts', 'count': 2}])
+        self.response.assertValueEqual('attributes', {
+            'color': [{'value': 'blue', 'count': 1}, {'value': 'red', 'count': 1}],
+        })
+
+        self.response = self.get(reverse('product-facets') + '?attr.color=red')
+        self.response.assertValueEqual('category', [{'id': 1, 'title': 'Male', 'count': 1}])
+        self.response.assertValueEqual('attributes', {'color': [{'value': 'red', 'count': 1}]})
+
+        # served from the cache until a product changes
+        with self.assertNumQueries(0):
+            self.get(reverse('product-facets') + '?attr.color=red')
+        with self.captureOnCommitCallbacks(execute=True):
+            color.save_value(Product.objects.get(pk=1), 'green')
+        self.response = self.get(reverse('product-facets'))
+        self.assertIn({'value': 'green', 'count': 1}, self.response['attributes']['color'])
+
+    def test_product_search(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            ProductAttribute.objects.get(code='color').save_value(Product.objects.get(pk=1), 'Red')
+
+        def product_ids(query):
+            self.response = self.get(reverse('product-search') + query)
+            self.response.assertStatusEqual(200)
+            return [product['id'] for product in self.response['results']]
+
+        self.assertEqual(product_ids('?q=standalone'), [1])
+        self.assertEqual(product_ids('?q=red+STANDALONE'), [1])
+        self.assertEqual(product_ids('?q=red+parent'), [])
+        self.assertEqual(product_ids('?q=parent'), [2])
+        # the child is found by the category of its parent
+        self.assertEqual(product_ids('?q=male&structure=child'), [3])
+        self.assertEqual(product_ids('?q='), [])
+
+        category = ProductCategory.objects.get(slug='male')
+        category.title = 'Men'
+        with self.captureOnCommitCallbacks(execute=True):
+            category.save()
+        self.assertEqual(product_ids('?q=men'), [1, 2, 3])
+
+    def test_product_writes_are_indexed_once_per_transaction(self):
+        product = Product.objects.get(pk=1)
+        with self.captureOnCommitCallbacks() as callbacks:
+            with transaction.atomic():
+                product.title = 'Renamed'
+                product.save()
+                for code, value in (('color', 'Red'), ('size', 'XL')):
+                    ProductAttribute.objects.get(code=code, product_class=product.product_class).save_value(
+                        product, value,
+                    )
+        flushes = [callback for callback in callbacks if callback is flush_pending_refresh]
+        # registered by every write
+        self.assertGreater(len(flushes), 1)
+        self.assertFalse(ProductSearchTerm.objects.filter(term='renamed').exists())
+        # the products, values and upsert of the documents, the products to index, then the terms
+        # replaced in a savepoint
+        with self.assertNumQueries(8):
+            flushes[0]()
+        with self.assertNumQueries(0):
+            for flush in flushes[1:]:
+                flush()
+        self.assertTrue(ProductSearchTerm.objects.filter(term='renamed', product_id=1).exists())
+        self.assertEqual(
+            {attribute['value'] for attribute in Product.objects.get(pk=1).attribute_document.attributes},
+            {'Red', 'XL'},
+        )
+
+    def test_products_deleted_before_the_commit_are_not_refreshed(self):
+        product = Product.objects.create(title='short lived', product_class=self.product_class)
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                ProductAttribute.objects.get(code='color', product_class=self.product_class).save_value(product, 'Red')
+                product.delete()
+        self.assertFalse(ProductSearchTerm.objects.filter(product_id=product.pk).exists())
+
+    def test_rebuild_search_index_command(self):
+        ProductSearchTerm.objects.all().delete()
+        out = StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertIn("Indexed 3 products", out.getvalue())
+        self.assertTrue(ProductSearchTerm.objects.filter(term='standalone', product_id=1).exists())
+
 
 class _ProductSerializerTest(APITest):
     def assertErrorStartsWith(self, ser, name, errorstring):
@@ -95,6 +373,7 @@ class AdminStockRecordSerializerTest(_ProductSerializerTest):
                 "partner_sku": "henk",
                 "price": 15,
                 "num_in_stock": 15,
+                "num_allocated": 5,
             },
             instance=obj,
             context={"request": request},
@@ -104,6 +383,8 @@ class AdminStockRecordSerializerTest(_ProductSerializerTest):
         self.assertEqual(obj.product.get_title(), 'standalone_product')
         self.assertEqual(obj.price, decimal.Decimal('15.00'))
         self.assertEqual(obj.num_in_stock, 15)
+        # the reservation counter is read only
+        self.assertEqual(obj.num_allocated, 0)
         self.assertEqual(obj.owner.username, 'admin')
 
 
@@ -173,6 +454,21 @@ class AdminProductSerializerTest(_ProductSerializerTest):
         self.assertEqual(obj.product_class.slug, 't-shirts')
         return obj
 
+    def test_attributes_are_looked_up_once_per_product_class(self):
+        product = Product.objects.select_related('product_class').get(pk=1)
+        ser = AdminProductSerializer(
+            data={
+                "attributes": [
+                    {"code": "size", "value": "large"},
+                    {"code": "color", "value": "green"},
+                ],
+            },
+            instance=product,
+            partial=True,
+        )
+        with self.assertNumQueries(1):
+            self.assertTrue(ser.is_valid(), "Something wrong %s" % ser.errors)
+
     def test_modify_product_error(self):
         """When modifying an attribute, enough information should be passed to be
         able to identify the attribute. An error message should indicate
@@ -259,6 +555,36 @@ class AdminProductSerializerTest(_ProductSerializerTest):
         self.assertEqual(obj.stockrecords.count(), 1)
         self.assertEqual(obj.stockrecords.first().num_in_stock, 15)
 
+    def test_stockrecords_are_written_in_bulk(self):
+        self.login('admin', 'admin')
+        self.response = self.get(reverse('api-root'))
+        request = self.response.wsgi_request
+
+        def save_stockrecords(prefix, count, num_in_stock):
+            product = Product.objects.get(pk=3)
+            ser = AdminProductSerializer(
+                data={
+                    "stockrecords": [
+                        {"partner_sku": "%s%s" % (prefix, i), "num_in_stock": num_in_stock, "price": "10.00"}
+                        for i in range(count)
+                    ],
+                },
+                instance=product,
+                context={'request': request},
+                partial=True,
+            )
+            self.assertTrue(ser.is_valid(), "Something wrong %s" % ser.errors)
+            with CaptureQueriesContext(connection) as queries:
+                ser.save()
+            return len(queries)
+
+        # creating and updating cost the same, however many stockrecords there are
+        self.assertEqual(save_stockrecords('a', 2, 5), save_stockrecords('b', 6, 5))
+        self.assertEqual(save_stockrecords('a', 2, 7), save_stockrecords('b', 6, 8))
+        product = Product.objects.get(pk=3)
+        self.assertEqual(product.stockrecords.count(), 8)
+        self.assertEqual(sorted(product.stockrecords.values_list('num_in_stock', flat=True)), [7] * 2 + [8] * 6)
+
     def test_add_category(self):
         product = Product.objects.get(pk=1)
         ser = AdminProductSerializer(
@@ -426,3 +752,242 @@ class TestProductClass(APITest):
         self.response = self.patch(url, **data)
         self.response.assertStatusEqual(200)
         self.assertEqual(len(self.response['attributes']), 1)
+
+
+class CatalogImportTest(APITest):
+    feed = "\n".join([
+        '{"article": "shirt", "structure": "parent", "title": "Shirt", "product_class": "t-shirts"}',
+        '{"article": "shirt-xl", "structure": "child", "parent": "shirt", "attributes": {"size": "XL"}, '
+        '"stockrecords": [{"partner_sku": "shirt-xl", "price": "12.50", "num_in_stock": 4}]}',
+        '{"article": "standalone_product", "title": "Renamed"}',
+        '{"article": "boots", "title": "Boots", "product_class": "boots"}',
+        'not json',
+        '{"article": "shirt-s", "structure": "child", "parent": "shirt", "attributes": {"weight": 1}}',
+    ])
+
+    def test_import_endpoint(self):
+        self.login('admin', 'admin')
+        upload = SimpleUploadedFile('catalog.ndjson', self.feed.encode())
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('admin-catalog-import'), {'file': upload})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual(response.data['updated'], 1)
+        self.assertEqual(response.data['failed'], 3)
+        self.assertEqual([error['line'] for error in response.data['errors']], [4, 5, 6])
+        self.assertEqual(response.data['errors'][0]['message'], "Unknown product class boots")
+
+        child = Product.objects.get(article='shirt-xl')
+        self.assertEqual(child.parent.article, 'shirt')
+        self.assertEqual(child.attribute_values.get(attribute__code='size').value, 'XL')
+        self.assertEqual(child.stockrecords.get().price, decimal.Decimal('12.50'))
+        self.assertEqual(child.stockrecords.get().owner.username, 'admin')
+        self.assertEqual(child.attribute_document.attributes[0]['value'], 'XL')
+        self.assertEqual(Product.objects.get(pk=1).title, 'Renamed')
+
+        self.response = self.get(reverse('product-search') + '?q=renamed')
+        self.assertEqual([product['id'] for product in self.response['results']], [1])
+
+    def test_failed_chunk_reports_every_line_once(self):
+        importer = CatalogImporter(User.objects.get(username='admin'))
+        records = enumerate((json.loads(line) for line in self.feed.splitlines() if line != 'not json'), 1)
+        with mock.patch.object(CatalogImporter, 'after_chunk', side_effect=RuntimeError("disk full")):
+            result = importer.run(records)
+        self.assertEqual((result.created, result.updated, result.failed), (0, 0, 5))
+        self.assertEqual([error['line'] for error in result.errors], [1, 2, 3, 4, 5])
+        self.assertEqual(result.errors[3]['message'], "Unknown product class boots")
+        self.assertEqual(result.errors[0]['message'], "The chunk could not be written: disk full")
+
+    def test_import_endpoint_requires_admin(self):
+        self.login('nobody', 'nobody')
+        upload = SimpleUploadedFile('catalog.ndjson', self.feed.encode())
+        response = self.client.post(reverse('admin-catalog-import'), {'file': upload})
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(Product.objects.filter(article='shirt').exists())
+
+    def test_import_catalog_command(self):
+        feed = tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False)
+        with feed:
+            feed.write(
+                "article,structure,title,product_class,attr.size,attr.color,partner_sku,price,num_in_stock\n"
+                "sneaker-1,standalone,Sneaker,sneaker,42,,sneaker-1,30.00,3\n"
+                "sneaker-2,standalone,Sneaker,sneaker,big,,sneaker-2,30.00,3\n"
+                "standalone_product,,,,,Blue,partner1,11.00,\n"
+            )
+        self.addCleanup(os.remove, feed.name)
+        out, err = StringIO(), StringIO()
+        # one record per transaction, the invalid one doesn't affect the others
+        call_command('import_catalog', feed.name, owner='admin', chunk_size=1, stdout=out, stderr=err)
+        self.assertIn("Created 1, updated 1, failed 1 products", out.getvalue())
+        self.assertIn("Line 3: size: Must be integer", err.getvalue())
+
+        self.assertEqual(Product.objects.get(article='sneaker-1').attribute_values.get().value, 42)
+        self.assertFalse(Product.objects.filter(article='sneaker-2').exists())
+        standalone = Product.objects.get(pk=1)
+        self.assertEqual(standalone.attribute_values.get(attribute__code='color').value, 'Blue')
+        self.assertEqual(standalone.stockrecords.get(partner_sku='partner1').price, decimal.Decimal('11.00'))
+        self.assertEqual(standalone.stockrecords.get(partner_sku='partner1').num_in_stock, 10)
+
+
+class CatalogExportTest(APITest):
+
+    def test_export_endpoint(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            ProductAttribute.objects.get(code='color').save_value(Product.objects.get(pk=1), 'Red')
+        self.login('admin', 'admin')
+        response = self.client.get(reverse('admin-catalog-export', args=['ndjson']))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        records = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+
+        # parents come before their children
+        self.assertEqual([record['article'] for record in records], [
+            'standalone_product', 'parent_product', 'child_product',
+        ])
+        self.assertEqual(records[0]['attributes'], {'color': 'Red'})
+        self.assertEqual([stockrecord['partner_sku'] for stockrecord in records[0]['stockrecords']], [
+            'partner1', 'partner2',
+        ])
+        self.assertEqual(records[2]['parent'], 'parent_product')
+
+        self.assertEqual(self.client.get(reverse('admin-catalog-export', args=['xml'])).status_code, 404)
+        self.login('nobody', 'nobody')
+        self.assertEqual(self.client.get(reverse('admin-catalog-export', args=['csv'])).status_code, 403)
+
+    def test_export_reads_products_in_chunks(self):
+        # a query for the products per structure, one for the stockrecords per chunk
+        with self.assertNumQueries(4):
+            lines = list(export_catalog('ndjson'))
+        self.assertEqual(len(lines), 3)
+        with self.assertNumQueries(5):
+            lines = list(export_catalog('ndjson', chunk_size=1))
+        self.assertEqual(len(lines), 3)
+
+    def test_csv_export_imports_back(self):
+        feed = tempfile.NamedTemporaryFile(suffix='.csv', delete=False)
+        feed.close()
+        self.addCleanup(os.remove, feed.name)
+        call_command('export_catalog', format='csv', output=feed.name)
+        with open(feed.name, encoding='utf-8') as lines:
+            rows = list(csv.reader(lines))
+        self.assertEqual(len(rows), 5)
+        # the second stockrecord of the standalone product has a row of its own
+        self.assertEqual(rows[2][0], 'standalone_product')
+        self.assertEqual(rows[2][1:4], ['', '', ''])
+
+        out = StringIO()
+        call_command('import_catalog', feed.name, owner='admin', stdout=out)
+        self.assertIn("Created 0, updated 3, failed 0 products", out.getvalue())
+        self.assertEqual(Product.objects.get(pk=1).stockrecords.count(), 2)
+
+
+class GenerateDataTest(APITest):
+    options = {
+        'seed': 3, 'products': 12, 'users': 5, 'orders': 8, 'baskets': 3, 'categories': 2, 'product_classes': 2,
+        'batch_size': 5,
+    }
+
+    def generate(self):
+        with transaction.atomic():
+            call_command('generate_data', stdout=StringIO(), **self.options)
+            snapshot = (
+                list(Product.objects.filter(article__startswith='gen3-').order_by('article').values_list(
+                    'article', 'structure', 'title', 'parent__article', 'attribute_document__attributes',
+                )),
+                list(StockRecord.objects.filter(partner_sku__startswith='gen3-').order_by('partner_sku').values_list(
+                    'partner_sku', 'price', 'num_in_stock',
+                )),
+                list(Order.objects.filter(user__username__startswith='gen3_').order_by(
+                    'date_placed', 'lines__pk',
+                ).values_list(
+                    'total', 'lines__quantity', 'lines__stockrecord__partner_sku',
+                )),
+                list(Basket.open.filter(lines__isnull=False).distinct().values_list('num_items', 'total')),
+            )
+            transaction.set_rollback(True)
+        return snapshot
+
+    def test_generate_data_is_reproducible(self):
+        snapshot = self.generate()
+        products, stockrecords, orders, baskets = snapshot
+        self.assertEqual(len([product for product in products if product[1] != Product.CHILD]), 12)
+        self.assertTrue(stockrecords)
+        self.assertTrue(orders)
+        self.assertEqual(len(baskets), 3)
+        self.assertEqual(self.generate(), snapshot)
+
+    def test_generated_data_is_not_hidden_by_the_catalog_cache(self):
+        url = reverse('product-list')
+        self.assertEqual(len(json.loads(self.get(url).content)['results']), 3)
+        call_command('generate_data', stdout=StringIO(), **self.options)
+        self.assertGreater(len(json.loads(self.get(url).content)['results']), 3)
+
+        # spread over the past, not all placed now
+        dates = Order.objects.filter(user__username__startswith='gen3_').values_list('date_placed', flat=True)
+        self.assertGreater(max(dates) - min(dates), timedelta(days=1))
+
+    def test_generate_data_refuses_a_generated_seed(self):
+        call_command('generate_data', stdout=StringIO(), **self.options)
+        with self.assertRaises(CommandError):
+            call_command('generate_data', stdout=StringIO(), **self.options)
+
+
+class InstrumentationTest(APITest):
+
+    def server_timing(self, response):
+        return dict(metric.split(';', 1) for metric in response['Server-Timing'].split(', '))
+
+    def test_server_timing_reports_the_queries_of_the_request(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.get(reverse('product-list'))
+        self.assertEqual(response.status_code, 200)
+        timing = self.server_timing(response)
+        self.assertIn('total', timing)
+        self.assertIn('serialize', timing)
+        self.assertIn('desc="%s queries"' % len(queries), timing['db'])
+        self.assertEqual(timing['cache'], 'desc="hits=0 misses=1"')
+
+        response = self.get(reverse('product-list'))
+        timing = self.server_timing(response)
+        self.assertEqual(timing['cache'], 'desc="hits=1 misses=0"')
+        self.assertEqual(timing['serialize'], 'dur=0.0')
+
+    def test_server_timing_can_be_turned_off(self):
+        with mock.patch.object(settings, 'MY_INSTRUMENTATION_SERVER_TIMING', False):
+            response = self.get(reverse('product-list'))
+        self.assertFalse(response.has_header('Server-Timing'))
+
+    def test_sampled_log(self):
+        with mock.patch.object(settings, 'MY_INSTRUMENTATION_LOG_SAMPLE_RATE', 1), \
+                self.assertLogs('api.instrumentation', 'INFO') as logs:
+            self.get(reverse('product-list'))
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['view'], 'product-list')
+        self.assertEqual(record['status'], 200)
+        self.assertGreater(record['queries'], 0)
+        self.assertEqual(record['cache_misses'], 1)
+
+        with mock.patch.object(settings, 'MY_INSTRUMENTATION_LOG_SAMPLE_RATE', 0), \
+                self.assertNoLogs('api.instrumentation', 'INFO'):
+            self.get(reverse('product-list'))
+
+    def test_queries_of_streaming_responses_are_logged_once_streamed(self):
+        self.login('admin', 'admin')
+        with mock.patch.object(settings, 'MY_INSTRUMENTATION_LOG_SAMPLE_RATE', 1), \
+                self.assertLogs('api.instrumentation', 'INFO') as logs:
+            response = self.client.get(reverse('admin-catalog-export', args=['ndjson']))
+            self.assertFalse(logs.records)
+            # the products and stockrecords are read while streaming
+            with CaptureQueriesContext(connection) as queries:
+                b''.join(response.streaming_content)
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['view'], 'admin-catalog-export')
+        self.assertGreaterEqual(record['queries'], len(queries))
+        self.assertGreater(len(queries), 0)
+
+    def test_slow_queries_are_logged_with_their_view(self):
+        with mock.patch.object(settings, 'MY_INSTRUMENTATION_SLOW_QUERY', 0), \
+                self.assertLogs('api.instrumentation.slow_queries', 'WARNING') as logs:
+            self.get(reverse('product-list'))
+        self.assertTrue(logs.records)
+        self.assertTrue(all(' in product-list: ' in record.getMessage() for record in logs.records))
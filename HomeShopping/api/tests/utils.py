@@ -1,17 +1,25 @@
 import json
 from re import match
+from unittest import mock
 
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.http import SimpleCookie
 from django.test import TestCase
 from django.urls import NoReverseMatch, reverse
 
+from HomeShopping import settings
 from product.models import ProductClass, Product, ProductCategory, StockRecord, ProductAttribute
 
 
 class APITest(TestCase):
 
     def setUp(self) -> None:
+        cache.clear()
+        # keep the sampled request logs out of the test output
+        patcher = mock.patch.object(settings, 'MY_INSTRUMENTATION_LOG_SAMPLE_RATE', 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
         User.objects.create_user(
             id=1, username='admin',
             email='admin@admin.adm',
@@ -117,25 +125,27 @@ class APITest(TestCase):
             product_class=cls.product_class2,
         )
         cls.category = ProductCategory.objects.create(title='Male', slug='male')
-        cls.standalone_product = Product.objects.create(
-            title='standalone_product',
-            article='standalone_product',
-            category=cls.category,
-            product_class=cls.product_class,
-        )
-        cls.parent_product = Product.objects.create(
-            structure='parent',
-            title='parent_product',
-            article='parent_product',
-            category=cls.category,
-            product_class=cls.product_class,
-        )
-        cls.child_product = Product.objects.create(
-            structure='child',
-            title='child_product',
-            article='child_product',
-            parent=cls.parent_product,
-        )
+        # the products are indexed once committed, see product/signals.py
+        with cls.captureOnCommitCallbacks(execute=True):
+            cls.standalone_product = Product.objects.create(
+                title='standalone_product',
+                article='standalone_product',
+                category=cls.category,
+                product_class=cls.product_class,
+            )
+            cls.parent_product = Product.objects.create(
+                structure='parent',
+                title='parent_product',
+                article='parent_product',
+                category=cls.category,
+                product_class=cls.product_class,
+            )
+            cls.child_product = Product.objects.create(
+                structure='child',
+                title='child_product',
+                article='child_product',
+                parent=cls.parent_product,
+            )
         cls.stockrecord = StockRecord.objects.create(
             partner_sku='partner1',
             product=cls.standalone_product,
@@ -3,14 +3,15 @@ from django.urls import path, include
 from api.views.admin.User import UserAdminList, UserAdminDetail
 from api.views.admin.product import ProductClassAdminList, ProductClassAdminDetail, ProductAttributeAdminList, \
     ProductAttributeAdminDetail, ProductStockRecordsAdminList, ProductAdminList, ProductAdminDetail, \
-    ProductStockRecordsAdminDetail, ProductCategoryList, ProductCategoryDetail
+    ProductStockRecordsAdminDetail, ProductCategoryList, ProductCategoryDetail, CatalogImportView, \
+    CatalogExportView
 from api.views.basic import BasketList, BasketDetail
 from api.views.basket import BasketView, AddProductView, LineList, LineDetail
 from api.views.checkout import CheckoutView, OrderList, OrderDetail, OrderLineList, OrderLineDetail, \
     OrderLineAttributeDetail
 from api.views.login import UserDetail, LoginView
 from api.views.product import CategoryList, CategoryDetail, ProductStockRecords, ProductStockRecordDetail, ProductList, \
-    ProductDetail
+    ProductDetail, ProductFacets, ProductSearch
 from api.views.root import api_root
 
 
@@ -24,6 +25,8 @@ urlpatterns = [
     path('baskets/<int:pk>/lines', LineList.as_view(), name='basket-lines-list'),
     path('baskets/<int:basket_pk>/lines/<int:pk>/', LineDetail.as_view(), name='basket-line-detail'),
     path("products/", ProductList.as_view(), name="product-list"),
+    path("products/facets/", ProductFacets.as_view(), name="product-facets"),
+    path("products/search/", ProductSearch.as_view(), name="product-search"),
     path("products/<int:pk>/", ProductDetail.as_view(), name="product-detail"),
     path(
         "products/<int:pk>/stockrecords/",
@@ -61,6 +64,8 @@ admin_urlpatterns = [
     path('attributes/<int:pk>/', ProductAttributeAdminDetail.as_view(), name='admin-productattr-detail'),
     path('stockrecords/', ProductStockRecordsAdminList.as_view(), name='admin-stockrecord-list'),
     path('stockrecords/<int:pk>/', ProductStockRecordsAdminDetail.as_view(), name='admin-stockrecord-detail'),
+    path('import/', CatalogImportView.as_view(), name='admin-catalog-import'),
+    path('export/<str:feed_format>/', CatalogExportView.as_view(), name='admin-catalog-export'),
     path("users/", UserAdminList.as_view(), name="admin-user-list"),
     path("users/<int:pk>/", UserAdminDetail.as_view(), name="admin-user-detail"),
 ]
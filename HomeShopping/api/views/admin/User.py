@@ -3,6 +3,7 @@ from django.contrib.auth.models import User
 from rest_framework import generics
 from rest_framework.permissions import IsAdminUser
 
+from api.pagination import KeysetPagination
 from api.serializers.admin.User import AdminUserSerializer
 
 
@@ -10,6 +11,7 @@ class UserAdminList(generics.ListCreateAPIView):
     queryset = User.objects.all()
     serializer_class = AdminUserSerializer
     permission_classes = (IsAdminUser,)
+    pagination_class = KeysetPagination
 
 
 class UserAdminDetail(generics.RetrieveUpdateDestroyAPIView):
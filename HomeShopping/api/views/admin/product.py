@@ -1,7 +1,16 @@
+import os
+
 from django.db.models import Prefetch
-from rest_framework import generics
+from django.http import Http404, StreamingHttpResponse
+from rest_framework import generics, status
+from rest_framework.parsers import MultiPartParser
 from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
 
+from api.exporter import CONTENT_TYPES, export_catalog
+from api.importer import READERS, import_catalog
+from api.pagination import KeysetPagination
 from api.serializers.admin.product import AdminStockRecordsSerializer, AdminProductClassSerializer, \
     AdminProductSerializer, AdminCategorySerializer
 from api.serializers.product import ProductAttributeSerializer
@@ -12,6 +21,7 @@ class ProductAttributeAdminList(generics.ListCreateAPIView):
     serializer_class = ProductAttributeSerializer
     queryset = ProductAttribute.objects.get_queryset()
     permission_classes = (IsAdminUser,)
+    pagination_class = KeysetPagination
 
     def get_serializer(self, *args, **kwargs):
         if "data" in kwargs:
@@ -33,6 +43,7 @@ class ProductClassAdminList(generics.ListCreateAPIView):
     serializer_class = AdminProductClassSerializer
     queryset = ProductClass.objects.get_queryset()
     permission_classes = (IsAdminUser,)
+    pagination_class = KeysetPagination
 
 
 class ProductClassAdminDetail(generics.RetrieveUpdateDestroyAPIView):
@@ -45,6 +56,7 @@ class ProductStockRecordsAdminList(generics.ListCreateAPIView):
     serializer_class = AdminStockRecordsSerializer
     queryset = StockRecord.objects.get_queryset()
     permission_classes = (IsAdminUser,)
+    pagination_class = KeysetPagination
 
 
 class ProductStockRecordsAdminDetail(generics.RetrieveUpdateDestroyAPIView):
@@ -64,6 +76,7 @@ class ProductAdminList(generics.ListCreateAPIView):
                  ),
     )
     permission_classes = (IsAdminUser,)
+    pagination_class = KeysetPagination
 
 
 class ProductAdminDetail(generics.RetrieveUpdateDestroyAPIView):
@@ -76,9 +89,46 @@ class ProductCategoryList(generics.ListCreateAPIView):
     serializer_class = AdminCategorySerializer
     queryset = ProductCategory.objects.all()
     permission_classes = (IsAdminUser,)
+    pagination_class = KeysetPagination
 
 
 class ProductCategoryDetail(generics.RetrieveUpdateDestroyAPIView):
     serializer_class = AdminCategorySerializer
     queryset = ProductCategory.objects.all()
     permission_classes = (IsAdminUser,)
+
+
+class CatalogImportView(APIView):
+    """
+    Import an uploaded NDJSON or CSV feed, see api/importer.py for the records.
+    The upload is streamed from its temporary file a chunk at a time.
+    """
+    permission_classes = (IsAdminUser,)
+    parser_classes = (MultiPartParser,)
+
+    def post(self, request):
+        feed = request.FILES.get('file')
+        if feed is None:
+            return Response({"reason": "A file is required"}, status=status.HTTP_400_BAD_REQUEST)
+        feed_format = request.data.get('format') or os.path.splitext(feed.name)[1].lstrip('.').lower()
+        if feed_format not in READERS:
+            return Response(
+                {"reason": "Unsupported format, use one of %s" % ", ".join(READERS)},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        result = import_catalog(feed, feed_format, request.user)
+        return Response(result.as_dict())
+
+
+class CatalogExportView(APIView):
+    """
+    Stream the whole catalog as NDJSON or CSV, see api/exporter.py.
+    """
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request, feed_format):
+        if feed_format not in CONTENT_TYPES:
+            raise Http404
+        response = StreamingHttpResponse(export_catalog(feed_format), content_type=CONTENT_TYPES[feed_format])
+        response['Content-Disposition'] = 'attachment; filename="catalog.%s"' % feed_format
+        return response
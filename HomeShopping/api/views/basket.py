@@ -1,4 +1,6 @@
+from django.db import transaction
 from rest_framework import status, generics
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
@@ -7,7 +9,7 @@ from api.permissions import RequestAllowsAccessTo
 from api.serializers.basket import BasketSerializer, BasketLineSerializer
 from api.serializers.product import AddProductSerializer
 from api.views.utils import BasketPermissionMixin
-from basket.models import BasketLine
+from basket.models import BasketLine, StockReservation
 
 
 class BasketView(APIView):
@@ -24,15 +26,14 @@ class AddProductView(APIView):
     serializer_class = AddProductSerializer
     basket_serializer_class = BasketSerializer
 
-    def validate(self, basket, product, quantity, stockrecord):
-        if basket.pk:
-            current_quantity = basket.current_quantity(product, stockrecord)
-            desired_quantity = current_quantity + quantity
-        else:
-            desired_quantity = quantity
-
-        if desired_quantity > stockrecord.num_in_stock:
-            if stockrecord.num_in_stock < 1:
+    def validate(self, basket, stockrecord, desired_quantity):
+        """
+        Reserve the stock for the desired line quantity. The reservation is a
+        conditional UPDATE, so concurrent baskets can't get more than is in stock.
+        """
+        if not StockReservation.objects.reserve_up_to(basket, stockrecord, desired_quantity):
+            stockrecord.refresh_from_db(fields=('num_in_stock', 'num_allocated'))
+            if stockrecord.net_stock_level < 1:
                 message = 'This product is not available to buy now'
                 return False, message
             message = "This quantity is not allowed."
@@ -45,15 +46,24 @@ class AddProductView(APIView):
             product = p_ser.validated_data['product']
             quantity = p_ser.validated_data['quantity']
             stockrecord = p_ser.validated_data['stockrecord']
-            basket_valid, message = self.validate(request.basket, product, quantity, stockrecord)
+            basket = request.basket
+            if not basket.pk:
+                basket.save()
+            with transaction.atomic():
+                # the upsert returns the new line quantity, which is what
+                # has to be reserved; on failure both are rolled back
+                line, __ = basket.add_product(product, stockrecord, quantity=quantity)
+                basket_valid, message = self.validate(basket, stockrecord, line.quantity)
+                if not basket_valid:
+                    transaction.set_rollback(True)
             if not basket_valid:
+                basket.refresh_from_db(fields=('num_items', 'total'))
                 return Response(
                     {"reason": message},
                     status=status.HTTP_406_NOT_ACCEPTABLE,
                 )
 
-            request.basket.add_product(product, stockrecord, quantity=quantity)
-            ser = self.basket_serializer_class(request.basket, context={"request": request})
+            ser = self.basket_serializer_class(basket, context={"request": request})
             return Response(ser.data)
         return Response({"reason": p_ser.errors}, status=status.HTTP_406_NOT_ACCEPTABLE)
 
@@ -79,3 +89,16 @@ class LineDetail(generics.RetrieveUpdateDestroyAPIView):
         basket_pk = self.kwargs.get("basket_pk")
         basket = generics.get_object_or_404(editable_baskets(), pk=basket_pk)
         return basket.lines.all()
+
+    def perform_update(self, serializer):
+        line = serializer.instance
+        quantity = serializer.validated_data.get('quantity', line.quantity)
+        with transaction.atomic():
+            if not StockReservation.objects.reserve_up_to(line.basket, line.stockrecord, quantity):
+                raise ValidationError("Cannot buy this quantity.")
+            serializer.save()
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            StockReservation.objects.release(instance.basket, instance.stockrecord)
+            instance.delete()
@@ -1,23 +1,42 @@
+from django.db.models import Prefetch
 from rest_framework import generics, views, response, status
 
 from api.basket.operations import parse_basket_from_hyperlink, request_allows_access_to_basket
+from api.pagination import KeysetPagination, OrderKeysetPagination
 from api.permissions import IsOwner
 from api.serializers.checkout import OrderSerializer, OrderLineSerializer, OrderLineAttributeSerializer, \
     CheckoutSerializer
 from order.models import Order, OrderLine, OrderLineAttribute
+from product.models import Product
+
+
+def order_queryset():
+    """
+    Orders with everything OrderSerializer renders of their lines, so the
+    number of queries doesn't grow with the number of lines.
+    """
+    products = Product.objects.select_related('product_class', 'attribute_document')
+    return Order.objects.select_related('shipping_address').prefetch_related(
+        'lines__attributes',
+        'lines__stockrecord',
+        Prefetch('lines__product', queryset=products),
+        Prefetch('lines__product__children', queryset=products),
+        'lines__product__stockrecords',
+    )
 
 
 class OrderList(generics.ListAPIView):
     serializer_class = OrderSerializer
     permission_classes = (IsOwner,)
+    pagination_class = OrderKeysetPagination
 
     def get_queryset(self):
-        qs = Order.objects.all()
+        qs = order_queryset()
         return qs.filter(user=self.request.user)
 
 
 class OrderDetail(generics.RetrieveAPIView):
-    queryset = Order.objects.all()
+    queryset = order_queryset()
     serializer_class = OrderSerializer
     permission_classes = (IsOwner,)
 
@@ -25,6 +44,7 @@ class OrderDetail(generics.RetrieveAPIView):
 class OrderLineList(generics.ListAPIView):
     queryset = OrderLine.objects.all()
     serializer_class = OrderLineSerializer
+    pagination_class = KeysetPagination
 
 
 class OrderLineDetail(generics.RetrieveAPIView):
@@ -54,6 +74,7 @@ class CheckoutView(views.APIView):
         if c_ser.is_valid():
             order = c_ser.save()
             basket.freeze()
+            order = order_queryset().get(pk=order.pk)
             o_ser = self.order_serializer_class(order, context={"request": request})
             resp = response.Response(o_ser.data)
             return resp
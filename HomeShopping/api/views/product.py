@@ -1,21 +1,26 @@
-from django.core.cache import cache
 from django.db.models import Prefetch
 
 from rest_framework import generics
+from rest_framework.response import Response
 
+from api.cache import PRODUCT_FACETS, PRODUCT_SEARCH, product_detail_namespace, product_list_namespace
+from api.facets import product_facets
+from api.filters import filter_products
+from api.pagination import KeysetPagination, SearchPagination
+from api.serializers.catalog import ProductRowSerializer, product_rows
 from api.serializers.product import CategorySerializer, ProductStockRecordSerializer, ProductSerializer
-from product.models import ProductCategory, StockRecord, Product, ProductAttributeValue
+from api.views.utils import CatalogCacheMixin
+from product.models import ProductCategory, StockRecord, Product
+from product.search import search
 
 
-class ProductList(generics.ListAPIView):
-    queryset = Product.objects.all().select_related('product_class').prefetch_related(
-        'stockrecords',
-        Prefetch('attribute_values', queryset=ProductAttributeValue.objects.select_related('attribute')),
-        Prefetch('children', queryset=Product.objects.all().prefetch_related(
-            Prefetch('attribute_values', queryset=ProductAttributeValue.objects.all().select_related('attribute')),
-        )),
-    )
+class ProductList(CatalogCacheMixin, generics.ListAPIView):
+    queryset = Product.objects.all()
     serializer_class = ProductSerializer
+    pagination_class = KeysetPagination
+
+    def get_cache_namespace(self):
+        return product_list_namespace(self.request.query_params.get("structure"))
 
     def get_queryset(self):
         """
@@ -27,31 +32,67 @@ class ProductList(generics.ListAPIView):
         or::
 
             http://127.0.0.1:8000/api/products/?structure=parent
+
+        and on attribute values, see api/filters.py::
+
+            http://127.0.0.1:8000/api/products/?attr.color=red&attr.size__gte=42
         """
-        qs_cache_name = 'p_list_cache'
-        qs_cache = cache.get(qs_cache_name)
-
-        if qs_cache:
-            qs = qs_cache
-        else:
-            qs = super(ProductList, self).get_queryset()
-        structure = self.request.query_params.get("structure")
-        if structure is not None:
-            return qs.filter(structure=structure)
-
-        return qs
-
-
-class ProductDetail(generics.RetrieveAPIView):
-    queryset = Product.objects.all().select_related('product_class').prefetch_related(
-        Prefetch('attribute_values', queryset=ProductAttributeValue.objects.all().select_related('attribute')),
-        Prefetch('children', queryset=Product.objects.all().prefetch_related(
-            Prefetch('attribute_values', queryset=ProductAttributeValue.objects.all().select_related('attribute')),
-        ),
-                 ),
+        qs = super(ProductList, self).get_queryset()
+        return filter_products(qs, self.request.query_params)
+
+    def list(self, request, *args, **kwargs):
+        # ProductSerializer renders the same JSON, model instance by model instance
+        page = self.paginate_queryset(product_rows(self.filter_queryset(self.get_queryset())))
+        return self.get_paginated_response(ProductRowSerializer(request).to_representation(page))
+
+
+class ProductFacets(CatalogCacheMixin, generics.ListAPIView):
+    """
+    Product counts per category, product class and attribute value, for the
+    products the same filters select on the product list, eg::
+
+        http://127.0.0.1:8000/api/products/facets/?structure=standalone&attr.color=red
+    """
+    queryset = Product.objects.all()
+    pagination_class = None
+
+    def get_cache_namespace(self):
+        return PRODUCT_FACETS
+
+    def get_queryset(self):
+        return filter_products(super().get_queryset(), self.request.query_params)
+
+    def list(self, request, *args, **kwargs):
+        return Response(product_facets(self.get_queryset()))
+
+
+class ProductSearch(ProductList):
+    """
+    Products containing every word of the query in their title, article,
+    description, category or text attributes, best matches first, eg::
+
+        http://127.0.0.1:8000/api/products/search/?q=red+shirt
+
+    The filters of the product list apply as well.
+    """
+    pagination_class = SearchPagination
+
+    def get_cache_namespace(self):
+        return PRODUCT_SEARCH
+
+    def get_queryset(self):
+        return search(super().get_queryset(), self.request.query_params.get('q', ''))
+
+
+class ProductDetail(CatalogCacheMixin, generics.RetrieveAPIView):
+    queryset = Product.objects.all().select_related('product_class', 'attribute_document').prefetch_related(
+        Prefetch('children', queryset=Product.objects.all().select_related('attribute_document')),
     )
     serializer_class = ProductSerializer
 
+    def get_cache_namespace(self):
+        return product_detail_namespace(self.kwargs['pk'])
+
 
 class ProductStockRecords(generics.ListAPIView):
     serializer_class = ProductStockRecordSerializer
@@ -15,6 +15,8 @@ def PUBLIC_APIS(r, f):
         ("checkout", reverse("api-checkout", request=r, format=f)),
         ("orders", reverse("order-list", request=r, format=f)),
         ("products", reverse("product-list", request=r, format=f)),
+        ("product-facets", reverse("product-facets", request=r, format=f)),
+        ("product-search", reverse("product-search", request=r, format=f)),
     ]
 
 
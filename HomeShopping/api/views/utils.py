@@ -1,6 +1,9 @@
 from django.db.models import Prefetch
+from django.http import HttpResponse
 from rest_framework.generics import get_object_or_404
+from rest_framework.response import Response
 
+from api.cache import catalog_cache_key, get_payload, set_payload
 from api.permissions import RequestAllowsAccessTo
 from basket.models import Basket, BasketLine
 
@@ -21,3 +24,35 @@ class BasketPermissionMixin(object):
             )
         self.check_object_permissions(request, basket)
         return basket
+
+
+class CatalogCacheMixin:
+    """
+    Serve the rendered JSON of a GET straight from the catalog cache.
+    On a hit neither the database nor the serializers are touched,
+    on a miss the rendered response is stored for the next request.
+    """
+    cache_key = None
+
+    def get_cache_namespace(self):
+        raise NotImplementedError
+
+    def get_cache_key(self, request):
+        if request.method != 'GET' or request.accepted_renderer.format != 'json':
+            return None
+        return catalog_cache_key(self.get_cache_namespace(), request)
+
+    def get(self, request, *args, **kwargs):
+        self.cache_key = self.get_cache_key(request)
+        if self.cache_key is not None:
+            payload = get_payload(self.cache_key)
+            if payload is not None:
+                return HttpResponse(payload, content_type=request.accepted_renderer.media_type)
+        return super().get(request, *args, **kwargs)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if self.cache_key is not None and isinstance(response, Response) and response.status_code == 200:
+            response.render()
+            set_payload(self.cache_key, response.content)
+        return response
@@ -1,7 +1,8 @@
 from django.contrib import admin
 
 # Register your models here.
-from basket.models import Basket, BasketLine
+from basket.models import Basket, BasketLine, StockReservation
 
 admin.site.register(Basket)
 admin.site.register(BasketLine)
+admin.site.register(StockReservation)
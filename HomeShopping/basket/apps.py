@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class BasketConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'basket'
+
+    def ready(self):
+        from basket import signals  # noqa: F401
@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F, Q
+from django.db.models.functions import Round
+
+from basket.models import Basket
+
+
+class Command(BaseCommand):
+    help = "Verify the stored num_items/total of baskets against their lines"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fix',
+            action='store_true',
+            help="Recalculate the totals of the inconsistent baskets",
+        )
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help="Check baskets that can't be edited anymore as well",
+        )
+
+    def handle(self, *args, **options):
+        baskets = Basket.objects.all()
+        if not options['all']:
+            baskets = baskets.filter(status__in=Basket.editable_statuses)
+
+        inconsistent = baskets.with_line_totals().annotate(
+            stored_total=Round('total', 2),
+            expected_total=Round('line_total', 2),
+        ).filter(
+            ~Q(num_items=F('line_num_items')) | ~Q(stored_total=F('expected_total')),
+        ).values_list('pk', 'num_items', 'line_num_items', 'total', 'line_total')
+
+        ids = []
+        for pk, num_items, line_num_items, total, line_total in inconsistent:
+            ids.append(pk)
+            self.stdout.write(
+                "Basket %s: num_items %s != %s, total %s != %s" % (pk, num_items, line_num_items, total, line_total),
+            )
+
+        if not ids:
+            self.stdout.write(self.style.SUCCESS("All basket totals are consistent"))
+            return
+
+        if options['fix']:
+            Basket.objects.filter(pk__in=ids).recalculate_totals()
+            self.stdout.write(self.style.SUCCESS("Recalculated %s baskets" % len(ids)))
+        else:
+            self.stdout.write(self.style.WARNING("%s inconsistent baskets, rerun with --fix" % len(ids)))
@@ -1,7 +1,59 @@
-from django.db import models
+from datetime import timedelta
+from decimal import Decimal
 
+from django.core.exceptions import PermissionDenied
+from django.db import IntegrityError, connections, models, transaction
+from django.db.models import DecimalField, Exists, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils.timezone import now
 
-class OpenBasketManager(models.Manager):
+from basket import storage
+from HomeShopping import settings
+from product.models import StockRecord
+
+
+class BasketQuerySet(models.QuerySet):
+
+    def line_totals(self):
+        """
+        Subqueries that aggregate the lines of the outer basket.
+        """
+        line_model = self.model._meta.get_field('lines').related_model
+        lines = line_model.objects.filter(basket=OuterRef('pk')).values('basket')
+        num_items = lines.annotate(num_items=Sum('quantity')).values('num_items')
+        total = lines.annotate(
+            total=Sum(F('quantity') * F('stockrecord__price'), output_field=DecimalField()),
+        ).values('total')
+        return (
+            Coalesce(Subquery(num_items), 0),
+            Coalesce(Subquery(total), Value(Decimal('0.00')), output_field=DecimalField()),
+        )
+
+    def with_line_totals(self):
+        num_items, total = self.line_totals()
+        return self.annotate(line_num_items=num_items, line_total=total)
+
+    def holding_stockrecords(self, stockrecords):
+        """
+        The editable baskets with a line of any of these stockrecords.
+        """
+        line_model = self.model._meta.get_field('lines').related_model
+        return self.filter(
+            status__in=self.model.editable_statuses,
+            pk__in=line_model.objects.filter(stockrecord__in=stockrecords).values('basket'),
+        )
+
+    def recalculate_totals(self):
+        """
+        Recompute the stored totals of all these baskets from their lines in one UPDATE.
+        """
+        num_items, total = self.line_totals()
+        if storage.enabled():
+            storage.evict_on_commit(list(self.values_list('pk', flat=True)))
+        return self.update(num_items=num_items, total=total)
+
+
+class OpenBasketManager(models.Manager.from_queryset(BasketQuerySet)):
     """For searching/creating OPEN baskets only."""
     status_filter = "Open"
 
@@ -12,3 +64,234 @@ class OpenBasketManager(models.Manager):
     def get_or_create(self, **kwargs):
         return self.get_queryset().get_or_create(
             status=self.status_filter, **kwargs)
+
+
+class BasketLineManager(models.Manager):
+
+    def supports_upsert(self, connection):
+        # ON CONFLICT (...) DO UPDATE ... RETURNING, eg. not on SQLite before 3.35
+        features = connection.features
+        return features.supports_update_conflicts_with_target and features.can_return_columns_from_insert
+
+    def add_quantity(self, basket, product, stockrecord, quantity):
+        """
+        Add `quantity` items to the line of the basket, creating it if needed,
+        in one INSERT ... ON CONFLICT DO UPDATE statement. The unique
+        (basket, product, stockrecord) constraint makes concurrent adds of
+        the same product end up on one line.
+        The basket status is checked in the database, not on the instance,
+        which may have been frozen by a concurrent checkout meanwhile.
+        Returns the line and whether it didn't hold any items before.
+        """
+        connection = connections[self.db]
+        if quantity <= 0 or not self.supports_upsert(connection):
+            with transaction.atomic(using=self.db):
+                editable = type(basket).objects.select_for_update().filter(
+                    pk=basket.pk, status__in=basket.editable_statuses,
+                )
+                if not editable.exists():
+                    raise self.not_editable(basket)
+                line, created = self.get_or_create(
+                    basket=basket, product=product, stockrecord=stockrecord,
+                    defaults={'quantity': max(0, quantity)},
+                )
+                if not created:
+                    line.quantity = max(0, line.quantity + quantity)
+                    line.save()
+            return line, created
+
+        opts = self.model._meta
+        table = connection.ops.quote_name(opts.db_table)
+        columns = [
+            connection.ops.quote_name(opts.get_field(name).column)
+            for name in ('basket', 'product', 'stockrecord', 'quantity')
+        ]
+        quantity_column = columns[-1]
+        basket_opts = basket._meta
+        sql = (
+            "INSERT INTO {table} ({columns}) SELECT %s, %s, %s, %s "
+            "WHERE EXISTS (SELECT 1 FROM {basket_table} WHERE {basket_pk} = %s AND {status} IN ({statuses})) "
+            "ON CONFLICT ({unique}) DO UPDATE SET {quantity} = {table}.{quantity} + EXCLUDED.{quantity} "
+            "RETURNING {pk}, {quantity}"
+        ).format(
+            table=table,
+            columns=', '.join(columns),
+            basket_table=connection.ops.quote_name(basket_opts.db_table),
+            basket_pk=connection.ops.quote_name(basket_opts.pk.column),
+            status=connection.ops.quote_name(basket_opts.get_field('status').column),
+            statuses=', '.join(['%s'] * len(basket.editable_statuses)),
+            unique=', '.join(columns[:3]),
+            quantity=quantity_column,
+            pk=connection.ops.quote_name(opts.pk.column),
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [basket.pk, product.pk, stockrecord.pk, quantity, basket.pk, *basket.editable_statuses])
+            row = cursor.fetchone()
+        if row is None:
+            raise self.not_editable(basket)
+        pk, new_quantity = row
+
+        line = self.model(pk=pk, basket=basket, product=product, stockrecord=stockrecord, quantity=new_quantity)
+        line._original_basket_id = basket.pk
+        line._original_quantity = new_quantity
+        basket.adjust_totals(quantity, quantity * line.unit_price)
+        return line, new_quantity == quantity
+
+    def not_editable(self, basket):
+        basket.refresh_from_db(fields=('status',))
+        return PermissionDenied("You cannot modify a %s basket" % (basket.status.lower(),))
+
+
+class StockReservationManager(models.Manager):
+    """
+    Reserve, release and expire stock for baskets.
+    All changes of StockRecord.num_allocated go through here.
+    """
+
+    def _allocate(self, stockrecord_id, quantity):
+        return StockRecord.objects.filter(
+            pk=stockrecord_id,
+            num_in_stock__gte=F('num_allocated') + quantity,
+        ).update(num_allocated=F('num_allocated') + quantity)
+
+    def _deallocate(self, stockrecord_id, quantity):
+        StockRecord.objects.filter(
+            pk=stockrecord_id,
+            num_allocated__gte=quantity,
+        ).update(num_allocated=F('num_allocated') - quantity)
+
+    def expiry_date(self):
+        return now() + timedelta(seconds=settings.MY_BASKET_RESERVATION_LIFETIME)
+
+    def touch(self, basket):
+        """
+        Reservations live as long as their basket is used, so any change to
+        the basket extends all of them.
+        """
+        self.filter(basket=basket).update(date_expires=self.expiry_date())
+
+    def reserved_quantity(self, basket, stockrecord):
+        reservation = self.filter(basket=basket, stockrecord=stockrecord).only('quantity').first()
+        return reservation.quantity if reservation else 0
+
+    def reserve(self, basket, stockrecord, quantity):
+        """
+        Reserve `quantity` more items of the stockrecord for the basket.
+        Returns False when there isn't enough unreserved stock left.
+        """
+        if quantity <= 0:
+            return True
+        with transaction.atomic():
+            if not self._allocate(stockrecord.pk, quantity):
+                return False
+            updated = self.filter(basket=basket, stockrecord=stockrecord).update(
+                quantity=F('quantity') + quantity,
+            )
+            if not updated:
+                try:
+                    with transaction.atomic():
+                        self.create(
+                            basket=basket,
+                            stockrecord=stockrecord,
+                            quantity=quantity,
+                            date_expires=self.expiry_date(),
+                        )
+                except IntegrityError:
+                    # a concurrent request created it first
+                    self.filter(basket=basket, stockrecord=stockrecord).update(
+                        quantity=F('quantity') + quantity,
+                    )
+            self.touch(basket)
+        return True
+
+    def release(self, basket, stockrecord, quantity=None):
+        """
+        Give back `quantity` reserved items, or the whole reservation.
+        """
+        with transaction.atomic():
+            reservation = self.select_for_update().filter(basket=basket, stockrecord=stockrecord).first()
+            if reservation is None:
+                return
+            if quantity is None or quantity >= reservation.quantity:
+                quantity = reservation.quantity
+                reservation.delete()
+            else:
+                self.filter(pk=reservation.pk).update(quantity=F('quantity') - quantity)
+            self._deallocate(reservation.stockrecord_id, quantity)
+
+    def reserve_up_to(self, basket, stockrecord, quantity):
+        """
+        Make the reservation of the basket match the line quantity.
+        """
+        delta = quantity - self.reserved_quantity(basket, stockrecord)
+        if delta > 0:
+            return self.reserve(basket, stockrecord, delta)
+        if delta < 0:
+            self.release(basket, stockrecord, -delta)
+        return True
+
+    def merge(self, target, source):
+        """
+        Move the reservations of a merged basket to the basket it was merged
+        into and give back whatever exceeds the merged line quantities.
+        """
+        same_reservation = self.filter(stockrecord=OuterRef('stockrecord'))
+        with transaction.atomic():
+            self.filter(basket=target).filter(Exists(same_reservation.filter(basket=source))).update(
+                quantity=F('quantity') + Subquery(same_reservation.filter(basket=source).values('quantity')[:1]),
+            )
+            self.filter(basket=source).filter(Exists(same_reservation.filter(basket=target))).delete()
+            self.filter(basket=source).update(basket=target)
+
+            line_model = target._meta.get_field('lines').related_model
+            line_quantity = line_model.objects.filter(
+                basket=target, stockrecord=OuterRef('stockrecord'),
+            ).values('stockrecord').annotate(total=Sum('quantity')).values('total')
+            over_reserved = self.filter(basket=target).annotate(
+                line_quantity=Coalesce(Subquery(line_quantity), 0),
+            ).filter(quantity__gt=F('line_quantity'))
+            # a basket holds one reservation per stockrecord
+            excess = Subquery(over_reserved.filter(stockrecord=OuterRef('pk')).values(
+                excess=F('quantity') - F('line_quantity'),
+            )[:1])
+            StockRecord.objects.filter(
+                pk__in=over_reserved.values('stockrecord'),
+                num_allocated__gte=excess,
+            ).update(num_allocated=F('num_allocated') - excess)
+            over_reserved.update(quantity=Coalesce(Subquery(line_quantity), 0))
+            self.filter(basket=target, quantity=0).delete()
+            self.touch(target)
+
+    def release_baskets(self, baskets):
+        """
+        Give back every reservation of the baskets in one UPDATE per
+        statement, eg. before the baskets are deleted, as the cascade
+        would drop them without touching num_allocated.
+        """
+        reservations = self.filter(basket__in=baskets)
+        reserved = Subquery(
+            reservations.filter(stockrecord=OuterRef('pk')).values('stockrecord')
+            .annotate(total=Sum('quantity')).values('total')
+        )
+        with transaction.atomic():
+            StockRecord.objects.filter(
+                pk__in=reservations.values('stockrecord'),
+                num_allocated__gte=reserved,
+            ).update(num_allocated=F('num_allocated') - reserved)
+            reservations.delete()
+
+    def release_expired(self):
+        """
+        Give the stock of expired reservations back. The conditional delete
+        makes sure a reservation that was extended meanwhile is kept, and
+        that each one is released exactly once.
+        """
+        released = 0
+        expired = self.filter(date_expires__lte=now()).values_list('pk', 'stockrecord_id', 'quantity')
+        for pk, stockrecord_id, quantity in list(expired):
+            with transaction.atomic():
+                deleted, __ = self.filter(pk=pk, date_expires__lte=now()).delete()
+                if deleted:
+                    self._deallocate(stockrecord_id, quantity)
+                    released += 1
+        return released
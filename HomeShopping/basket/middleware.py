@@ -1,11 +1,30 @@
+from functools import lru_cache
+
 from django.core.signing import BadSignature, Signer
 from django.db.models import Prefetch
 from django.utils.functional import SimpleLazyObject, empty
 
+from basket import storage
 from basket.models import Basket, BasketLine
 
 from HomeShopping import settings
 
+signer = Signer()
+
+
+@lru_cache(maxsize=settings.MY_BASKET_COOKIE_CACHE_SIZE)
+def sign_basket_id(basket_id):
+    return signer.sign(basket_id)
+
+
+@lru_cache(maxsize=settings.MY_BASKET_COOKIE_CACHE_SIZE)
+def unsign_basket_hash(basket_hash):
+    """
+    Return the basket id of a verified cookie. Only verified cookies are
+    remembered, a bad signature raises BadSignature every time.
+    """
+    return int(signer.unsign(basket_hash))
+
 
 class BasketMiddleware:
     def __init__(self, get_response):
@@ -14,6 +33,7 @@ class BasketMiddleware:
     def __call__(self, request):
         request.cookies_to_delete = []
         request._basket_cache = None
+        request._basket_id_cache = empty
 
         def load_full_basket():
             """
@@ -23,17 +43,22 @@ class BasketMiddleware:
 
             return basket
 
+        def load_basket_id():
+            """
+            Return the id of the basket without loading the basket itself.
+            """
+            return self.get_basket_id(request)
+
         def load_basket_hash():
             """
-            Load the basket and return the basket hash
-            Note that we don't apply offers or check that every line has a
-            stockrecord here.
+            Return the basket hash, which only needs the basket id.
             """
-            basket = self.get_basket(request)
-            if basket.id:
-                return self.get_basket_hash(basket.id)
+            basket_id = self.get_basket_id(request)
+            if basket_id:
+                return self.get_basket_hash(basket_id)
 
         request.basket = SimpleLazyObject(load_full_basket)
+        request.basket_id = SimpleLazyObject(load_basket_id)
         request.basket_hash = SimpleLazyObject(load_basket_hash)
 
         response = self._get_response(request)
@@ -86,11 +111,16 @@ class BasketMiddleware:
         if request._basket_cache is not None:
             return request._basket_cache
 
+        cookie_key = self.get_cookie_key(request)
+        basket = self.get_stored_basket(cookie_key, request)
+        if basket is not None:
+            request._basket_cache = basket
+            return basket
+
         num_baskets_merged = 0
         manager = Basket.open.select_related('owner').prefetch_related(Prefetch(
             'lines', queryset=BasketLine.objects.all().select_related('stockrecord')))
-        cookie_key = self.get_cookie_key(request)
-        cookie_basket = self.get_cookie_basket(cookie_key, request)
+        cookie_basket = self.get_cookie_basket(cookie_key, request, manager)
         if hasattr(request, 'user') and request.user.is_authenticated:
             # Signed-in user: if they have a cookie basket too, it means
             # that they have just signed in and we need to merge their cookie
@@ -125,28 +155,85 @@ class BasketMiddleware:
 
         # Cache basket instance for the during of this request
         request._basket_cache = basket
+        storage.store(basket)
 
         return basket
 
+    def get_basket_id(self, request):
+        """
+        Return the id of the open basket for this request, or None if it
+        has none yet. Unlike get_basket this loads neither the basket nor
+        its lines, unless a cookie basket has to be merged first.
+        """
+        if request._basket_cache is not None:
+            return request._basket_cache.id
+        if request._basket_id_cache is not empty:
+            return request._basket_id_cache
+
+        cookie_key = self.get_cookie_key(request)
+        basket_id = None
+        if hasattr(request, 'user') and request.user.is_authenticated:
+            if cookie_key in request.COOKIES:
+                return self.get_basket(request).id
+            basket = storage.load_for_owner(request.user.pk)
+            if basket is not None:
+                basket_id = basket.pk
+            else:
+                basket_id = Basket.open.filter(owner=request.user).values_list('pk', flat=True).first()
+        elif cookie_key in request.COOKIES:
+            # The signature proves we handed out this id. Whether the basket
+            # is still open is checked against the basket it is compared to.
+            try:
+                basket_id = unsign_basket_hash(request.COOKIES[cookie_key])
+            except (BadSignature, ValueError):
+                basket_id = None
+
+        request._basket_id_cache = basket_id
+        return basket_id
+
+    def get_stored_basket(self, cookie_key, request):
+        """
+        Look the basket up in the basket storage, without touching the
+        database. Returns None when it has to be loaded from the database.
+        """
+        if not storage.enabled():
+            return None
+        if hasattr(request, 'user') and request.user.is_authenticated:
+            if cookie_key in request.COOKIES:
+                # the cookie basket has to be merged
+                return None
+            basket = storage.load_for_owner(request.user.pk)
+            if basket is not None:
+                basket.owner = request.user
+            return basket
+        if cookie_key in request.COOKIES:
+            try:
+                basket_id = unsign_basket_hash(request.COOKIES[cookie_key])
+            except (BadSignature, ValueError):
+                return None
+            basket = storage.load(basket_id)
+            if basket is not None and basket.owner_id is None:
+                return basket
+        return None
+
     def merge_baskets(self, master, slave):
         master.merge(slave, add_quantities=False)
 
-    def get_cookie_basket(self, cookie_key, request):  # manager):
-        # """
-        # Looks for a basket which is referenced by a cookie.
-        # If a cookie key is found with no matching basket, then we add
-        # it to the list to be deleted.
-        # """
+    def get_cookie_basket(self, cookie_key, request, manager):
+        """
+        Looks for a basket which is referenced by a cookie.
+        If a cookie key is found with no matching basket, then we add
+        it to the list to be deleted.
+        """
         basket = None
         if cookie_key in request.COOKIES:
             basket_hash = request.COOKIES[cookie_key]
             try:
-                basket_id = Signer().unsign(basket_hash)
-                basket = Basket.objects.get(pk=basket_id, owner=None,
-                                            status=Basket.OPEN)
-            except (BadSignature, Basket.DoesNotExist):
+                basket_id = unsign_basket_hash(basket_hash)
+                basket = manager.get(pk=basket_id, owner=None)
+            except (BadSignature, ValueError, Basket.DoesNotExist):
                 request.cookies_to_delete.append(cookie_key)
         return basket
 
     def get_basket_hash(self, basket_id):
-        return Signer().sign(basket_id)
+        return sign_basket_id(basket_id)
@@ -0,0 +1,28 @@
+# Generated by Django 4.2 on 2026-10-17 22:35
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0014_stockrecord_num_allocated'),
+        ('basket', '0003_rename_stockrecords_basketline_stockrecord'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField()),
+                ('date_expires', models.DateTimeField(db_index=True)),
+                ('basket', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='basket.basket')),
+                ('stockrecord', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='product.stockrecord')),
+            ],
+            options={
+                'unique_together': {('basket', 'stockrecord')},
+            },
+        ),
+    ]
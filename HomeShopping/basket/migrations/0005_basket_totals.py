@@ -0,0 +1,43 @@
+# Generated by Django 4.2 on 2026-10-17 22:40
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def calculate_totals(apps, schema_editor):
+    Basket = apps.get_model('basket', 'Basket')
+    BasketLine = apps.get_model('basket', 'BasketLine')
+    lines = BasketLine.objects.filter(basket=OuterRef('pk')).values('basket')
+    Basket.objects.update(
+        num_items=Coalesce(Subquery(lines.annotate(n=Sum('quantity')).values('n')), 0),
+        total=Coalesce(
+            Subquery(lines.annotate(
+                t=Sum(F('quantity') * F('stockrecord__price'), output_field=DecimalField()),
+            ).values('t')),
+            Value(Decimal('0.00')),
+            output_field=DecimalField(),
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('basket', '0004_stockreservation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='basket',
+            name='num_items',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='basket',
+            name='total',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12),
+        ),
+        migrations.RunPython(calculate_totals, migrations.RunPython.noop),
+    ]
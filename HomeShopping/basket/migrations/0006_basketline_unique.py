@@ -0,0 +1,36 @@
+# Generated by Django 4.2 on 2026-10-17 22:42
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_lines(apps, schema_editor):
+    """
+    Fold lines that hold the same product and stockrecord into the oldest one,
+    so the unique constraint can be created.
+    """
+    BasketLine = apps.get_model('basket', 'BasketLine')
+    duplicates = BasketLine.objects.values('basket', 'product', 'stockrecord').annotate(
+        lines=Count('id'), first=Min('id'), quantity=Sum('quantity'),
+    ).filter(lines__gt=1)
+    for duplicate in duplicates:
+        lines = BasketLine.objects.filter(
+            basket=duplicate['basket'], product=duplicate['product'], stockrecord=duplicate['stockrecord'],
+        )
+        lines.filter(id=duplicate['first']).update(quantity=duplicate['quantity'])
+        lines.exclude(id=duplicate['first']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('basket', '0005_basket_totals'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_lines, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='basketline',
+            constraint=models.UniqueConstraint(fields=('basket', 'product', 'stockrecord'), name='unique_basket_product_stockrecord'),
+        ),
+    ]
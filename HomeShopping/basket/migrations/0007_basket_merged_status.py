@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-17 22:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('basket', '0006_basketline_unique'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='basket',
+            name='status',
+            field=models.CharField(choices=[('Open', 'Open - currently active'), ('Merged', 'Merged - superceded by another basket'), ('Frozen', 'Frozen - the basket cannot be modified'), ('Submitted', 'Submitted - has been ordered at the checkout')], default='Open', max_length=128),
+        ),
+    ]
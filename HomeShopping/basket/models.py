@@ -2,10 +2,13 @@ from decimal import Decimal
 
 from django.contrib.auth.models import User
 from django.core.exceptions import ObjectDoesNotExist, PermissionDenied
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Exists, F, OuterRef, Subquery
+from django.db.models.functions import Greatest
 from django.utils.timezone import now
 
-from basket.managers import OpenBasketManager
+from basket import storage
+from basket.managers import BasketLineManager, BasketQuerySet, OpenBasketManager, StockReservationManager
 
 
 class Basket(models.Model):
@@ -15,6 +18,7 @@ class Basket(models.Model):
         "Open", "Merged", "Saved", "Frozen", "Submitted")
     STATUS_CHOICES = (
         (OPEN, "Open - currently active"),
+        (MERGED, "Merged - superceded by another basket"),
         (FROZEN, "Frozen - the basket cannot be modified"),
         (SUBMITTED, "Submitted - has been ordered at the checkout"),
     )
@@ -25,11 +29,16 @@ class Basket(models.Model):
     )
     editable_statuses = (OPEN,)
 
-    objects = models.Manager()
+    objects = BasketQuerySet.as_manager()
     open = OpenBasketManager()
 
     date_submitted = models.DateTimeField(null=True, blank=True)
 
+    # Kept up to date by the lines with F() updates, so reading them is O(1).
+    # Only ever write them through adjust_totals or recalculate_totals.
+    num_items = models.PositiveIntegerField(default=0)
+    total = models.DecimalField(decimal_places=2, max_digits=12, default=Decimal('0.00'))
+
     def __str__(self):
         return f'{self.status}s basket {self.pk}'
 
@@ -38,14 +47,14 @@ class Basket(models.Model):
         Freezes the basket so it cannot be modified.
         """
         self.status = self.FROZEN
-        self.save()
+        self.save(update_fields=('status',))
 
     def thaw(self):
         """
         Unfreezes a basket so it can be modified again
         """
         self.status = self.OPEN
-        self.save()
+        self.save(update_fields=('status',))
 
     def submit(self):
         """
@@ -53,41 +62,44 @@ class Basket(models.Model):
         """
         self.status = self.SUBMITTED
         self.date_submitted = now()
-        self.save()
+        self.save(update_fields=('status', 'date_submitted'))
 
     def add_product(self, product, stockrecord, quantity=1):
         if not self.id:
             self.save()
-        defaults = {
-            'quantity': quantity,
-        }
-        line, created = self.lines.get_or_create(product=product, stockrecord=stockrecord, defaults=defaults)
-        if not created:
-            line.quantity = max(0, line.quantity + quantity)
-            line.save()
-        return line, created
-
-    def merge_line(self, line, add_quantities):
-        try:
-            existing_line = self.lines.get(product=line.product, stockrecord=line.stockrecord)
-        except ObjectDoesNotExist:
-            line.basket = self
-            line.save()
-        else:
+        if not self.can_be_edited:
+            raise PermissionDenied("You cannot modify a %s basket" % (self.status.lower(),))
+        return BasketLine.objects.add_quantity(self, product, stockrecord, quantity)
+
+    def merge(self, basket, add_quantities=True):
+        """
+        Merge all lines of another basket into this one with a fixed number of
+        set-based statements, however many lines it holds. Lines both baskets
+        have get the summed or the highest quantity, the other lines are moved.
+        """
+        same_line = BasketLine.objects.filter(product=OuterRef('product'), stockrecord=OuterRef('stockrecord'))
+        source_lines = BasketLine.objects.filter(basket=basket)
+        source_quantity = Subquery(same_line.filter(basket=basket).values('quantity')[:1])
+
+        with transaction.atomic():
+            conflicting_lines = BasketLine.objects.filter(basket=self).filter(Exists(same_line.filter(basket=basket)))
             if add_quantities:
-                existing_line.quantity += line.quantity
+                conflicting_lines.update(quantity=F('quantity') + source_quantity)
             else:
-                existing_line.quantity = max(existing_line.quantity, line.quantity)
-            existing_line.save()
-            line.delete()
-        finally:
-            self._lines = None
+                conflicting_lines.update(quantity=Greatest(F('quantity'), source_quantity))
+            source_lines.filter(Exists(same_line.filter(basket=self))).delete()
+            source_lines.update(basket=self)
 
-    def merge(self, basket, add_quantities=True):
-        for line_to_merge in basket.lines.all():
-            self.merge_line(line_to_merge, add_quantities)
+            StockReservation.objects.merge(self, basket)
+            Basket.objects.filter(pk__in=(self.pk, basket.pk)).recalculate_totals()
+            basket.status = self.MERGED
+            basket.save(update_fields=('status',))
 
-        basket.save()
+        self.refresh_from_db(fields=('num_items', 'total'))
+        basket.refresh_from_db(fields=('num_items', 'total'))
+        for merged in (self, basket):
+            merged._lines = None
+            getattr(merged, '_prefetched_objects_cache', {}).pop('lines', None)
 
     def current_quantity(self, product, stockrecord):
         try:
@@ -95,23 +107,22 @@ class Basket(models.Model):
         except ObjectDoesNotExist:
             return 0
 
-    def num_items(self):
-        return sum(line.quantity for line in self.lines.all())
-
-    def _total_price(self, property):
-        total = Decimal('0.00')
-        for line in self.lines.all():
-            try:
-                total += int(getattr(line, property))
-            except ObjectDoesNotExist:
-                # Handle situation where the product may have been deleted
-                pass
-        return total
+    def adjust_totals(self, num_items, total):
+        """
+        Add the difference a line change made to the stored totals.
+        """
+        Basket.objects.filter(pk=self.pk).update(
+            num_items=F('num_items') + num_items,
+            total=F('total') + total,
+        )
+        storage.evict_on_commit([self.pk])
+        self.num_items += num_items
+        self.total += total
 
     @property
     def total_price(self):
         if self.pk:
-            return self._total_price('line_price')
+            return self.total
 
     @property
     def is_submitted(self):
@@ -139,17 +150,94 @@ class BasketLine(models.Model):
     quantity = models.PositiveIntegerField(default=1)
     product = models.ForeignKey('product.Product', on_delete=models.CASCADE, related_name='basket_lines')
 
+    objects = BasketLineManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=('basket', 'product', 'stockrecord'),
+                name='unique_basket_product_stockrecord',
+            ),
+        ]
+
+    _original_basket_id = None
+    _original_quantity = 0
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        line = super().from_db(db, field_names, values)
+        # remember what is accounted for in the basket totals
+        line._original_basket_id = line.basket_id
+        line._original_quantity = line.quantity
+        return line
+
     def save(self, *args, **kwargs):
         if not self.basket.can_be_edited:
             raise PermissionDenied(
                 "You cannot modify a %s basket" % (
                     self.basket.status.lower(),))
-        return super().save(*args, **kwargs)
+        super().save(*args, **kwargs)
+        self.update_basket_totals()
+
+    def delete(self, *args, **kwargs):
+        deleted = super().delete(*args, **kwargs)
+        self.quantity = 0
+        self.update_basket_totals()
+        return deleted
+
+    def update_basket_totals(self):
+        added = self.quantity
+        if self._original_basket_id == self.basket_id:
+            added -= self._original_quantity
+        elif self._original_basket_id is not None:
+            # the line was moved to another basket
+            Basket.objects.filter(pk=self._original_basket_id).update(
+                num_items=F('num_items') - self._original_quantity,
+                total=F('total') - self._original_quantity * self.unit_price,
+            )
+            storage.evict_on_commit([self._original_basket_id])
+        if added:
+            self.basket.adjust_totals(added, added * self.unit_price)
+        self._original_basket_id = self.basket_id
+        self._original_quantity = self.quantity
+
+    @property
+    def unit_price(self):
+        return Decimal(str(self.stockrecord.price))
 
     @property
     def line_price(self):
-        return self.quantity * self.stockrecord.price
+        return self.quantity * self.unit_price
 
     @property
     def available_quantity(self):
         return self.stockrecord.num_in_stock
+
+
+class StockReservation(models.Model):
+    """
+    Stock held for a basket line until the basket is checked out or the
+    reservation expires. Every reservation is mirrored in
+    StockRecord.num_allocated, which is only ever changed with conditional
+    UPDATEs so concurrent baskets can't reserve more than is in stock.
+    """
+    basket = models.ForeignKey(
+        'Basket',
+        on_delete=models.CASCADE,
+        related_name='reservations',
+    )
+    stockrecord = models.ForeignKey(
+        'product.StockRecord',
+        on_delete=models.CASCADE,
+        related_name='reservations',
+    )
+    quantity = models.PositiveIntegerField()
+    date_expires = models.DateTimeField(db_index=True)
+
+    objects = StockReservationManager()
+
+    class Meta:
+        unique_together = ('basket', 'stockrecord')
+
+    def __str__(self):
+        return '%s x %s for basket %s' % (self.quantity, self.stockrecord_id, self.basket_id)
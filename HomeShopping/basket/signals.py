@@ -0,0 +1,55 @@
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from basket import storage
+from basket.models import Basket, BasketLine, StockReservation
+from product.models import Product, StockRecord
+
+
+@receiver(post_save, sender=StockRecord)
+def stockrecord_saved(sender, instance, created, **kwargs):
+    """
+    The stored basket totals are priced, so open baskets holding a
+    stockrecord are recalculated when it changes.
+    """
+    if created:
+        return
+    Basket.objects.holding_stockrecords([instance.pk]).recalculate_totals()
+
+
+@receiver(pre_delete, sender=StockRecord)
+@receiver(pre_delete, sender=Product)
+def line_holder_deleting(sender, instance, **kwargs):
+    """
+    Deleting a stockrecord or a product cascades to the basket lines
+    without BasketLine.delete updating the totals, so the open baskets
+    holding them are noted here and recalculated once the lines are gone.
+    """
+    lines = BasketLine.objects.filter(**{sender._meta.model_name: instance})
+    instance._basket_ids = list(Basket.objects.filter(
+        status__in=Basket.editable_statuses,
+        pk__in=lines.values('basket'),
+    ).values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=StockRecord)
+@receiver(post_delete, sender=Product)
+def line_holder_deleted(sender, instance, **kwargs):
+    basket_ids = getattr(instance, '_basket_ids', None)
+    if basket_ids:
+        Basket.objects.filter(pk__in=basket_ids).recalculate_totals()
+
+
+@receiver(pre_delete, sender=Basket)
+def basket_deleted(sender, instance, **kwargs):
+    """
+    The reservations of a deleted basket would be cascade deleted with
+    num_allocated still counting them.
+    """
+    StockReservation.objects.release_baskets([instance.pk])
+
+
+@receiver(post_save, sender=Basket)
+@receiver(post_delete, sender=Basket)
+def basket_changed(sender, instance, **kwargs):
+    storage.evict_on_commit([instance.pk])
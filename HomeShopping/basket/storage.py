@@ -0,0 +1,99 @@
+"""
+Hot copy of the open baskets in the cache (Redis in production), so that
+resolving request.basket doesn't need the database.
+
+Enabled with MY_BASKET_STORAGE = 'cache'. This is a read-through copy, not
+a write-behind store: the database stays the source of truth and is written
+synchronously, as lines and stock reservations have to change in one
+transaction. Every change of a basket replaces its copy with a marker once
+committed, and copies are only ever added where no value or marker is left,
+so a request that read the basket before the change can't store its stale
+copy again. Until the marker expires after MY_BASKET_STORAGE_EVICTED_TIMEOUT
+the basket is read from the database.
+
+Lookups send the `looked_up` signal with whether the copy was found.
+"""
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import transaction
+from django.dispatch import Signal
+
+from HomeShopping import settings
+
+
+looked_up = Signal()
+
+EVICTED = 'evicted'
+
+
+def enabled():
+    return settings.MY_BASKET_STORAGE == 'cache'
+
+
+def _basket_key(pk):
+    return 'basket:%s' % pk
+
+
+def _owner_key(owner_id):
+    return 'basket:owner:%s' % owner_id
+
+
+def store(basket):
+    """
+    Keep the columns of an open basket, the lines are loaded on demand.
+    """
+    if not enabled() or not basket.pk or not basket.can_be_edited:
+        return
+    values = (basket.owner_id, basket.status, basket.num_items, str(basket.total))
+    if not cache.add(_basket_key(basket.pk), values, settings.MY_BASKET_STORAGE_TIMEOUT):
+        return
+    if basket.owner_id:
+        cache.set(_owner_key(basket.owner_id), basket.pk, settings.MY_BASKET_STORAGE_TIMEOUT)
+
+
+def load(pk):
+    from basket.models import Basket
+
+    if not enabled():
+        return None
+    values = cache.get(_basket_key(pk))
+    if values == EVICTED:
+        values = None
+    looked_up.send(sender=None, hit=values is not None)
+    if values is None:
+        return None
+    owner_id, status, num_items, total = values
+    basket = Basket(pk=int(pk), owner_id=owner_id, status=status, num_items=num_items, total=Decimal(total))
+    basket._state.adding = False
+    basket._state.db = 'default'
+    return basket
+
+
+def load_for_owner(owner_id):
+    if not enabled():
+        return None
+    pk = cache.get(_owner_key(owner_id))
+    looked_up.send(sender=None, hit=pk is not None)
+    if pk is None:
+        return None
+    basket = load(pk)
+    if basket is None or basket.owner_id != owner_id:
+        return None
+    return basket
+
+
+def evict(pks):
+    cache.set_many(dict.fromkeys([_basket_key(pk) for pk in pks], EVICTED), settings.MY_BASKET_STORAGE_EVICTED_TIMEOUT)
+
+
+def evict_on_commit(pks):
+    """
+    Evict only once the change is visible, otherwise a concurrent request
+    could store the old row again.
+    """
+    if not enabled():
+        return
+    pks = [pk for pk in pks if pk is not None]
+    if pks:
+        transaction.on_commit(lambda: evict(pks))
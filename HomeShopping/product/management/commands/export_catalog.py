@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from api.exporter import EXPORTERS, export_catalog
+
+
+class Command(BaseCommand):
+    help = "Export the products, attribute values and stockrecords as an NDJSON or CSV feed"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--format',
+            choices=sorted(EXPORTERS),
+            default='ndjson',
+            help="The format of the feed",
+        )
+        parser.add_argument(
+            '--output',
+            help="The file to write, by default stdout",
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=500,
+            help="Number of products read per query",
+        )
+
+    def handle(self, *args, **options):
+        lines = export_catalog(options['format'], chunk_size=options['chunk_size'])
+        if not options['output']:
+            for line in lines:
+                self.stdout.write(line, ending='')
+            return
+        with open(options['output'], 'w', encoding='utf-8', newline='') as output:
+            output.writelines(lines)
@@ -0,0 +1,69 @@
+import argparse
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.generator import PASSWORD, DataGenerator, parse_range
+
+
+def distribution(value):
+    try:
+        return parse_range(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected N or MIN-MAX, not %s" % value)
+
+
+class Command(BaseCommand):
+    help = "Generate a synthetic catalog with users, open baskets and past orders, reproducible from a seed"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0, help="The same seed generates the same data")
+        parser.add_argument('--products', type=int, default=1000, help="Number of parent and standalone products")
+        parser.add_argument('--parent-ratio', type=float, default=0.3, help="Share of the products being parents")
+        parser.add_argument('--children-per-parent', type=distribution, default=(1, 8), metavar='N|MIN-MAX')
+        parser.add_argument('--stockrecords-per-product', type=distribution, default=(1, 3), metavar='N|MIN-MAX')
+        parser.add_argument('--categories', type=int, default=20)
+        parser.add_argument('--product-classes', type=int, default=10)
+        parser.add_argument('--attributes-per-class', type=distribution, default=(5, 30), metavar='N|MIN-MAX')
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--baskets', type=int, default=500, help="Number of open baskets")
+        parser.add_argument('--lines-per-basket', type=distribution, default=(1, 5), metavar='N|MIN-MAX')
+        parser.add_argument('--orders', type=int, default=5000)
+        parser.add_argument('--lines-per-order', type=distribution, default=(1, 10), metavar='N|MIN-MAX')
+        parser.add_argument('--guest-ratio', type=float, default=0.2, help="Share of the orders placed by guests")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Number of rows inserted per query")
+        parser.add_argument(
+            '--no-index',
+            action='store_false',
+            dest='index',
+            help="Leave the search index alone, rebuild it later with rebuild_search_index",
+        )
+
+    def handle(self, *args, **options):
+        generator = DataGenerator(
+            options['seed'],
+            batch_size=options['batch_size'],
+            index=options['index'],
+            log=self.stdout.write,
+        )
+        if generator.exists():
+            raise CommandError("Seed %s was generated already, use another one" % options['seed'])
+        if options['product_classes'] < 1:
+            raise CommandError("At least one product class is needed")
+
+        generator.generate_catalog(
+            categories=options['categories'],
+            product_classes=options['product_classes'],
+            attributes_per_class=options['attributes_per_class'],
+            products=options['products'],
+            parent_ratio=options['parent_ratio'],
+            children_per_parent=options['children_per_parent'],
+            stockrecords_per_product=options['stockrecords_per_product'],
+        )
+        generator.generate_users(options['users'])
+        generator.generate_orders(options['orders'], options['lines_per_order'], options['guest_ratio'])
+        generator.generate_baskets(options['baskets'], options['lines_per_basket'])
+        self.stdout.write(self.style.SUCCESS(
+            "Generated seed %s, the users log in as %s_user_<n> with password %s" % (
+                options['seed'], generator.prefix, PASSWORD,
+            ),
+        ))
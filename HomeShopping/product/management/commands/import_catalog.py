@@ -0,0 +1,53 @@
+import os
+import sys
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from api.importer import READERS, import_catalog
+
+
+class Command(BaseCommand):
+    help = "Import products, attribute values and stockrecords from an NDJSON or CSV feed"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="The feed to import, - for stdin")
+        parser.add_argument(
+            '--format',
+            choices=sorted(READERS),
+            help="The format of the feed, by default its extension",
+        )
+        parser.add_argument(
+            '--owner',
+            required=True,
+            help="Username of the owner of the new stockrecords",
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=500,
+            help="Number of records written per transaction",
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        feed_format = options['format'] or os.path.splitext(path)[1].lstrip('.').lower()
+        if feed_format not in READERS:
+            raise CommandError("Unknown format of %s, pass --format" % path)
+        try:
+            owner = User.objects.get(username=options['owner'])
+        except User.DoesNotExist:
+            raise CommandError("No user %s" % options['owner'])
+
+        if path == '-':
+            result = import_catalog(sys.stdin, feed_format, owner, chunk_size=options['chunk_size'])
+        else:
+            with open(path, encoding='utf-8', newline='') as lines:
+                result = import_catalog(lines, feed_format, owner, chunk_size=options['chunk_size'])
+
+        for error in result.errors:
+            self.stderr.write("Line %(line)s: %(message)s" % error)
+        style = self.style.WARNING if result.failed else self.style.SUCCESS
+        self.stdout.write(style(
+            "Created %s, updated %s, failed %s products" % (result.created, result.updated, result.failed),
+        ))
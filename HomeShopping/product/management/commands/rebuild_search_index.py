@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from product.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = "Build the product search index from scratch"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help="Number of products indexed per query",
+        )
+
+    def handle(self, *args, **options):
+        indexed = rebuild_index(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS("Indexed %s products" % indexed))
@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-17 22:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0013_stockrecord_owner'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stockrecord',
+            name='num_allocated',
+            field=models.PositiveIntegerField(default=0, verbose_name='Number allocated'),
+        ),
+    ]
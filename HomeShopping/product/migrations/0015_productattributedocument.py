@@ -0,0 +1,39 @@
+# Generated by Django 4.2 on 2026-10-17 22:57
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def build_documents(apps, schema_editor):
+    Product = apps.get_model('product', 'Product')
+    ProductAttributeValue = apps.get_model('product', 'ProductAttributeValue')
+    ProductAttributeDocument = apps.get_model('product', 'ProductAttributeDocument')
+    documents = {pk: [] for pk in Product.objects.values_list('pk', flat=True)}
+    for value in ProductAttributeValue.objects.select_related('attribute').order_by('pk').iterator():
+        documents[value.product_id].append({
+            'name': value.attribute.name,
+            'code': value.attribute.code,
+            'value': getattr(value, 'value_%s' % value.attribute.type),
+        })
+    ProductAttributeDocument.objects.bulk_create(
+        [ProductAttributeDocument(product_id=pk, attributes=attributes) for pk, attributes in documents.items()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0014_stockrecord_num_allocated'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductAttributeDocument',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='attribute_document', serialize=False, to='product.product')),
+                ('attributes', models.JSONField(default=list)),
+            ],
+        ),
+        migrations.RunPython(build_documents, migrations.RunPython.noop),
+    ]
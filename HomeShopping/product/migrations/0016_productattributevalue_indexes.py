@@ -0,0 +1,21 @@
+# Generated by Django 4.2 on 2026-10-17 23:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0015_productattributedocument'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='productattributevalue',
+            index=models.Index(fields=['attribute', 'value_integer'], name='product_pav_attribute_integer'),
+        ),
+        migrations.AddIndex(
+            model_name='productattributevalue',
+            index=models.Index(fields=['attribute', 'value_text'], name='product_pav_attribute_text'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+from django.db import migrations
+
+
+def build_index(apps, schema_editor):
+    from product.search import product_terms
+
+    Product = apps.get_model('product', 'Product')
+    ProductSearchTerm = apps.get_model('product', 'ProductSearchTerm')
+    products = Product.objects.select_related('category', 'parent__category', 'attribute_document').order_by('pk')
+    terms = []
+    for product in products.iterator(chunk_size=500):
+        terms.extend(
+            ProductSearchTerm(term=term, product_id=product.pk, weight=weight)
+            for term, weight in product_terms(product).items()
+        )
+        if len(terms) >= 1000:
+            ProductSearchTerm.objects.bulk_create(terms)
+            terms = []
+    ProductSearchTerm.objects.bulk_create(terms)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0017_productsearchterm'),
+    ]
+
+    operations = [
+        migrations.RunPython(build_index, migrations.RunPython.noop),
+    ]
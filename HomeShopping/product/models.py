@@ -46,6 +46,15 @@ class Product(models.Model):
     def __str__(self):
         return self.title
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # the cached pages of the structure and parent it was loaded with
+        # are evicted too when it moves, see api/signals.py
+        instance._loaded_structure = instance.__dict__.get('structure')
+        instance._loaded_parent_id = instance.__dict__.get('parent_id')
+        return instance
+
     def clean(self):
         getattr(self, '_clean_%s' % self.structure)()
 
@@ -230,6 +239,11 @@ class ProductAttributeValue(models.Model):
 
     class Meta:
         unique_together = ('attribute', 'product')
+        # the attribute filters of the product list seek on these
+        indexes = [
+            models.Index(fields=('attribute', 'value_integer'), name='product_pav_attribute_integer'),
+            models.Index(fields=('attribute', 'value_text'), name='product_pav_attribute_text'),
+        ]
 
     def __str__(self):
         return self.summary()
@@ -252,6 +266,71 @@ class ProductAttributeValue(models.Model):
         return getattr(self, property_name, self.value)
 
 
+class ProductAttributeDocumentManager(models.Manager):
+
+    def build(self, product_ids):
+        documents = {pk: [] for pk in product_ids}
+        values = ProductAttributeValue.objects.filter(
+            product_id__in=documents,
+        ).select_related('attribute').order_by('pk')
+        for value in values:
+            documents[value.product_id].append({
+                'name': value.attribute.name,
+                'code': value.attribute.code,
+                'value': value.value,
+            })
+        return documents
+
+    def refresh(self, product_ids):
+        """
+        Rebuild the documents of these products with one query for the
+        values and one upsert.
+        """
+        documents = self.build(set(product_ids))
+        self.bulk_create(
+            [self.model(product_id=pk, attributes=attributes) for pk, attributes in documents.items()],
+            update_conflicts=True,
+            unique_fields=('product',),
+            update_fields=('attributes',),
+        )
+
+
+class ProductAttributeDocument(models.Model):
+    """
+    The attribute values of a product flattened into one JSON column, so the
+    catalog can render them without joining values and attributes.
+    Kept up to date by the signals in product/signals.py.
+    """
+    product = models.OneToOneField(
+        'product',
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='attribute_document',
+    )
+    attributes = models.JSONField(default=list)
+
+    objects = ProductAttributeDocumentManager()
+
+    def __str__(self):
+        return str(self.product_id)
+
+
+class ProductSearchTerm(models.Model):
+    """
+    One entry of the inverted search index: how much a term weighs in a
+    product. Built by product/search.py.
+    """
+    term = models.CharField(max_length=64)
+    product = models.ForeignKey('product', on_delete=models.CASCADE, related_name='search_terms')
+    weight = models.PositiveIntegerField()
+
+    class Meta:
+        unique_together = ('term', 'product')
+
+    def __str__(self):
+        return '%s: %s' % (self.term, self.product_id)
+
+
 class StockRecord(models.Model):
     product = models.ForeignKey(
         'product',
@@ -269,6 +348,9 @@ class StockRecord(models.Model):
     num_in_stock = models.PositiveIntegerField(
         "Number in stock", blank=True, null=True)
 
+    # The amount of stock held by open baskets, see basket.StockReservation
+    num_allocated = models.PositiveIntegerField("Number allocated", default=0)
+
     low_stock_threshold = models.PositiveIntegerField(
         "Low Stock Threshold", blank=True, null=True)
 
@@ -289,6 +371,9 @@ class StockRecord(models.Model):
 
     @property
     def net_stock_level(self):
+        """
+        The stock that is not reserved by any basket yet
+        """
         if self.num_in_stock is None:
             return 0
-        return self.num_in_stock
+        return max(0, self.num_in_stock - self.num_allocated)
@@ -0,0 +1,112 @@
+"""
+Full-text product search over an inverted index kept in the database:
+ProductSearchTerm holds how much every term weighs in every product.
+
+The index is updated for single products by the signals in
+product/signals.py and rebuilt for the whole catalog by rebuild_index,
+which the rebuild_search_index command and celery task run.
+"""
+import re
+from collections import Counter
+
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery, Sum
+
+from product.models import Product, ProductSearchTerm
+
+
+TOKEN = re.compile(r'[^\W_]+')
+MAX_TERM_LENGTH = ProductSearchTerm._meta.get_field('term').max_length
+# how much a term counts for a product, by the field it was found in
+FIELD_WEIGHTS = (
+    ('title', 5),
+    ('article', 4),
+    ('category', 3),
+    ('attributes', 2),
+    ('description', 1),
+)
+
+
+def tokenize(text):
+    return [token for token in TOKEN.findall(text.lower()) if len(token) <= MAX_TERM_LENGTH]
+
+
+def product_fields(product):
+    """
+    The searchable text of a product. Child products are found by the
+    category of their parent, and by its title when they have none.
+    """
+    parent = product.parent if product.parent_id else None
+    category = product.category or (parent.category if parent else None)
+    # no model methods, the migrations index the historical models
+    try:
+        attributes = product.attribute_document.attributes
+    except ObjectDoesNotExist:
+        attributes = []
+    return {
+        'title': product.title or (parent.title if parent else ''),
+        'article': product.article,
+        'category': category.title if category else '',
+        'attributes': ' '.join(attribute['value'] for attribute in attributes if isinstance(attribute['value'], str)),
+        'description': product.description,
+    }
+
+
+def product_terms(product):
+    weights = Counter()
+    fields = product_fields(product)
+    for field, weight in FIELD_WEIGHTS:
+        for token in tokenize(fields[field]):
+            weights[token] += weight
+    return weights
+
+
+def index_products(product_ids):
+    """
+    Replace the index entries of these products.
+    """
+    product_ids = list(product_ids)
+    products = Product.objects.filter(pk__in=product_ids).select_related(
+        'category', 'parent__category', 'attribute_document',
+    )
+    terms = [
+        ProductSearchTerm(term=term, product_id=product.pk, weight=weight)
+        for product in products
+        for term, weight in product_terms(product).items()
+    ]
+    with transaction.atomic():
+        ProductSearchTerm.objects.filter(product_id__in=product_ids).delete()
+        ProductSearchTerm.objects.bulk_create(terms, batch_size=1000)
+
+
+def rebuild_index(batch_size=500):
+    """
+    Index the whole catalog, `batch_size` products at a time. The entries
+    are replaced batch by batch, so searches keep finding the products
+    that aren't reindexed yet. Entries of deleted products are cascade
+    deleted with them.
+    Returns the number of products indexed.
+    """
+    product_ids = list(Product.objects.order_by('pk').values_list('pk', flat=True))
+    for start in range(0, len(product_ids), batch_size):
+        index_products(product_ids[start:start + batch_size])
+    return len(product_ids)
+
+
+def search(queryset, query):
+    """
+    The products of the queryset that contain every term of the query,
+    best matches first.
+    """
+    terms = set(tokenize(query))
+    if not terms:
+        return queryset.none()
+    matches = ProductSearchTerm.objects.filter(term__in=terms).values('product_id').annotate(
+        score=Sum('weight'),
+        matched=Count('term'),
+    ).filter(matched=len(terms))
+    score = Subquery(matches.filter(product_id=OuterRef('pk')).values('score'))
+    return queryset.filter(pk__in=matches.values('product_id')).annotate(
+        search_score=score,
+    ).order_by('-search_score', 'pk')
@@ -0,0 +1,90 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from product.models import Product, ProductAttribute, ProductAttributeDocument, ProductAttributeValue, \
+    ProductCategory
+from product.search import index_products
+
+
+class PendingRefresh:
+    """
+    The products a transaction changed, their attribute documents are rebuilt
+    and their search entries replaced once it commits, with one query each
+    however many times the transaction wrote them.
+    """
+
+    def __init__(self):
+        self.documents = set()
+        self.index = set()
+
+    def __call__(self):
+        if self.documents:
+            # leaving out the products the transaction deleted afterwards
+            ProductAttributeDocument.objects.refresh(
+                Product.objects.filter(pk__in=self.documents).values_list('pk', flat=True),
+            )
+        index_products(self.documents | self.index)
+
+
+def refresh_on_commit(documents=(), index=()):
+    """
+    Add the products to the refresh pending on the connection. Every call
+    registers flush_pending_refresh, the first one to run after the commit
+    does the refresh and the others find nothing left to do. That way it
+    still runs when the savepoint of an earlier call was rolled back, at
+    worst refreshing products that didn't change.
+    """
+    connection = transaction.get_connection()
+    pending = getattr(connection, 'pending_product_refresh', None)
+    if pending is None:
+        pending = connection.pending_product_refresh = PendingRefresh()
+    pending.documents.update(documents)
+    pending.index.update(index)
+    # outside of a transaction this runs right away
+    transaction.on_commit(flush_pending_refresh)
+
+
+def flush_pending_refresh():
+    connection = transaction.get_connection()
+    pending = getattr(connection, 'pending_product_refresh', None)
+    if pending is not None:
+        connection.pending_product_refresh = None
+        pending()
+
+
+@receiver(post_save, sender=ProductAttributeValue)
+@receiver(post_delete, sender=ProductAttributeValue)
+def attribute_value_changed(sender, instance, origin=None, **kwargs):
+    if isinstance(origin, Product) or getattr(origin, 'model', None) is Product:
+        # the document is deleted together with the product
+        return
+    refresh_on_commit(documents=[instance.product_id])
+
+
+@receiver(post_save, sender=ProductAttribute)
+def attribute_changed(sender, instance, created, **kwargs):
+    """
+    The documents embed the attribute name and code.
+    """
+    if created:
+        return
+    ProductAttributeDocument.objects.refresh(
+        ProductAttributeValue.objects.filter(attribute=instance).values_list('product_id', flat=True),
+    )
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, **kwargs):
+    # children are found by the title and category of their parent
+    refresh_on_commit(index=[instance.pk, *instance.children.values_list('pk', flat=True)])
+
+
+@receiver(post_save, sender=ProductCategory)
+def category_saved(sender, instance, created, **kwargs):
+    if created:
+        return
+    products = Product.objects.filter(category=instance)
+    refresh_on_commit(index=products.values_list('pk', flat=True).union(
+        Product.objects.filter(parent__in=products).values_list('pk', flat=True),
+    ))